@@ -0,0 +1,254 @@
+"""
+Offline processing of recorded footage, as fast as the hardware allows.
+
+    python batch.py sample_traffic.mp4 --out results/
+    python batch.py flight.mp4 --out results/ --workers 4 --chunk-seconds 120
+
+A reader thread decodes frames into a bounded queue while the main thread
+runs VehicleDetector.process_frame with the frame's video time (no sleeps,
+no wall clock). With --workers > 1 the file is split into chunks processed
+by a process pool; each chunk first replays `--overlap-seconds` of the
+previous chunk (output discarded) so tracks, traffic-light votes and
+learned associations are warm when its own frames start.
+
+With --camera-id, workers start from that camera's learned traffic-light
+associations but only read them; what they learn is merged into the
+camera's store once, after all chunks are done, dated at merge time (not
+video time).
+
+Outputs: violations.jsonl (one violation per line, with frame index and
+video time) and annotated.mp4.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from clock import VideoClock
+from streamer import VideoStreamer
+
+class FrameReader:
+    """
+    Decodes frames [start, end) on a dedicated thread into a bounded queue.
+    Offline nothing may be dropped, so the reader blocks when the queue is full.
+    Iterating yields (frame_index, timestamp, frame), timestamp from a
+    VideoClock: start_epoch + frame_index / fps.
+    """
+    def __init__(self, path, start=0, end=None, max_queue=16, start_epoch=0.0):
+        self.streamer = VideoStreamer(path, loop=False)
+        self.fps = self.streamer.fps
+        self.clock = VideoClock(self.fps, start_epoch)
+        self.start = start
+        self.end = end
+        self.frames = queue.Queue(maxsize=max_queue)
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, name="batch-reader", daemon=True)
+
+    def _read_loop(self):
+        index = self.start
+        if self.start:
+            self.streamer.seek(self.start)
+        try:
+            while self.running and (self.end is None or index < self.end):
+                frame = self.streamer.get_frame()
+                if frame is None:
+                    break
+                self.frames.put((index, self.clock.timestamp(frame_index=index), frame))
+                index += 1
+        finally:
+            self.frames.put(None)
+
+    def __iter__(self):
+        self.thread.start()
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            yield item
+
+    def close(self):
+        self.running = False
+        # Unblock a reader waiting on a full queue
+        while self.thread.is_alive():
+            try:
+                self.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.streamer.release()
+
+def plan_chunks(total_frames, chunk_frames, overlap_frames):
+    """
+    Splits [0, total_frames) into consecutive chunks.
+    Returns [(warmup_start, start, end)]: frames [warmup_start, start) are
+    processed only to warm up state, [start, end) are the chunk's output.
+    """
+    if total_frames <= 0 or chunk_frames <= 0 or chunk_frames >= total_frames:
+        return [(0, 0, total_frames if total_frames > 0 else None)]
+    chunks = []
+    for start in range(0, total_frames, chunk_frames):
+        end = min(start + chunk_frames, total_frames)
+        chunks.append((max(0, start - overlap_frames), start, end))
+    return chunks
+
+def create_detector(camera_id=None, detect_interval=1, backend=None):
+    from detector import VehicleDetector
+    # Fixed interval: offline results must not depend on how fast this machine is.
+    # Read-only heatmaps: workers run concurrently, their stops are merged by run()
+    return VehicleDetector(camera_id=camera_id, detect_interval=detect_interval, backend=backend,
+                           heatmaps_read_only=True)
+
+def process_range(path, warmup_start, start, end, video_path, start_epoch, camera_id=None,
+                  detect_interval=1, backend=None, detector_factory=create_detector):
+    """
+    Runs the detector over frames [warmup_start, end) of path, writing the
+    annotated frames of [start, end) to video_path.
+    Returns (violations, frames_written, learned_stops), the latter None without camera_id.
+    """
+    detector = detector_factory(camera_id, detect_interval, backend)
+    reader = FrameReader(path, warmup_start, end, start_epoch=start_epoch)
+    writer = None
+    violations = []
+    written = 0
+    learned = None
+    timestamp = start_epoch
+    try:
+        for index, timestamp, frame in reader:
+            if index == start and warmup_start < start:
+                # The previous chunk reports the warm-up frames' stops
+                detector.tl_logic.reset_learned()
+            annotated, frame_violations = detector.process_frame(frame, timestamp=timestamp)
+            if index < start:
+                continue # Warm-up only
+            if writer is None:
+                h, w = annotated.shape[:2]
+                writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), reader.fps, (w, h))
+            writer.write(annotated)
+            written += 1
+            for v in frame_violations:
+                violations.append(dict(v, frame=index, video_time=round(timestamp - start_epoch, 3)))
+        if camera_id is not None:
+            learned = detector.tl_logic.learned_stops(timestamp)
+    finally:
+        reader.close()
+        if writer is not None:
+            writer.release()
+        # Reports (LPR + PDF) are generated in the background; let them finish
+        detector.executor.shutdown(wait=True)
+        detector.close()
+    return violations, written, learned
+
+def merge_learned_stops(camera_id, learned, now=None, directory=None):
+    """Adds the workers' learned stops to the camera's persisted heatmaps (one writer)."""
+    from logic.heatmap_store import HeatmapStore, camera_heatmap_dir, decay_rate
+    from logic.traffic_light import DEFAULT_TIMING
+    now = time.time() if now is None else now
+    store = HeatmapStore(directory or camera_heatmap_dir(camera_id))
+    rate = decay_rate(DEFAULT_TIMING['heatmap_half_life'])
+    for anchors, heatmaps in learned:
+        store.absorb(anchors, heatmaps, now, rate)
+    store.flush(force=True)
+    return store
+
+def _concat_videos(parts, output, fps):
+    writer = None
+    for part in parts:
+        streamer = VideoStreamer(part, loop=False)
+        while True:
+            frame = streamer.get_frame()
+            if frame is None:
+                break
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+            writer.write(frame)
+        streamer.release()
+        os.remove(part)
+    if writer is not None:
+        writer.release()
+
+def _prepare_models(backend):
+    """Exports / calibrates the models once, instead of concurrently in every worker."""
+    from processing.inference_backend import DEFAULT_BACKEND, export_model, parse_backend
+    name, int8 = parse_backend(backend or DEFAULT_BACKEND)
+    if name == 'torch':
+        return
+    seg_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'road_seg.pt')
+    try:
+        export_model('yolov8n.pt', name, int8, task='detect')
+        if os.path.exists(seg_path):
+            export_model(seg_path, name, int8, task='segment')
+    except ImportError as e:
+        print(f"Warning: cannot export for {name} ({e}); workers will fall back to PyTorch.")
+
+def run(path, out_dir, workers=1, chunk_seconds=120.0, overlap_seconds=5.0, camera_id=None,
+        detect_interval=1, backend=None):
+    os.makedirs(out_dir, exist_ok=True)
+    source = VideoStreamer(path, loop=False)
+    fps, total = source.fps, source.frame_count
+    source.release()
+
+    # Video time 0 maps to the file's modification time, so reports get plausible dates
+    start_epoch = os.path.getmtime(path)
+    video_path = os.path.join(out_dir, 'annotated.mp4')
+    chunks = [(0, 0, None)]
+    if workers > 1:
+        chunks = plan_chunks(total, int(chunk_seconds * fps), int(overlap_seconds * fps))
+
+    started = time.time()
+    if len(chunks) == 1:
+        warmup_start, start, end = chunks[0]
+        results = [process_range(path, warmup_start, start, end, video_path, start_epoch,
+                                 camera_id, detect_interval, backend)]
+    else:
+        parts = [os.path.join(out_dir, f'part_{i:04d}.mp4') for i in range(len(chunks))]
+        _prepare_models(backend)
+        # spawn: the detector's torch/OpenCV threads don't survive fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(process_range, path, *chunk, part, start_epoch, camera_id,
+                                   detect_interval, backend)
+                       for chunk, part in zip(chunks, parts)]
+            results = [f.result() for f in futures]
+        _concat_videos(parts, video_path, fps)
+
+    if camera_id is not None:
+        merge_learned_stops(camera_id, [learned for _, _, learned in results if learned is not None])
+
+    frames = 0
+    with open(os.path.join(out_dir, 'violations.jsonl'), 'w') as f:
+        for chunk, (violations, written, _) in enumerate(results):
+            frames += written
+            for v in violations:
+                # Track IDs are per chunk (each chunk has its own tracker)
+                f.write(json.dumps(dict(v, chunk=chunk), default=str) + '\n')
+
+    elapsed = time.time() - started
+    print(f"Processed {frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-9):.1f} FPS), "
+          f"{sum(len(v) for v, _, _ in results)} violations -> {out_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a recorded video offline.")
+    parser.add_argument('video')
+    parser.add_argument('--out', default='batch_output', help="Output directory")
+    parser.add_argument('--workers', type=int, default=1, help="Processes; >1 splits the file into chunks")
+    parser.add_argument('--chunk-seconds', type=float, default=120.0)
+    parser.add_argument('--overlap-seconds', type=float, default=5.0,
+                        help="Warm-up replayed before each chunk (output discarded)")
+    parser.add_argument('--camera-id', type=int, default=None,
+                        help="Start from this camera's learned traffic-light associations; new ones are merged in at the end")
+    parser.add_argument('--detect-interval', type=int, default=1,
+                        help="Run the detector every N frames, propagating boxes in between")
+    parser.add_argument('--backend', default=None,
+                        help="torch, onnx, openvino, onnx-int8 or openvino-int8 (INT8: experimental); "
+                             "default: INFERENCE_BACKEND or torch")
+    args = parser.parse_args()
+    run(args.video, args.out, args.workers, args.chunk_seconds, args.overlap_seconds, args.camera_id,
+        args.detect_interval, args.backend)
+
+if __name__ == "__main__":
+    main()
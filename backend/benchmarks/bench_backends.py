@@ -0,0 +1,161 @@
+"""
+Inference backends: latency and accuracy per backend, on our own footage.
+
+For the vehicle detector (yolov8n.pt) every backend reports
+- ms/frame at batch 1 (ObjectTracker) and batch 8 (BatchInferenceScheduler),
+  at the production confidence (0.15);
+- mAP@0.5 and mAP@0.5:0.95 (conf 0.001). With --labels, against YOLO-format
+  ground truth (<labels>/<frame index, 6 digits>.txt: "cls cx cy w h",
+  normalised); without, against the PyTorch FP32 detections at conf 0.25,
+  i.e. how much accuracy the export / quantisation loses.
+For the road segmentation model (models/road_seg.pt, if present): ms/frame
+and mean IoU of the union mask against PyTorch.
+
+Models are exported (and INT8 calibrated) on first use, see
+processing/inference_backend.py. Calibration samples sample_traffic.mp4, so
+benchmark on a different clip (--video) for unbiased INT8 numbers.
+
+Usage (from backend/): python benchmarks/bench_backends.py [--video clip.mp4] [--frames 100]
+                           [--backends torch onnx onnx-int8] [--labels dir]
+"""
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from processing.inference_backend import load_model, sample_frames
+
+BACKENDS = ['torch', 'onnx', 'onnx-int8', 'openvino', 'openvino-int8']
+SEG_MODEL = os.path.join(os.path.dirname(__file__), '..', 'models', 'road_seg.pt')
+
+def box_iou(a, b):
+    """(N, 4) x (M, 4) -> (N, M)"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+def average_precision(preds, truths, iou_threshold):
+    """
+    preds: per frame (N, 6) x1, y1, x2, y2, conf, cls; truths: per frame (M, 5) x1, y1, x2, y2, cls.
+    Mean over classes of the 101-point interpolated AP (COCO style).
+    """
+    classes = np.unique(np.concatenate([t[:, 4] for t in truths])) if truths else []
+    aps = []
+    for cls in classes:
+        scores, hits, n_true = [], [], 0
+        for pred, truth in zip(preds, truths):
+            pred = pred[pred[:, 5] == cls]
+            truth = truth[truth[:, 4] == cls]
+            n_true += len(truth)
+            pred = pred[np.argsort(-pred[:, 4], kind='stable')]
+            ious = box_iou(pred[:, :4], truth[:, :4]) if len(truth) else np.zeros((len(pred), 0))
+            matched = np.zeros(len(truth), dtype=bool)
+            for i in range(len(pred)):
+                candidates = np.where(~matched, ious[i], 0.0)
+                j = int(np.argmax(candidates)) if len(truth) else -1
+                hit = j >= 0 and candidates[j] >= iou_threshold
+                if hit:
+                    matched[j] = True
+                scores.append(pred[i, 4])
+                hits.append(hit)
+        if n_true == 0:
+            continue
+        order = np.argsort(-np.asarray(scores), kind='stable')
+        tp = np.cumsum(np.asarray(hits, dtype=float)[order])
+        recall = tp / n_true
+        precision = tp / np.arange(1, len(tp) + 1)
+        # Precision envelope, sampled at 101 recall points
+        precision = np.maximum.accumulate(precision[::-1])[::-1] if len(precision) else precision
+        points = np.linspace(0, 1, 101)
+        idx = np.searchsorted(recall, points, side='left')
+        aps.append(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+    return float(np.mean(aps)) if aps else 0.0
+
+def load_labels(labels_dir, indices, frame_shape):
+    h, w = frame_shape[:2]
+    truths = []
+    for index in indices:
+        path = os.path.join(labels_dir, f'{index:06d}.txt')
+        rows = np.loadtxt(path, ndmin=2) if os.path.exists(path) else np.zeros((0, 5))
+        cls, cx, cy, bw, bh = rows.T if len(rows) else np.zeros((5, 0))
+        truths.append(np.stack([(cx - bw / 2) * w, (cy - bh / 2) * h,
+                                (cx + bw / 2) * w, (cy + bh / 2) * h, cls], axis=1))
+    return truths
+
+def detections(model, frames, conf):
+    preds = []
+    for frame in frames:
+        data = model.predict(frame, conf=conf, verbose=False)[0].boxes.data.cpu().numpy()
+        preds.append(data[:, [0, 1, 2, 3, -2, -1]])
+    return preds
+
+def latency(model, frames, batch, conf=0.15, warmup=3):
+    for _ in range(warmup):
+        model.predict(frames[:batch], conf=conf, verbose=False)
+    start = time.perf_counter()
+    for i in range(0, len(frames) - batch + 1, batch):
+        model.predict(frames[i:i + batch], conf=conf, verbose=False)
+    n = (len(frames) // batch) * batch
+    return (time.perf_counter() - start) * 1000 / max(n, 1)
+
+def union_masks(model, frames):
+    masks = []
+    for frame in frames:
+        result = model(frame, verbose=False)[0]
+        if result.masks is None:
+            masks.append(np.zeros(frame.shape[:2], dtype=bool))
+        else:
+            union = (result.masks.data > 0.5).any(dim=0).cpu().numpy()
+            masks.append(union)
+    return masks
+
+def bench_detector(frames, indices, backends, labels_dir):
+    if labels_dir:
+        truths = load_labels(labels_dir, indices, frames[0].shape)
+    else:
+        reference = detections(load_model('yolov8n.pt', 'torch', task='detect'), frames, conf=0.25)
+        truths = [r[:, [0, 1, 2, 3, 5]] for r in reference]
+
+    print(f"Detector (yolov8n, {len(frames)} frames, mAP vs {'labels' if labels_dir else 'PyTorch FP32'})")
+    print(f"{'backend':<15} {'ms/frame b1':>12} {'ms/frame b8':>12} {'mAP50':>7} {'mAP50-95':>9}")
+    for spec in backends:
+        model = load_model('yolov8n.pt', spec, task='detect')
+        preds = detections(model, frames, conf=0.001)
+        map50 = average_precision(preds, truths, 0.5)
+        map50_95 = np.mean([average_precision(preds, truths, t) for t in np.arange(0.5, 0.96, 0.05)])
+        batched = load_model('yolov8n.pt', spec, task='detect', batch=8)
+        print(f"{spec:<15} {latency(model, frames, 1):>12.1f} {latency(batched, frames, 8):>12.1f} "
+              f"{map50:>7.3f} {map50_95:>9.3f}")
+
+def bench_segmentation(frames, backends):
+    reference = union_masks(load_model(SEG_MODEL, 'torch', task='segment'), frames)
+    print(f"\nRoad segmentation ({len(frames)} frames, mask IoU vs PyTorch FP32)")
+    print(f"{'backend':<15} {'ms/frame':>9} {'mask IoU':>9}")
+    for spec in backends:
+        model = load_model(SEG_MODEL, spec, task='segment')
+        start = time.perf_counter()
+        masks = union_masks(model, frames)
+        ms = (time.perf_counter() - start) * 1000 / len(frames)
+        ious = [np.logical_and(a, b).sum() / max(np.logical_or(a, b).sum(), 1) for a, b in zip(masks, reference)]
+        print(f"{spec:<15} {ms:>9.1f} {np.mean(ious):>9.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency / accuracy per inference backend.")
+    parser.add_argument('--video', default=os.path.join(os.path.dirname(__file__), '..', 'sample_traffic.mp4'))
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--backends', nargs='+', default=BACKENDS)
+    parser.add_argument('--labels', default=None, help="YOLO-format ground truth per frame index")
+    args = parser.parse_args()
+
+    frames, indices = sample_frames(args.video, args.frames, with_indices=True)
+    bench_detector(frames, indices, args.backends, args.labels)
+    if os.path.exists(SEG_MODEL):
+        bench_segmentation(frames, args.backends)
+
+if __name__ == "__main__":
+    main()
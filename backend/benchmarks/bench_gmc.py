@@ -0,0 +1,68 @@
+"""
+Benchmark: GMC cost and accuracy per configuration.
+Synthetic 1080p sequence: a textured scene translated (and slightly rotated)
+by a known camera motion every frame, plus a few independently moving
+"vehicles" that a good estimator must ignore.
+
+Usage (from backend/): python benchmarks/bench_gmc.py
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from processing.stabilization import GMC
+
+CONFIGS = [
+    ("legacy (full res)", dict()),
+    ("1/2, redetect 10", dict(downscale=2, redetect_interval=10)),
+    ("1/4, redetect 10", dict(downscale=4, redetect_interval=10)),
+    ("1/4, affine", dict(downscale=4, redetect_interval=10, model='affine')),
+    ("1/4, homography", dict(downscale=4, redetect_interval=10, model='homography')),
+]
+
+def make_sequence(n_frames=120, size=(1920, 1080), seed=0):
+    rng = np.random.default_rng(seed)
+    w, h = size
+    # Large textured "ground" so the camera can move without running out of image
+    ground = cv2.GaussianBlur(rng.integers(0, 255, (h + 400, w + 400, 3), dtype=np.uint8), (0, 0), 2)
+
+    frames, truth = [], []
+    x, y = 200.0, 200.0
+    cars = rng.uniform((200, 200), (w - 200, h - 200), (6, 2))
+    for i in range(n_frames):
+        dx, dy = 3.0 * np.sin(i / 10.0), 2.0 * np.cos(i / 13.0)
+        x += dx
+        y += dy
+        M = np.float32([[1, 0, -x], [0, 1, -y]])
+        frame = cv2.warpAffine(ground, M, (w, h), flags=cv2.INTER_LINEAR)
+        # Independently moving vehicles
+        cars[:, 0] = (cars[:, 0] + 12) % w
+        for cx, cy in cars:
+            cv2.rectangle(frame, (int(cx), int(cy)), (int(cx) + 120, int(cy) + 60), (30, 30, 200), -1)
+        frames.append(frame)
+        # Static ground moves opposite to the camera in the image
+        truth.append((-dx, -dy))
+    return frames, np.array(truth[1:])
+
+def run(config, frames):
+    gmc = GMC(**config)
+    shifts = []
+    start = time.perf_counter()
+    for frame in frames:
+        shifts.append(gmc.apply(frame))
+    elapsed = time.perf_counter() - start
+    return np.array(shifts[1:], dtype=np.float64), elapsed / len(frames) * 1000
+
+def main():
+    frames, truth = make_sequence()
+    print(f"{'config':<22} {'ms/frame':>10} {'mean err px':>12} {'p95 err px':>11}")
+    for name, config in CONFIGS:
+        shifts, ms = run(config, frames)
+        err = np.hypot(*(shifts - truth).T)
+        print(f"{name:<22} {ms:>10.2f} {err.mean():>12.3f} {np.percentile(err, 95):>11.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Traffic-light colour classification: accuracy and latency.
+Compares the per-crop contour heuristic (TrafficLightLogic.detect_raw_color)
+with the batched heuristic and the softmax classifier in logic/tl_classifier.py.
+
+Crops are synthetic signal heads (three lamps, one lit or none) with random
+size, exposure, glare, blur and noise. The softmax model is trained on one
+half and evaluated on the other; --save writes its weights to
+models/tl_classifier.npz, which create_color_classifier() then picks up.
+Real labelled crops can replace make_dataset() for production weights.
+
+Usage (from backend/): python benchmarks/bench_tl_classifier.py [--save]
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cv2
+import numpy as np
+from logic.traffic_light import TrafficLightLogic
+from logic.tl_classifier import (HeuristicColorClassifier, SoftmaxColorClassifier,
+                                 LABELS)
+
+LAMP_BGR = {'red': (30, 40, 255), 'yellow': (20, 200, 255), 'green': (140, 255, 60)}
+
+def make_crop(label, rng):
+    w = int(rng.integers(10, 40))
+    h = int(w * rng.uniform(2.2, 3.0))
+    housing = int(rng.integers(15, 70))
+    crop = np.full((h, w, 3), housing, dtype=np.uint8)
+    r = max(2, int(w * 0.35))
+    centres = [(w // 2, int(h * f)) for f in (1 / 6, 1 / 2, 5 / 6)]
+
+    # Unlit lamps: dim versions of their colours
+    for color, centre in zip(('red', 'yellow', 'green'), centres):
+        dim = tuple(int(c * rng.uniform(0.1, 0.3)) for c in LAMP_BGR[color])
+        cv2.circle(crop, centre, r, dim, -1)
+    if label != 'unknown':
+        centre = centres[('red', 'yellow', 'green').index(label)]
+        gain = rng.uniform(0.6, 1.0)
+        lit = tuple(int(min(255, c * gain)) for c in LAMP_BGR[label])
+        cv2.circle(crop, centre, r, lit, -1)
+        # Saturated core (overexposed lamps go white in the middle)
+        if rng.random() < 0.5:
+            cv2.circle(crop, centre, max(1, r // 2), (235, 235, 235), -1)
+    elif rng.random() < 0.3:
+        # Specular glare on the housing: bright but unsaturated
+        cv2.ellipse(crop, (w // 2, h // 2), (r, r // 3), 0, 0, 360, (230, 230, 230), -1)
+
+    crop = cv2.GaussianBlur(crop, (3, 3), rng.uniform(0.1, 1.2))
+    exposure = rng.uniform(0.5, 1.2)
+    noise = rng.normal(0, 6, crop.shape)
+    return np.clip(crop * exposure + noise, 0, 255).astype(np.uint8)
+
+def make_dataset(n, rng):
+    labels = rng.integers(0, len(LABELS), n)
+    return [make_crop(LABELS[k], rng) for k in labels], labels
+
+def accuracy(pred, labels):
+    return float(np.mean([p == LABELS[k] for p, k in zip(pred, labels)]))
+
+def per_frame_ms(classify, crops, per_frame=10, repeat=3):
+    frames = [crops[i:i + per_frame] for i in range(0, len(crops), per_frame)]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            classify(frame)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000 / len(frames)
+
+def main():
+    cv2.setNumThreads(1)
+    rng = np.random.default_rng(0)
+    train_crops, train_labels = make_dataset(4000, rng)
+    test_crops, test_labels = make_dataset(2000, rng)
+
+    contour = TrafficLightLogic(classifier=HeuristicColorClassifier())
+    heuristic = HeuristicColorClassifier()
+    _, _, features = heuristic.features(train_crops)
+    softmax = SoftmaxColorClassifier.fit(features, train_labels)
+
+    candidates = [
+        ('contour (per crop)', lambda crops: [contour.detect_raw_color(c) for c in crops]),
+        ('batched heuristic', heuristic.classify),
+        ('batched softmax', softmax.classify),
+    ]
+    print(f"{'classifier':>20} {'accuracy':>9} {'ms/frame (10 TLs)':>18}")
+    for name, classify in candidates:
+        acc = accuracy(classify(test_crops), test_labels)
+        ms = per_frame_ms(classify, test_crops)
+        print(f"{name:>20} {acc:>9.3f} {ms:>18.3f}")
+
+    if '--save' in sys.argv:
+        path = os.path.join(os.path.dirname(__file__), '..', 'models', 'tl_classifier.npz')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        softmax.save(path)
+        print(f"Saved {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: yield-violation proximity check vs. object count.
+Compares the original O(P x C) Python double loop with the batched
+dense and grid engines in logic/proximity.py.
+
+Usage (from backend/): python benchmarks/bench_yield.py
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from logic.proximity import close_pairs_dense, close_pairs_grid
+
+def python_loop(ped_centres, car_centres, thresholds):
+    """Reference: the pre-vectorisation PedestrianLogic loop."""
+    pairs = []
+    for pi, ped in enumerate(ped_centres):
+        for ci, car in enumerate(car_centres):
+            distance = np.linalg.norm(np.array(ped) - np.array(car))
+            if distance < thresholds[ci]:
+                pairs.append((pi, ci))
+    return pairs
+
+def make_scene(n_peds, n_cars, rng, car_widths, size=(1920, 1080)):
+    peds = rng.uniform((0, 0), size, (n_peds, 2))
+    cars = rng.uniform((0, 0), size, (n_cars, 2))
+    widths = rng.uniform(*car_widths, n_cars)
+    return peds, cars, widths * 2.5
+
+def timeit(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    rng = np.random.default_rng(0)
+    # Street-level camera (big cars) vs. high-altitude drone (small cars)
+    for label, car_widths in (("street", (40, 160)), ("drone", (10, 40))):
+        print(f"\nScene: {label} (car width {car_widths[0]}-{car_widths[1]} px)")
+        print(f"{'peds':>6} {'cars':>6} {'loop ms':>10} {'dense ms':>10} {'grid ms':>10}")
+        run_scene(rng, car_widths)
+
+def run_scene(rng, car_widths):
+    for n in (5, 10, 25, 50, 100, 200, 400, 1000):
+        peds, cars, thresholds = make_scene(n, n, rng, car_widths)
+
+        # Same pairs from every engine
+        dense = close_pairs_dense(peds, cars, thresholds)
+        grid = close_pairs_grid(peds, cars, thresholds)
+        assert np.array_equal(dense[0], grid[0]) and np.array_equal(dense[1], grid[1])
+
+        loop_ms = timeit(python_loop, peds, cars, thresholds, repeat=1) if n <= 400 else float('nan')
+        if n <= 100:
+            assert python_loop(peds, cars, thresholds) == list(zip(dense[0].tolist(), dense[1].tolist()))
+        dense_ms = timeit(close_pairs_dense, peds, cars, thresholds)
+        grid_ms = timeit(close_pairs_grid, peds, cars, thresholds)
+        print(f"{n:>6} {n:>6} {loop_ms:>10.3f} {dense_ms:>10.3f} {grid_ms:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import cv2
+import time
+
+class WallClock:
+    """Capture time from the system clock, taken when the frame is read (not when it is processed)."""
+    def timestamp(self, cap=None, frame_index=None):
+        return time.time()
+
+class CaptureClock:
+    """
+    Camera / stream presentation time (CAP_PROP_POS_MSEC), anchored to the wall
+    clock at the first frame. Many webcams report no usable PTS (0 or not
+    increasing); then it falls back to the wall clock at capture.
+    """
+    def __init__(self):
+        self.origin = None # epoch of PTS 0
+        self.last = None
+
+    def timestamp(self, cap=None, frame_index=None):
+        now = time.time()
+        pts = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if cap is not None else 0.0
+        if pts <= 0 or (self.last is not None and self.origin is not None and self.origin + pts <= self.last):
+            self.origin = None
+            self.last = now
+            return now
+        if self.origin is None:
+            self.origin = now - pts
+        self.last = self.origin + pts
+        return self.last
+
+class VideoClock:
+    """File time: frame_index / fps, offset by start_epoch (e.g. the recording start)."""
+    def __init__(self, fps, start_epoch=0.0):
+        self.fps = fps
+        self.start_epoch = start_epoch
+
+    def timestamp(self, cap=None, frame_index=0):
+        return self.start_epoch + frame_index / self.fps
@@ -3,57 +3,103 @@ import numpy as np
 import os
 import time
 from processing.stabilization import ObjectTracker
+from processing.motion import MotionCompensator
 from processing.enhancement import ImageEnhancer
+from processing.detection_schedule import DetectionScheduler, BoxPropagator
+from processing.roi_inference import TrafficLightROIs
+from processing.detections import extract_detections, filter_detections
 from logic.traffic_light import TrafficLightLogic
+from logic.heatmap_store import camera_heatmap_dir
 from logic.pedestrian import PedestrianLogic
 from logic.infrastructure import InfrastructureLogic
+from logic.plate_cache import PlateCache
+from logic.track_store import TrackStateStore
 from concurrent.futures import ThreadPoolExecutor
+import threading
 
 class VehicleDetector:
-    def __init__(self, model_path='yolov8n.pt'):
+    def __init__(self, model_path='yolov8n.pt', scheduler=None, lpr_pool=None, tl_timing=None,
+                 camera_id=None, detect_interval=None, backend=None, heatmaps_read_only=False):
         print("Initializing VehicleDetector...")
-        self.tracker = ObjectTracker(model_path)
+        # scheduler: optional BatchInferenceScheduler shared by all cameras
+        # backend: torch / onnx / openvino (+ '-int8'), None = INFERENCE_BACKEND env var
+        self.tracker = ObjectTracker(model_path, scheduler=scheduler, backend=backend)
         self.enhancer = ImageEnhancer()
         self.gmc = None # Delayed init
-        self.tl_logic = TrafficLightLogic()
-        self.ped_logic = PedestrianLogic()
-        self.infra_logic = InfrastructureLogic(frame_size=(1920, 1080)) # Default, will re-init if needed
+        # Camera motion removed from track displacement / heatmap coordinates
+        self.motion = MotionCompensator()
+        # Detector every N frames (detect_interval, or adaptive when None);
+        # in between, boxes are propagated and the violation logic still runs
+        self.detection_schedule = DetectionScheduler(interval=detect_interval)
+        self.propagator = BoxPropagator()
+        # High-res frames: traffic lights are also detected in full-resolution crops
+        # around where they were seen before (learned ROIs)
+        self.tl_rois = TrafficLightROIs()
+        # tl_timing: per-junction overrides of the TL voting window / thresholds
+        # Learned lane associations persist per camera (data/heatmaps/camera_<id>);
+        # heatmaps_read_only uses them without writing (offline workers merge afterwards)
+        heatmap_dir = camera_heatmap_dir(camera_id) if camera_id is not None else None
+        self.tl_logic = TrafficLightLogic(timing=tl_timing, heatmap_dir=heatmap_dir,
+                                          heatmaps_read_only=heatmaps_read_only)
+        # Shared per-track state (positions, velocities, report times), bounded by age
+        self.tracks = TrackStateStore(max_age=10.0)
+        self.ped_logic = PedestrianLogic(self.tracks)
+        self.infra_logic = InfrastructureLogic(frame_size=(1920, 1080), backend=backend) # Default, will re-init if needed
         
         # Thread Pool for background tasks (Report Gen, LPR)
         self.executor = ThreadPoolExecutor(max_workers=2)
+        # Optional LPRWorkerPool (separate processes). Without it, LPR runs in the executor.
+        self.lpr_pool = lpr_pool
+        self.LPR_PRIORITY = {"Red Light Violation": 0, "Yield Violation": 1}
+        # Best crops + voted plate per track, so repeat violations skip OCR
+        self.plate_cache = PlateCache()
         
         # Classes COCO: 2=car, 3=motorcycle, 5=bus, 7=truck, 0=person, 9=traffic light
         self.vehicle_classes = [2, 3, 5, 7]
         self.person_class = 0
         self.traffic_light_class = 9
         
-        # State used to prevent duplicate reporting
-        self.reported_violations = {} 
+        # Duplicate reporting is prevented via self.tracks.last_report
         self.REPORT_COOLDOWN = 15.0 # Seconds before reporting same car again
-        
-        # BEHAVIORAL LEARNING STATE
-        self.vehicle_history = {} # id -> {'last_pos': (x,y), 'last_time': t, 'velocity': v}
-        self.last_frame_time = time.time()
 
-    def _process_violation_task(self, frame, car_obj, violation_type, timestamp, filename_base):
+    def close(self):
+        """Persists learned state; called when the camera session ends."""
+        self.tl_logic.flush(force=True)
+
+    def memory_usage(self):
+        """Per-camera state sizes (exposed through /sessions)."""
+        return {
+            'traffic_lights': self.tl_logic.memory_usage(),
+            'tracks': len(self.tracks),
+            'track_bytes': self.tracks.nbytes,
+            'plate_cache': self.plate_cache.memory_usage(),
+        }
+
+    def _crop_car(self, frame, car_obj):
+        x1, y1, x2, y2 = car_obj['box']
+        # Clamp coords
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        return frame[y1:y2, x1:x2], (x1, y1, x2, y2)
+
+    def _process_violation_task(self, frame, car_obj, violation_type, timestamp, filename_base, lpr_text=None):
         """
         Background task:
-        1. Run LPR on the car crop.
+        1. Run LPR on the car crop (unless the LPR pool already did).
         2. Generate PDF with the found ID.
         """
         try:
             # Crop car for LPR
-            x1, y1, x2, y2 = car_obj['box']
-            # Clamp coords
-            h, w = frame.shape[:2]
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(w, x2), min(h, y2)
-            
-            car_crop = frame[y1:y2, x1:x2]
+            car_crop, (x1, y1, x2, y2) = self._crop_car(frame, car_obj)
             
-            # 1. OCR (Safe import inside thread)
-            from lpr import read_license_plate
-            lpr_text = read_license_plate(car_crop)
+            # 1. OCR (Safe import inside thread) on the best crops seen for this track
+            if lpr_text is None:
+                from lpr import read_license_plates
+                crops = self._plate_candidates(frame, car_obj)
+                for text, conf in read_license_plates(crops):
+                    self.plate_cache.add_reading(car_obj['id'], text, conf)
+                lpr_text = self.plate_cache.get_plate(car_obj['id'], min_confidence=0) or "Unknown"
             print(f"LPR Result for {car_obj['id']}: {lpr_text}")
             
             # Save the crop for the report
@@ -90,14 +136,46 @@ class VehicleDetector:
         except Exception as e:
             print(f"Error in background violation task: {e}")
 
-    def handle_violation(self, frame, car_obj, violation_type):
+    def _plate_candidates(self, frame, car_obj):
+        """Best cached crops for the track, topped up with the current one."""
+        crops = self.plate_cache.best_crops(car_obj['id'])
+        if len(crops) < self.plate_cache.OCR_BEST_N:
+            car_crop, _ = self._crop_car(frame, car_obj)
+            if car_crop.size > 0:
+                crops.append(car_crop.copy())
+        return crops
+
+    def _read_plate_async(self, car_obj, crops, priority, on_done):
+        """Sends every candidate crop to the LPR pool, calls on_done(plate) after the last one."""
+        track_id = car_obj['id']
+        remaining = [len(crops)]
+        lock = threading.Lock()
+
+        def on_reading(reading):
+            text, conf = reading
+            if text is not None:
+                self.plate_cache.add_reading(track_id, text, conf)
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                # Dropped under backlog / unreadable -> report falls back to the tracker ID
+                on_done(self.plate_cache.get_plate(track_id, min_confidence=0) or "Unknown")
+
+        if not crops:
+            on_done("Unknown")
+        for crop in crops:
+            self.lpr_pool.submit(crop, on_reading, priority=priority)
+
+    def handle_violation(self, frame, car_obj, violation_type, now=None):
         """
         Handles violation. Returns immediate data for UI, 
         and launches background task for heavy LPR/PDF.
+        now: frame time (epoch seconds); defaults to the wall clock.
         """
         from datetime import datetime
         
-        timestamp = datetime.now()
+        timestamp = datetime.now() if now is None else datetime.fromtimestamp(now)
         date_str = timestamp.strftime("%Y-%m-%d")
         time_str = timestamp.strftime("%H:%M:%S")
         
@@ -109,7 +187,22 @@ class VehicleDetector:
         
         # Launch background task
         # We pass a COPY of the frame to avoid race conditions
-        self.executor.submit(self._process_violation_task, frame.copy(), car_obj, violation_type, timestamp, filename_base)
+        frame_copy = frame.copy()
+        cached_plate = self.plate_cache.get_plate(car_obj['id'])
+        if cached_plate is not None:
+            # Already read on an earlier frame / violation: no OCR at all
+            self.executor.submit(self._process_violation_task, frame_copy, car_obj,
+                                 violation_type, timestamp, filename_base, cached_plate)
+        elif self.lpr_pool is not None:
+            # OCR in the LPR processes, then PDF in our thread pool
+            def on_plate(lpr_text):
+                self.executor.submit(self._process_violation_task, frame_copy, car_obj,
+                                     violation_type, timestamp, filename_base, lpr_text)
+
+            self._read_plate_async(car_obj, self._plate_candidates(frame_copy, car_obj),
+                                   self.LPR_PRIORITY.get(violation_type, 1), on_plate)
+        else:
+            self.executor.submit(self._process_violation_task, frame_copy, car_obj, violation_type, timestamp, filename_base)
         
         # Return immediate object for UI (with Tracker ID)
         return {
@@ -122,78 +215,115 @@ class VehicleDetector:
             'message': f"Processing violation for Vehicle {car_obj['id']}"
         }
 
-    def process_frame(self, frame):
-        current_time = time.time()
-        dt = current_time - self.last_frame_time
-        self.last_frame_time = current_time
+    def _reanchor(self, frame_shape):
+        """
+        Keeps stabilised coordinates near the image on a drifting camera: the
+        origin moves by whole heatmap cells, and every stored stabilised
+        position (tracks, TL heatmaps / anchors, ROI sightings) moves with it.
+        """
+        h, w = frame_shape[:2]
+        grid = self.tl_logic.heatmaps.GRID_SIZE
+        correction = self.motion.reanchor(frame_shape, cell=(w / grid, h / grid))
+        if correction is None:
+            return
+        dx, dy = correction
+        self.tracks.shift(dx, dy)
+        self.tl_rois.shift(dx, dy)
+        self.tl_logic.shift_positions(dx / w, dy / h)
+
+    def process_frame(self, frame, timestamp=None):
+        """
+        timestamp: when the frame was captured (epoch seconds). Live cameras use
+        the wall clock; offline processing passes the video time so results do
+        not depend on how fast frames are processed.
+        """
+        current_time = time.time() if timestamp is None else timestamp
+        frame_start = time.perf_counter()
 
         # Lazy init GMC
         from processing.stabilization import GMC
         if self.gmc is None:
-            self.gmc = GMC()
+            # 1/4 resolution, scheduled re-detection (see benchmarks/bench_gmc.py)
+            self.gmc = GMC(downscale=4, redetect_interval=10)
 
-        # 0. Measure Ego-Motion
-        dx, dy = self.gmc.apply(frame)
-        
-        # 1. Enhancement
+        # 0. Enhancement (skipped on well-exposed frames)
         enhanced_frame = self.enhancer.preprocess(frame)
+
+        # 1. Measure Ego-Motion on the raw frame: enhancement switches on and off
+        # with exposure, and LK must always compare the same kind of image
+        # (GMC downscales before converting, so this stays cheap)
+        dx, dy = self.gmc.apply(frame)
+        dx, dy = self.motion.update(dx, dy)
+        self._reanchor(frame.shape)
+        self.propagator.add_camera_motion(dx, dy)
         
-        # 2. Tracking
-        results = self.tracker.track(enhanced_frame)
-        
-        cars = []
-        pedestrians = []
-        traffic_lights = []
-        
-        if results.boxes:
-            box_data = zip(
-                results.boxes.xyxy, 
-                results.boxes.cls, 
-                results.boxes.id if results.boxes.id is not None else [None]*len(results.boxes.cls),
-                results.boxes.conf
-            )
-
-            for box, cls, id_raw, conf in box_data:
-                x1, y1, x2, y2 = map(int, box)
-                cls = int(cls)
-                conf = float(conf)
-                obj_id = int(id_raw) if id_raw is not None else -1
-                
-                # Class-specific confidence filtering
-                if cls in self.vehicle_classes:
-                    if conf < 0.25: continue # Standard confidence for vehicles
-                elif cls == self.traffic_light_class:
-                    if conf < 0.15: continue # More aggressive for traffic lights
-                else:
-                    if conf < 0.2: continue # Pedestrians and others
-
-                obj = {'box': [x1, y1, x2, y2], 'class': cls, 'id': obj_id, 'conf': conf}
-                
-                if cls in self.vehicle_classes:
-                    # CALCULATE VELOCITY
-                    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                    velocity = 999.0 # Default for new
-                    if obj_id != -1 and obj_id in self.vehicle_history:
-                        prev = self.vehicle_history[obj_id]
-                        dist = np.sqrt((cx - prev['last_pos'][0])**2 + (cy - prev['last_pos'][1])**2)
-                        if dt > 0:
-                            velocity = dist / dt
-                    
-                    self.vehicle_history[obj_id] = {'last_pos': (cx, cy), 'last_time': current_time, 'velocity': velocity}
-                    obj['velocity'] = velocity
-                    cars.append(obj)
-                elif cls == self.person_class:
-                    pedestrians.append(obj)
-                elif cls == self.traffic_light_class:
-                    # Detect state using logic
-                    tl_crop = frame[y1:y2, x1:x2] 
-                    state = self.tl_logic.get_state(obj['id'], tl_crop)
-                    obj['state'] = state
-                    traffic_lights.append(obj)
+        # 2. Tracking (scheduled); skipped frames reuse the last tracks, moved forward
+        detect_seconds = None
+        if self.detection_schedule.should_detect():
+            detect_start = time.perf_counter()
+            rois = self.tl_rois.windows(self.motion.offset, frame.shape)
+            results = self.tracker.track(enhanced_frame, rois)
+            # Everything below works on arrays; dicts are only built for the objects we keep
+            boxes, classes, ids, confs = extract_detections(results)
+            self.tl_rois.observe(boxes[classes == self.traffic_light_class], self.motion.offset, frame.shape)
+            detect_seconds = time.perf_counter() - detect_start
+            self.propagator.update(boxes, classes, ids, confs, current_time, frame.shape)
+        else:
+            boxes, classes, ids, confs = self.propagator.predict(current_time)
 
-        violations = []
+        # Class-specific confidence filtering
+        keep, is_vehicle, is_person, is_tl = filter_detections(
+            classes, confs, self.vehicle_classes, self.person_class, self.traffic_light_class)
+
+        boxes, classes, ids, confs = boxes[keep], classes[keep], ids[keep], confs[keep]
+        is_vehicle, is_person, is_tl = is_vehicle[keep], is_person[keep], is_tl[keep]
+
+        # CALCULATE VELOCITY (all vehicles at once)
+        car_idx = np.flatnonzero(is_vehicle)
+        car_boxes = boxes[car_idx]
+        car_ids = ids[car_idx]
+        centres = (car_boxes[:, :2] + car_boxes[:, 2:]) / 2
+        tracked = car_ids != -1
+        # Track positions live in the stabilised frame, so displacement (and velocity)
+        # is the vehicle's own motion, not drone drift
+        slots = self.tracks.update(car_ids[tracked], self.motion.to_stable(centres[tracked]), current_time)
+        velocities = np.full(len(car_idx), 999.0) # Default for new / untracked
+        velocities[tracked] = np.where(self.tracks.hits[slots] > 1, self.tracks.velocity[slots], 999.0)
+
+        def build(idx):
+            return [{'box': b, 'class': c, 'id': i, 'conf': f}
+                    for b, c, i, f in zip(boxes[idx].tolist(), classes[idx].tolist(),
+                                          ids[idx].tolist(), confs[idx].tolist())]
+
+        cars = build(car_idx)
+        for car, velocity in zip(cars, velocities.tolist()):
+            car['velocity'] = velocity
+            # Opportunistic plate crop sampling (cheap, rate-limited per track)
+            self.plate_cache.observe(car['id'], frame, car['box'], current_time)
+
+        pedestrians = build(np.flatnonzero(is_person))
+
+        traffic_lights = build(np.flatnonzero(is_tl))
         h, w = frame.shape[:2]
-        current_time = time.time()
+        for tl in traffic_lights:
+            if tl['id'] != -1:
+                # Heatmaps are keyed by the light's (stabilised) position, not its track ID
+                x1, y1, x2, y2 = tl['box']
+                sx, sy = self.motion.to_stable_point((x1 + x2) / 2, (y1 + y2) / 2)
+                self.tl_logic.bind_position(tl['id'], sx, sy, w, h, current_time)
+
+        # Detect states using logic: all crops of this frame classified in one batch.
+        # Crops come from the raw frame, as before frame-level CLAHE existed: the
+        # classifier normalises brightness per crop and was tuned on raw crops
+        tl_crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (tl['box'] for tl in traffic_lights)]
+        tl_states = self.tl_logic.get_states([tl['id'] for tl in traffic_lights], tl_crops, current_time)
+        for tl, state in zip(traffic_lights, tl_states):
+            tl['state'] = state
+
+        violations = []
+        self.plate_cache.evict(current_time)
+        self.tracks.evict(current_time)
+        self.tl_logic.evict(current_time)
         
         # 3. BEHAVIORAL LEARNING
         # If car is stopped (< 15 px/s) while a TL is red, record association
@@ -203,20 +333,22 @@ class VehicleDetector:
                 cx, cy = (cx1 + cx2) / 2, (cy1 + cy2) / 2
                 for tl in traffic_lights:
                     if tl['state'] == 'red':
-                        self.tl_logic.record_vehicle_stop(tl['id'], cx, cy, w, h)
+                        sx, sy = self.motion.to_stable_point(cx, cy)
+                        self.tl_logic.record_vehicle_stop(tl['id'], sx, sy, w, h, current_time)
+
+        self.tl_logic.flush() # Rate-limited
 
         # 4. Pedestrian Violations
-        ped_violations = self.ped_logic.check_yield_violations(cars, pedestrians)
+        ped_violations = self.ped_logic.check_yield_violations(cars, pedestrians, current_time)
         for pv in ped_violations:
             car_id = pv['car_id']
-            if car_id in self.reported_violations:
-                if current_time - self.reported_violations[car_id] < self.REPORT_COOLDOWN:
-                    continue
+            if current_time - self.tracks.last_report_time(car_id) < self.REPORT_COOLDOWN:
+                continue
             
             car_obj = next((c for c in cars if c['id'] == car_id), None)
             if car_obj:
-               v_data = self.handle_violation(frame, car_obj, "Yield Violation")
-               self.reported_violations[car_id] = current_time
+               v_data = self.handle_violation(frame, car_obj, "Yield Violation", current_time)
+               self.tracks.mark_reported(car_id, current_time)
                pv['date'] = v_data['date']
                pv['time'] = v_data['time']
                violations.append(pv)
@@ -224,9 +356,8 @@ class VehicleDetector:
         # 5. Red Light Violations (Using Learned Associations)
         for car in cars:
             car_id = car['id']
-            if car_id in self.reported_violations:
-                 if current_time - self.reported_violations[car_id] < self.REPORT_COOLDOWN:
-                     continue 
+            if current_time - self.tracks.last_report_time(car_id) < self.REPORT_COOLDOWN:
+                continue
             
             # Car must be MOVING to commit a violation (not just standing in intersection)
             if car.get('velocity', 0) < 30: # px/sec
@@ -238,10 +369,12 @@ class VehicleDetector:
                     cx, cy = (cx1 + cx2) / 2, cy2 # car front
                     
                     # Check if this area is learned to be controlled by this light
-                    if self.tl_logic.is_associated(tl['id'], cx, cy, w, h):
+                    # Heatmap is learned in stabilised coordinates
+                    sx, sy = self.motion.to_stable_point(cx, cy)
+                    if self.tl_logic.is_associated(tl['id'], sx, sy, w, h, current_time):
                         # VIOLATION DETECTED
-                        v_data = self.handle_violation(frame, car, "Red Light Violation")
-                        self.reported_violations[car_id] = current_time
+                        v_data = self.handle_violation(frame, car, "Red Light Violation", current_time)
+                        self.tracks.mark_reported(car_id, current_time)
                         
                         violations.append({
                             'type': 'red_light_violation',
@@ -253,13 +386,14 @@ class VehicleDetector:
                             'time': v_data['time']
                         })
         
-        # 6. Annotation
-        annotated_frame = enhanced_frame.copy()
+        # 6. Annotation: the enhanced frame is a fresh array, draw on it directly.
+        # Copy only when enhancement was skipped (it is the caller's frame then).
+        annotated_frame = enhanced_frame if self.enhancer.enhanced else frame.copy()
         
         # 6. Stop Line / Crosswalk Detection
         # (This now detects Stop Lines instead of Crosswalks per user request)
         detected_objects = cars + pedestrians # Define detected_objects for the call
-        stop_lines = self.infra_logic.detect_crosswalks(frame, objects_to_mask=detected_objects)
+        stop_lines = self.infra_logic.detect_crosswalks(frame, objects_to_mask=detected_objects, motion=(dx, dy))
         
         crosswalk_mask = np.zeros_like(frame, dtype=np.uint8)
         detected_stop_lines_polys = []
@@ -345,4 +479,6 @@ class VehicleDetector:
             cv2.putText(annotated_frame, label, (x1, y1-10), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, c, 2)
 
+        self.detection_schedule.record(time.perf_counter() - frame_start, detect_seconds,
+                                       len(self.propagator.ids), self.propagator.max_speed())
         return annotated_frame, violations
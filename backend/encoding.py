@@ -0,0 +1,112 @@
+import cv2
+import time
+
+class AdaptiveEncoder:
+    """
+    Per-client JPEG encoder that adapts to backpressure.
+    Starlette does not expose the socket's buffered amount, so congestion is
+    inferred from how long `await send` takes: once the transport buffer is
+    full, send blocks until the client drains it.
+
+    Congested  -> lower quality, then resolution, then send rate.
+    Healthy    -> restore send rate, then resolution, then quality.
+    Send took longer than a frame interval -> skip frames until it drained.
+    """
+    def __init__(self, min_quality=40, max_quality=85, min_scale=0.4, max_scale=1.0,
+                 min_fps=5.0, max_fps=30.0, target_latency=0.05):
+        self.MIN_QUALITY, self.MAX_QUALITY = min_quality, max_quality
+        self.MIN_SCALE, self.MAX_SCALE = min_scale, max_scale
+        self.MIN_FPS, self.MAX_FPS = min_fps, max_fps
+        self.TARGET_LATENCY = target_latency # Seconds per send considered healthy
+        self.UPGRADE_AFTER = 30 # Consecutive healthy sends before stepping up
+        self.ADJUST_COOLDOWN = 5 # Sends to wait after a change so the average can settle
+
+        # Current operating point (start at best quality)
+        self.quality = max_quality
+        self.scale = max_scale
+        self.fps = max_fps
+
+        self.latency = 0.0 # EWMA of send duration
+        self.bytes_per_frame = 0.0 # EWMA of payload size
+        self.last_send_time = 0.0
+        self.skip_until = 0.0
+        self.good_streak = 0
+        self.cooldown = 0
+
+        # Metrics
+        self.sent = 0
+        self.skipped = 0
+
+    def should_send(self, now=None):
+        """Rate limit + backlog check. Call before encoding to avoid wasted work."""
+        now = time.time() if now is None else now
+        if now < self.skip_until or now - self.last_send_time < 1.0 / self.fps:
+            self.skipped += 1
+            return False
+        return True
+
+    def encode(self, frame):
+        """Returns (success, buffer) like cv2.imencode, at the current scale/quality."""
+        if self.scale < 0.999:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+
+    def record_send(self, nbytes, send_seconds, now=None):
+        """Feeds back the measured cost of one send and adjusts the operating point."""
+        now = time.time() if now is None else now
+        self.sent += 1
+        self.last_send_time = now
+        self.latency = send_seconds if self.sent == 1 else 0.8 * self.latency + 0.2 * send_seconds
+        self.bytes_per_frame = nbytes if self.sent == 1 else 0.8 * self.bytes_per_frame + 0.2 * nbytes
+
+        # Client fell behind: don't queue more while the previous frame drains
+        if send_seconds > 1.0 / self.fps:
+            self.skip_until = now + send_seconds
+
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return
+
+        if self.latency > self.TARGET_LATENCY:
+            self.good_streak = 0
+            if self._degrade():
+                self.cooldown = self.ADJUST_COOLDOWN
+        elif self.latency < self.TARGET_LATENCY * 0.5:
+            self.good_streak += 1
+            if self.good_streak >= self.UPGRADE_AFTER:
+                self.good_streak = 0
+                if self._upgrade():
+                    self.cooldown = self.ADJUST_COOLDOWN
+
+    def _degrade(self):
+        if self.quality > self.MIN_QUALITY:
+            self.quality = max(self.MIN_QUALITY, self.quality - 10)
+        elif self.scale > self.MIN_SCALE:
+            self.scale = max(self.MIN_SCALE, self.scale * 0.8)
+        elif self.fps > self.MIN_FPS:
+            self.fps = max(self.MIN_FPS, self.fps * 0.75)
+        else:
+            return False
+        return True
+
+    def _upgrade(self):
+        if self.fps < self.MAX_FPS:
+            self.fps = min(self.MAX_FPS, self.fps / 0.75)
+        elif self.scale < self.MAX_SCALE:
+            self.scale = min(self.MAX_SCALE, self.scale / 0.8)
+        elif self.quality < self.MAX_QUALITY:
+            self.quality = min(self.MAX_QUALITY, self.quality + 5)
+        else:
+            return False
+        return True
+
+    def stats(self):
+        return {
+            'quality': int(self.quality),
+            'scale': round(self.scale, 3),
+            'fps': round(self.fps, 1),
+            'send_latency_ms': round(self.latency * 1000, 1),
+            'bytes_per_frame': int(self.bytes_per_frame),
+            'sent': self.sent,
+            'skipped': self.skipped,
+        }
@@ -0,0 +1,264 @@
+import numpy as np
+import os
+import threading
+import time
+
+# 3x3 "Gaussian-like" spread of one recorded stop
+STOP_KERNEL = np.array([[0.5, 0.5, 0.5],
+                        [0.5, 1.0, 0.5],
+                        [0.5, 0.5, 0.5]], dtype=np.float32)
+
+def decay_rate(half_life):
+    """Per-second exponential decay rate for a half-life in seconds (None = no decay)."""
+    return 0.0 if not half_life else np.log(2.0) / half_life
+
+def add_stop(values, stamps, gx, gy, now, rate):
+    """
+    Adds STOP_KERNEL around cell (gx, gy). Decay is lazy: only the touched cells
+    are brought up to `now` (value * exp(-rate * age)) before the new weight.
+    """
+    g = values.shape[0]
+    y0, y1 = max(gy - 1, 0), min(gy + 2, g)
+    x0, x1 = max(gx - 1, 0), min(gx + 2, g)
+    kernel = STOP_KERNEL[y0 - gy + 1:y1 - gy + 1, x0 - gx + 1:x1 - gx + 1]
+    cells = values[y0:y1, x0:x1]
+    age = np.maximum(now - stamps[y0:y1, x0:x1], 0.0)
+    cells *= np.exp(-rate * age).astype(np.float32)
+    cells += kernel
+    stamps[y0:y1, x0:x1] = now
+
+def cell_score(values, stamps, gx, gy, now, rate):
+    """Decayed value of one cell, O(1) (nothing is written)."""
+    return float(values[gy, gx]) * float(np.exp(-rate * max(now - stamps[gy, gx], 0.0)))
+
+def merge(dst_values, dst_stamps, src_values, src_stamps, now, rate):
+    """Adds one heatmap into another, both decayed to `now`."""
+    for values, stamps in ((dst_values, dst_stamps), (src_values, src_stamps)):
+        values *= np.exp(-rate * np.maximum(now - stamps, 0.0)).astype(np.float32)
+        stamps[:] = now
+    dst_values += src_values
+
+def shift_grid(values, stamps, cells_x, cells_y):
+    """
+    Moves heatmap contents by whole cells along the last two axes (in place),
+    e.g. when the stabilised reference frame is re-anchored. Cells shifted out
+    are dropped, cells shifted in are empty.
+    """
+    for array in (values, stamps):
+        moved = np.zeros_like(array)
+        g_y, g_x = array.shape[-2:]
+        src_y = slice(max(-cells_y, 0), g_y - max(cells_y, 0))
+        dst_y = slice(max(cells_y, 0), g_y - max(-cells_y, 0))
+        src_x = slice(max(-cells_x, 0), g_x - max(cells_x, 0))
+        dst_x = slice(max(cells_x, 0), g_x - max(-cells_x, 0))
+        if abs(cells_y) < g_y and abs(cells_x) < g_x:
+            moved[..., dst_y, dst_x] = array[..., src_y, src_x]
+        array[...] = moved
+
+def camera_heatmap_dir(camera_id):
+    """Where a camera's heatmaps are persisted (backend/data/heatmaps/camera_<id>)."""
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data',
+                                         'heatmaps', f'camera_{camera_id}'))
+
+class HeatmapStore:
+    """
+    Learned stop heatmaps of one camera, keyed by where the traffic light is
+    (an "anchor": normalised, stabilised position) instead of its ByteTrack ID,
+    so a re-acquired light or a restart picks up what was already learned.
+
+    Every cell carries the time it was last updated, so exponential decay is
+    applied lazily when a cell is read or written (see add_stop / cell_score).
+    Anchors not seen for anchor_ttl seconds are recycled before the store grows.
+
+    With a directory, the arrays are memory-mapped .npy files: updates go
+    straight to the mapping, flush() makes them durable, and the next start
+    loads them back. Without one, everything stays in memory.
+
+    read_only: load the directory's heatmaps into memory and never write them
+    back (offline batch workers). What was learned since can be taken out with
+    learned() and added to the persisted store with absorb().
+    """
+    def __init__(self, directory=None, grid_size=40, capacity=16, match_radius=0.03,
+                 flush_interval=30.0, anchor_ttl=30 * 24 * 3600.0, read_only=False):
+        self.directory = None if read_only else directory
+        self.GRID_SIZE = grid_size
+        self.MATCH_RADIUS = match_radius # Normalised distance to reuse an anchor
+        self.FLUSH_INTERVAL = flush_interval # Seconds between automatic flushes
+        self.ANCHOR_TTL = anchor_ttl # Unseen this long -> slot may be recycled
+        self.lock = threading.RLock() # match() may grow -> reopen -> flush
+        self.dirty = False
+        self.last_flush = time.time()
+
+        if read_only:
+            self._load_copy(directory, capacity)
+        elif directory is None:
+            self.heatmaps, self.stamps, self.anchors = self._allocate(capacity)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.paths = {name: os.path.join(directory, f'{name}.npy')
+                          for name in ('heatmaps', 'stamps', 'anchors')}
+            self._open(capacity)
+
+    def _allocate(self, capacity):
+        g = self.GRID_SIZE
+        heatmaps = np.zeros((capacity, g, g), dtype=np.float32)
+        stamps = np.zeros((capacity, g, g), dtype=np.float64) # Last update per cell
+        anchors = np.full((capacity, 3), np.nan, dtype=np.float64) # x, y, last seen
+        return heatmaps, stamps, anchors
+
+    def _load_copy(self, directory, capacity):
+        g = self.GRID_SIZE
+        self.heatmaps, self.stamps, self.anchors = self._allocate(capacity)
+        paths = [os.path.join(directory, f'{name}.npy') for name in ('heatmaps', 'stamps', 'anchors')]
+        if directory is not None and all(os.path.exists(p) for p in paths):
+            heatmaps, stamps, anchors = (np.load(p, mmap_mode='r') for p in paths)
+            n = len(heatmaps)
+            if (heatmaps.shape == (n, g, g) and stamps.shape == (n, g, g)
+                    and anchors.shape == (n, 3)):
+                self.heatmaps, self.stamps, self.anchors = np.array(heatmaps), np.array(stamps), np.array(anchors)
+        self.rebase()
+
+    def rebase(self):
+        """learned() counts from here on (e.g. after a warm-up that another worker owns)."""
+        with self.lock:
+            self.base = (self.heatmaps.copy(), self.stamps.copy(), self.anchors.copy())
+
+    def _open(self, capacity):
+        from numpy.lib.format import open_memmap
+        g = self.GRID_SIZE
+        if all(os.path.exists(p) for p in self.paths.values()):
+            heatmaps = open_memmap(self.paths['heatmaps'], mode='r+')
+            stamps = open_memmap(self.paths['stamps'], mode='r+')
+            anchors = open_memmap(self.paths['anchors'], mode='r+')
+            n = len(heatmaps)
+            if (heatmaps.shape == (n, g, g) and stamps.shape == (n, g, g)
+                    and anchors.shape == (n, 3)):
+                self.heatmaps, self.stamps, self.anchors = heatmaps, stamps, anchors
+                print(f"Loaded {len(self)} traffic light heatmaps from {self.directory}")
+                return
+            print(f"Ignoring incompatible heatmaps in {self.directory}")
+            del heatmaps, stamps, anchors
+
+        for name, array in zip(('heatmaps', 'stamps', 'anchors'), self._allocate(capacity)):
+            mapped = open_memmap(self.paths[name], mode='w+', dtype=array.dtype, shape=array.shape)
+            mapped[:] = array
+            setattr(self, name, mapped)
+        self.flush(force=True)
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.anchors[:, 0])))
+
+    @property
+    def nbytes(self):
+        return self.heatmaps.nbytes + self.stamps.nbytes + self.anchors.nbytes
+
+    def match(self, x, y, now=None):
+        """Anchor index for a light at normalised (x, y): nearest within MATCH_RADIUS, else a new one."""
+        now = time.time() if now is None else now
+        with self.lock:
+            used = np.flatnonzero(~np.isnan(self.anchors[:, 0]))
+            if len(used):
+                d = np.hypot(self.anchors[used, 0] - x, self.anchors[used, 1] - y)
+                best = int(np.argmin(d))
+                if d[best] <= self.MATCH_RADIUS:
+                    index = int(used[best])
+                    self.anchors[index, 2] = now
+                    return index
+
+            index = self._free_slot(now)
+            self.anchors[index] = (x, y, now)
+            self.heatmaps[index] = 0
+            self.stamps[index] = now
+            self.dirty = True
+            return index
+
+    def _free_slot(self, now):
+        free = np.flatnonzero(np.isnan(self.anchors[:, 0]))
+        if len(free):
+            return int(free[0])
+        # Recycle the longest-unseen anchor if it expired, otherwise grow
+        stalest = int(np.argmin(self.anchors[:, 2]))
+        if now - self.anchors[stalest, 2] > self.ANCHOR_TTL:
+            return stalest
+        n = len(self.anchors)
+        self._grow()
+        return n
+
+    def shift(self, dx, dy):
+        """
+        The stabilised frame moved by (dx, dy) (normalised, whole cells): every
+        anchor and heatmap moves with it, so stored evidence stays where it was seen.
+        """
+        cells_x, cells_y = int(round(dx * self.GRID_SIZE)), int(round(dy * self.GRID_SIZE))
+        with self.lock:
+            self.anchors[:, 0] += dx
+            self.anchors[:, 1] += dy
+            if cells_x or cells_y:
+                shift_grid(self.heatmaps, self.stamps, cells_x, cells_y)
+            self.dirty = True
+
+    def touch(self, index, now):
+        """Marks an anchor as seen (keeps it from being recycled)."""
+        self.anchors[index, 2] = now
+
+    def _grow(self):
+        """Doubles the capacity. Callers index the arrays on every access, so no views go stale."""
+        n = len(self.anchors)
+        grown = self._allocate(n * 2)
+        for new, old in zip(grown, (self.heatmaps, self.stamps, self.anchors)):
+            new[:n] = old
+        if self.directory is None:
+            self.heatmaps, self.stamps, self.anchors = grown
+            return
+        # Write the bigger arrays next to the old ones, then swap the files in
+        for name, array in zip(('heatmaps', 'stamps', 'anchors'), grown):
+            np.save(self.paths[name] + '.tmp.npy', array)
+        del self.heatmaps, self.stamps, self.anchors
+        for path in self.paths.values():
+            os.replace(path + '.tmp.npy', path)
+        self._open(n * 2)
+
+    def learned(self, now, rate):
+        """
+        Stop evidence added since a read_only store was opened, decayed to `now`:
+        (anchors (N, 3), heatmaps (N, g, g)), only anchors that gained something.
+        """
+        with self.lock:
+            used = np.flatnonzero(~np.isnan(self.anchors[:, 0]))
+            values = self.heatmaps[used] * np.exp(-rate * np.maximum(now - self.stamps[used], 0.0))
+            base_values, base_stamps, base_anchors = self.base
+            # Rows that still hold the anchor they were opened with (not new, not recycled)
+            rows = np.flatnonzero(used < len(base_anchors))
+            old = used[rows]
+            same = np.all(self.anchors[old, :2] == base_anchors[old, :2], axis=1)
+            rows, old = rows[same], old[same]
+            values[rows] -= base_values[old] * np.exp(-rate * np.maximum(now - base_stamps[old], 0.0))
+            values = np.maximum(values, 0.0).astype(np.float32)
+            gained = values.reshape(len(used), -1).max(axis=1, initial=0.0) > 1e-6
+            return self.anchors[used[gained]].copy(), values[gained]
+
+    def absorb(self, anchors, heatmaps, now, rate):
+        """Adds learned() evidence from another store, as of `now` (matched by anchor position)."""
+        with self.lock:
+            for (x, y, _), values in zip(anchors, heatmaps):
+                index = self.match(x, y, now)
+                merge(self.heatmaps[index], self.stamps[index], np.array(values, dtype=np.float32),
+                      np.full(values.shape, now), now, rate)
+            self.dirty = True
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def flush(self, force=False, now=None):
+        """Writes pending changes to disk (every FLUSH_INTERVAL seconds unless forced)."""
+        if self.directory is None:
+            return
+        now = time.time() if now is None else now
+        if not force and (not self.dirty or now - self.last_flush < self.FLUSH_INTERVAL):
+            return
+        with self.lock:
+            self.heatmaps.flush()
+            self.stamps.flush()
+            self.anchors.flush()
+            self.dirty = False
+            self.last_flush = now
@@ -1,47 +1,141 @@
 import cv2
 import numpy as np
 from .perspective_utils import PerspectiveManager
-from ultralytics import YOLO
+from processing.inference_backend import load_model
 import os
 
 class InfrastructureLogic:
-    def __init__(self, frame_size=(1920, 1080)):
+    def __init__(self, frame_size=(1920, 1080), backend=None):
         # Initialize Perspective Manager
         self.pm = PerspectiveManager(frame_size)
         self.frame_size = frame_size
         self.bev_lines = [] 
+
+        # Stop lines are static for a fixed mount: detect on a schedule, reuse in between.
+        self.REFRESH_INTERVAL = 30 # Frames between scheduled re-detections
+        self.MOTION_THRESHOLD = 8.0 # px/frame of global motion that forces a re-detection
+        self.DRIFT_THRESHOLD = 25.0 # px of accumulated drift since last detection that forces one
+        self.CONFIDENCE_DECAY = 0.98 # Per frame without confirmation
+        self.MIN_CONFIDENCE = 0.2 # Below this the cached lines are dropped
+
+        self.cached_lines = [] # Image-space polygons from the last successful detection
+        self.confidence = 0.0
+        self.frames_since_detection = self.REFRESH_INTERVAL # Detect on the first frame
+        self.drift = np.zeros(2, dtype=np.float32) # Camera motion accumulated since detection
+
+        # Road segmentation runs at its own, slower cadence; in between the cached
+        # union mask is re-projected by the ego-motion accumulated since it was made.
+        self.SEG_INTERVAL = 90 # Frames between segmentation runs
+        self.SCENE_CHANGE_THRESHOLD = 25.0 # Mean abs diff of 32x18 thumbnails (0-255)
+        self.frame_index = 0
+        self.seg_mask = None
+        self.seg_frame_index = 0
+        self.seg_thumb = None
+        self.seg_drift = np.zeros(2, dtype=np.float32)
         
         # Load Segmentation Model
         model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'road_seg.pt')
         if os.path.exists(model_path):
-            self.seg_model = YOLO(model_path)
+            self.seg_model = load_model(model_path, backend, task='segment')
             print(f"Loaded Segmentation Model: {model_path}")
         else:
             self.seg_model = None
             print("Warning: Segmentation model not found, falling back to heuristics.")
 
-    def detect_crosswalks(self, frame, objects_to_mask=[]):
+    def detect_crosswalks(self, frame, objects_to_mask=[], motion=(0, 0)):
+        """
+        Returns stop line polygons, re-running the full detector only when due:
+        every REFRESH_INTERVAL frames or on large global motion / drift. In between,
+        cached polygons are shifted by the accumulated camera motion (dx, dy from GMC)
+        and returned. Confidence decays per frame and halves on a failed refresh;
+        below MIN_CONFIDENCE the cached lines are dropped.
+        """
+        dx, dy = motion
+        self.drift += (dx, dy)
+        self.seg_drift += (dx, dy)
+        self.frame_index += 1
+        self.frames_since_detection += 1
+        self.confidence *= self.CONFIDENCE_DECAY
+
+        if self.confidence < self.MIN_CONFIDENCE:
+            self.cached_lines = []
+        if not self.cached_lines:
+            self.drift[:] = 0 # Nothing to shift
+
+        due = (self.frames_since_detection >= self.REFRESH_INTERVAL
+               or abs(dx) > self.MOTION_THRESHOLD or abs(dy) > self.MOTION_THRESHOLD
+               or np.hypot(*self.drift) > self.DRIFT_THRESHOLD)
+
+        if due:
+            lines = self._detect_stop_lines(frame, objects_to_mask)
+            self.frames_since_detection = 0
+            if lines:
+                self.cached_lines = lines
+                self.confidence = 1.0
+                self.drift[:] = 0
+            else:
+                # Lines can be occluded by traffic: keep the old ones, trust them less
+                self.confidence *= 0.5
+
+        if not self.cached_lines:
+            return []
+        if not self.drift.any():
+            return self.cached_lines
+        offset = np.round(self.drift).astype(np.int32)
+        return [poly + offset for poly in self.cached_lines]
+
+    def _road_mask(self, frame):
+        """
+        Union of all segmentation masks at frame size.
+        Re-runs the model every SEG_INTERVAL frames, on scene change or frame size
+        change; otherwise warps the cached mask by the accumulated camera shift.
+        """
+        h, w = frame.shape[:2]
+        thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 18),
+                           interpolation=cv2.INTER_AREA).astype(np.int16)
+
+        stale = (self.seg_mask is None
+                 or self.seg_mask.shape != (h, w)
+                 or self.frame_index - self.seg_frame_index >= self.SEG_INTERVAL
+                 or np.abs(thumb - self.seg_thumb).mean() > self.SCENE_CHANGE_THRESHOLD)
+
+        if not stale:
+            if not self.seg_drift.any():
+                return self.seg_mask
+            tx, ty = self.seg_drift
+            M = np.float32([[1, 0, tx], [0, 1, ty]])
+            return cv2.warpAffine(self.seg_mask, M, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+
+        # Use segment model to find 'road' or 'markings' if classes are known.
+        # Base yolov8n-seg has COCO classes. Road is not COCO, but we can look for contrast.
+        # If we had a specialized model, we would filter by class.
+        # For now, let's use the segmentation results to refine our white filter.
+        results = self.seg_model(frame, verbose=False)
+        ai_mask = np.zeros((h, w), dtype=np.uint8)
+
+        if results and results[0].masks is not None:
+            # If specialized, we'd pick class 'stop_line'.
+            # Since this is base model, we use it to focus on all segmented segments.
+            # Union on the model's device, then ONE transfer + ONE resize.
+            union = (results[0].masks.data > 0.5).any(dim=0)
+            m = union.byte().mul(255).cpu().numpy()
+            ai_mask = cv2.resize(m, (w, h))
+
+        self.seg_mask = ai_mask
+        self.seg_frame_index = self.frame_index
+        self.seg_thumb = thumb
+        self.seg_drift[:] = 0
+        return ai_mask
+
+    def _detect_stop_lines(self, frame, objects_to_mask=[]):
         """
         DETECTS STOP LINES using AI Segmentation + BEV.
         """
         h, w = frame.shape[:2]
         
         if self.seg_model:
-            # 1. AI SEGMENTATION
-            # Use segment model to find 'road' or 'markings' if classes are known.
-            # Base yolov8n-seg has COCO classes. Road is not COCO, but we can look for contrast.
-            # If we had a specialized model, we would filter by class.
-            # For now, let's use the segmentation results to refine our white filter.
-            results = self.seg_model(frame, verbose=False)
-            ai_mask = np.zeros((h, w), dtype=np.uint8)
-            
-            if results and results[0].masks is not None:
-                # If specialized, we'd pick class 'stop_line'. 
-                # Since this is base model, we use it to focus on all segmented segments
-                for mask in results[0].masks.data:
-                    m = mask.cpu().numpy().astype(np.uint8) * 255
-                    m = cv2.resize(m, (w, h))
-                    ai_mask = cv2.bitwise_or(ai_mask, m)
+            # 1. AI SEGMENTATION (cached, see _road_mask)
+            ai_mask = self._road_mask(frame)
         else:
             ai_mask = np.ones((h, w), dtype=np.uint8) * 255
 
@@ -1,83 +1,77 @@
 import numpy as np
 import time
+from .track_store import TrackStateStore
+from .proximity import close_pairs
 
 class PedestrianLogic:
-    def __init__(self):
-        self.car_history = {} # {id: {'pos': (cx, cy), 'time': timestamp}}
-        self.MIN_SPEED_THRESHOLD = 2.0 # Pixels per frame (approx, depends on FPS)
+    def __init__(self, track_store=None):
+        # Shared with VehicleDetector, which updates it once per frame.
+        # Standalone (no store given) we keep and update our own.
+        self.owns_store = track_store is None
+        self.tracks = track_store if track_store is not None else TrackStateStore()
+        # Pixels per second (~2 px/frame at 30 FPS); a rate, so frame skipping doesn't change it
+        self.MIN_SPEED_THRESHOLD = 60.0
 
-    def check_yield_violations(self, cars, pedestrians):
+    def check_yield_violations(self, cars, pedestrians, now=None):
         """
         Checks for yield violations.
         cars: list of dicts {'id': int, 'box': [x1, y1, x2, y2], 'class': 'car'}
         pedestrians: list of dicts {'id': int, 'box': [x1, y1, x2, y2], 'class': 'person'}
         
+        now: frame capture time (epoch seconds); defaults to the wall clock.
+        
         Returns: list of violation events.
         """
         violations = []
-        current_time = time.time()
+        current_time = time.time() if now is None else now
         
         # Update History & Calculate Speed
-        car_speeds = {}
-        for car in cars:
-            cid = car['id']
-            box = car['box']
-            center = self.get_center(box)
-            
-            if cid in self.car_history:
-                last_pos = self.car_history[cid]['pos']
-                last_time = self.car_history[cid]['time']
-                dt = current_time - last_time
-                if dt > 0:
-                    dist_moved = np.linalg.norm(np.array(center) - np.array(last_pos))
-                    speed = dist_moved # pixels per frame roughly if assume constant fps, or dist/dt
-                    # Let's use simple frame-to-frame distance for robustness against jitter
-                    car_speeds[cid] = dist_moved
-            else:
-                car_speeds[cid] = 100.0 # Assume moving if new (or 0? Safer to assume moving to detect entry)
-                # Actually, if new, we can't judge speed yet. Assume 0 to be safe? 
-                # Better: Wait for next frame.
-                car_speeds[cid] = 0.0
-            
-            self.car_history[cid] = {'pos': center, 'time': current_time}
+        # Velocity = frame-to-frame displacement / capture-time delta, so it doesn't
+        # depend on how many frames were processed or skipped in between.
+        # New tracks have velocity 0: we can't judge speed yet, wait for next frame.
+        if self.owns_store:
+            tracked = [car for car in cars if car['id'] != -1]
+            self.tracks.update([car['id'] for car in tracked],
+                               [self.get_center(car['box']) for car in tracked], current_time)
+            self.tracks.evict(current_time)
 
-        # Cleanup old history
-        # (Optional: remove IDs not seen in X seconds)
+        if not cars or not pedestrians:
+            return violations
 
-        for ped in pedestrians:
-            ped_box = ped['box']
-            ped_center = self.get_center(ped_box)
-            
-            for car in cars:
-                car_box = car['box']
-                car_center = self.get_center(car_box)
-                
-                # Calculate distance
-                distance = np.linalg.norm(np.array(ped_center) - np.array(car_center))
-                
-                # Threshold for "Dangerous Proximity"
-                car_width = car_box[2] - car_box[0]
-                threshold = car_width * 2.5 # Increased slightly for safety buffer
-                
-                if distance < threshold:
-                    # CHECK 1: Is car moving?
-                    # If car is stopped (Speed < Threshold), it is YIELDING. Not a violation.
-                    speed = car_speeds.get(car['id'], 0)
-                    
-                    if speed < self.MIN_SPEED_THRESHOLD:
-                        # Car is stopped/slow near pedestrian -> Good behavior.
-                        continue
+        # CHECK 1 first: Is car moving?
+        # If car is stopped (Speed < Threshold), it is YIELDING. Not a violation.
+        speeds = np.zeros(len(cars))
+        for i, car in enumerate(cars):
+            s = self.tracks.slot(car['id'])
+            if s != -1:
+                speeds[i] = self.tracks.velocity[s]
+        moving = np.flatnonzero(speeds >= self.MIN_SPEED_THRESHOLD)
+        if len(moving) == 0:
+            return violations
 
-                    # CHECK 2: Is car moving TOWARDS pedestrian? (Vector math - Future)
-                    # For now, speed + proximity is enough.
-                    
-                    violations.append({
-                        'type': 'yield_violation',
-                        'car_id': car.get('id'),
-                        'ped_id': ped.get('id'),
-                        'distance': float(distance),
-                        'message': f"Car {car.get('id')} failed to yield"
-                    })
+        car_boxes = np.asarray([cars[i]['box'] for i in moving], dtype=np.float64)
+        ped_boxes = np.asarray([ped['box'] for ped in pedestrians], dtype=np.float64)
+        car_centres = (car_boxes[:, :2] + car_boxes[:, 2:]) / 2
+        ped_centres = (ped_boxes[:, :2] + ped_boxes[:, 2:]) / 2
+
+        # Threshold for "Dangerous Proximity", per car
+        thresholds = (car_boxes[:, 2] - car_boxes[:, 0]) * 2.5 # Increased slightly for safety buffer
+
+        # All car-pedestrian distances in one batch; only close pairs come back
+        ped_idx, car_idx, distances = close_pairs(ped_centres, car_centres, thresholds)
+
+        # CHECK 2: Is car moving TOWARDS pedestrian? (Vector math - Future)
+        # For now, speed + proximity is enough.
+        for pi, ci, distance in zip(ped_idx.tolist(), car_idx.tolist(), distances.tolist()):
+            car = cars[moving[ci]]
+            ped = pedestrians[pi]
+            violations.append({
+                'type': 'yield_violation',
+                'car_id': car.get('id'),
+                'ped_id': ped.get('id'),
+                'distance': float(distance),
+                'message': f"Car {car.get('id')} failed to yield"
+            })
                     
         return violations
 
@@ -0,0 +1,135 @@
+import cv2
+import numpy as np
+import threading
+import time
+
+class PlateCache:
+    """
+    Per-track license plate memory.
+    While a vehicle is tracked we keep its few sharpest/largest crops.
+    OCR is run on the best of them (not on whatever frame triggered the
+    violation), readings are confidence-voted per track, and a track that
+    already has a confident plate is never OCR'd again.
+    Tracks not seen for TTL seconds are evicted.
+    """
+    def __init__(self, sample_interval=0.3, max_candidates=3, ocr_best_n=2,
+                 min_confidence=0.4, ttl=10.0, min_crop_width=40):
+        self.SAMPLE_INTERVAL = sample_interval # Seconds between crop samples per track
+        self.MAX_CANDIDATES = max_candidates # Crops kept per track
+        self.OCR_BEST_N = ocr_best_n # Crops sent to OCR per read
+        self.MIN_CONFIDENCE = min_confidence # Voted confidence to trust a cached plate
+        self.TTL = ttl
+        self.MIN_CROP_WIDTH = min_crop_width
+
+        # id -> {'last_seen': t, 'last_sample': t, 'candidates': [(score, crop)], 'votes': {text: conf_sum}}
+        self.tracks = {}
+        self.lock = threading.Lock()
+        self.last_now = None # Latest frame time seen (readings arrive later, from LPR threads)
+
+    @staticmethod
+    def score_crop(crop):
+        """Sharpness (variance of Laplacian) weighted by size. Higher is better."""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        # Measure sharpness on a bounded size so big crops don't cost more
+        if gray.shape[1] > 160:
+            gray = cv2.resize(gray, (160, max(1, int(gray.shape[0] * 160 / gray.shape[1]))))
+        sharpness = cv2.Laplacian(gray, cv2.CV_32F).var()
+        return float(sharpness) * np.sqrt(crop.shape[0] * crop.shape[1])
+
+    def _entry(self, track_id, now):
+        entry = self.tracks.get(track_id)
+        if entry is None:
+            entry = {'last_seen': now, 'last_sample': -np.inf, 'candidates': [], 'votes': {}}
+            self.tracks[track_id] = entry
+        return entry
+
+    def observe(self, track_id, frame, box, now=None):
+        """Called every frame for every tracked vehicle. Cheap unless a sample is due."""
+        if track_id == -1:
+            return
+        now = time.time() if now is None else now
+        self.last_now = now
+
+        with self.lock:
+            entry = self._entry(track_id, now)
+            entry['last_seen'] = now
+            if now - entry['last_sample'] < self.SAMPLE_INTERVAL or self._has_plate(entry):
+                return
+            entry['last_sample'] = now
+
+        x1, y1, x2, y2 = box
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(w, int(x2)), min(h, int(y2))
+        if x2 - x1 < self.MIN_CROP_WIDTH or y2 <= y1:
+            return
+
+        crop = frame[y1:y2, x1:x2]
+        score = self.score_crop(crop)
+
+        with self.lock:
+            candidates = entry['candidates']
+            if len(candidates) < self.MAX_CANDIDATES:
+                candidates.append((score, crop.copy()))
+            elif score > candidates[-1][0]:
+                candidates[-1] = (score, crop.copy())
+            else:
+                return
+            candidates.sort(key=lambda c: c[0], reverse=True)
+
+    def best_crops(self, track_id, n=None):
+        """The top-n crops for OCR, best first."""
+        n = self.OCR_BEST_N if n is None else n
+        with self.lock:
+            entry = self.tracks.get(track_id)
+            if entry is None:
+                return []
+            return [crop for _, crop in entry['candidates'][:n]]
+
+    def add_reading(self, track_id, text, conf):
+        """Adds one OCR reading to the track's vote."""
+        if not text or text in ("Unknown", "Error", "LPR Error", "LPR Unavailable") or conf <= 0:
+            return
+        with self.lock:
+            entry = self._entry(track_id, time.time() if self.last_now is None else self.last_now)
+            entry['votes'][text] = entry['votes'].get(text, 0.0) + conf
+
+    def _voted(self, entry):
+        votes = entry['votes']
+        if not votes:
+            return None, 0.0
+        text = max(votes, key=votes.get)
+        # Share of the total evidence, capped by the best single-read strength
+        confidence = min(votes[text] / sum(votes.values()), votes[text])
+        return text, confidence
+
+    def _has_plate(self, entry):
+        return self._voted(entry)[1] >= self.MIN_CONFIDENCE
+
+    def get_plate(self, track_id, min_confidence=None):
+        """Returns the voted plate string, or None if not confident enough yet."""
+        min_confidence = self.MIN_CONFIDENCE if min_confidence is None else min_confidence
+        with self.lock:
+            entry = self.tracks.get(track_id)
+            if entry is None:
+                return None
+            text, confidence = self._voted(entry)
+        if text is None or confidence < min_confidence:
+            return None
+        return text
+
+    def memory_usage(self):
+        with self.lock:
+            return {
+                'tracks': len(self.tracks),
+                'crop_bytes': sum(crop.nbytes for e in self.tracks.values() for _, crop in e['candidates']),
+            }
+
+    def evict(self, now=None):
+        """Drops tracks not seen for TTL seconds. Returns the number evicted."""
+        now = time.time() if now is None else now
+        with self.lock:
+            stale = [tid for tid, e in self.tracks.items() if now - e['last_seen'] > self.TTL]
+            for tid in stale:
+                del self.tracks[tid]
+        return len(stale)
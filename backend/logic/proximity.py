@@ -0,0 +1,71 @@
+import numpy as np
+
+# Above this many (point, centre) pairs the grid is cheaper than the dense matrix
+GRID_MIN_PAIRS = 20000
+
+def close_pairs_dense(points, centres, radii):
+    """
+    All pairs with |points[i] - centres[j]| < radii[j], via one broadcast.
+    Returns (point_idx, centre_idx, distance), ordered by point then centre.
+    """
+    diff = points[:, None, :] - centres[None, :, :]
+    dist = np.hypot(diff[..., 0], diff[..., 1])
+    pi, ci = np.nonzero(dist < radii[None, :])
+    return pi, ci, dist[pi, ci]
+
+def close_pairs_grid(points, centres, radii):
+    """
+    Same result as close_pairs_dense using a uniform grid (cell = largest radius):
+    centres are bucketed by cell, each point only looks at its 3x3 neighbourhood.
+    Fully vectorised (sort + searchsorted), no per-object Python loop.
+    """
+    empty = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0))
+    if len(points) == 0 or len(centres) == 0:
+        return empty
+    cell = float(radii.max())
+    if cell <= 0:
+        return empty
+
+    # Integer cell coordinates -> single int64 key
+    origin = np.minimum(points.min(axis=0), centres.min(axis=0))
+    c_cells = np.floor((centres - origin) / cell).astype(np.int64)
+    p_cells = np.floor((points - origin) / cell).astype(np.int64)
+    stride = int(max(c_cells[:, 1].max(), p_cells[:, 1].max())) + 3
+    c_keys = (c_cells[:, 0] + 1) * stride + (c_cells[:, 1] + 1)
+
+    order = np.argsort(c_keys, kind='stable')
+    sorted_keys = c_keys[order]
+
+    # 9 neighbour keys per point
+    offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+    n_cells = p_cells[:, None, :] + offsets[None, :, :] # (P, 9, 2)
+    q_keys = ((n_cells[..., 0] + 1) * stride + (n_cells[..., 1] + 1)).ravel()
+    q_point = np.repeat(np.arange(len(points)), len(offsets))
+
+    lo = np.searchsorted(sorted_keys, q_keys, side='left')
+    hi = np.searchsorted(sorted_keys, q_keys, side='right')
+    counts = hi - lo
+    if counts.sum() == 0:
+        return empty
+
+    # Expand each [lo, hi) range into candidate (point, centre) pairs
+    cand_point = np.repeat(q_point, counts)
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    cand_centre = order[starts + np.arange(counts.sum())]
+
+    diff = points[cand_point] - centres[cand_centre]
+    dist = np.hypot(diff[:, 0], diff[:, 1])
+    hit = dist < radii[cand_centre]
+    pi, ci, dist = cand_point[hit], cand_centre[hit], dist[hit]
+
+    sort = np.lexsort((ci, pi))
+    return pi[sort], ci[sort], dist[sort]
+
+def close_pairs(points, centres, radii):
+    """Picks the dense or grid strategy by problem size."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=np.float64)
+    if len(points) * len(centres) >= GRID_MIN_PAIRS:
+        return close_pairs_grid(points, centres, radii)
+    return close_pairs_dense(points, centres, radii)
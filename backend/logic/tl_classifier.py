@@ -0,0 +1,174 @@
+import cv2
+import numpy as np
+import os
+
+COLORS = ('red', 'yellow', 'green')
+LABELS = COLORS + ('unknown',)
+
+# Fixed crop size for the batch (W, H); signal heads are tall and narrow
+CROP_SIZE = (12, 32)
+
+# Same hue bands as TrafficLightLogic.detect_raw_color (OpenCV hue 0-180)
+HUE_BANDS = {
+    'red': ((0, 10), (165, 180)),
+    'yellow': ((12, 38),),
+    'green': ((39, 100),),
+}
+MIN_SATURATION = 40
+
+FEATURE_NAMES = ('red_frac', 'yellow_frac', 'green_frac', 'bright_frac', 'max_v', 'bright_sat',
+                 'red_y', 'yellow_y', 'green_y')
+
+def stack_crops(crops, size=CROP_SIZE, out=None):
+    """Resizes every crop to `size` into one (N, H, W, 3) uint8 array (reused if `out` fits)."""
+    w, h = size
+    if out is None or out.shape[0] < len(crops) or out.shape[1:] != (h, w, 3):
+        out = np.empty((max(len(crops), 1), h, w, 3), dtype=np.uint8)
+    for i, crop in enumerate(crops):
+        cv2.resize(crop, size, dst=out[i], interpolation=cv2.INTER_AREA)
+    return out
+
+def hsv_statistics(batch):
+    """
+    Per-crop colour / brightness statistics for a stacked batch, in one pass.
+    Returns (max_v [N], counts [N, 3] bright+saturated pixels per colour,
+    features [N, len(FEATURE_NAMES)]).
+    """
+    n, h, w = batch.shape[:3]
+    # One cvtColor call for the whole batch (crops stacked vertically)
+    hsv = cv2.cvtColor(batch.reshape(n * h, w, 3), cv2.COLOR_BGR2HSV).reshape(n, h, w, 3)
+    hue, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    max_v = val.reshape(n, -1).max(axis=1).astype(np.float32)
+    # Active lamp = the brightest part of the crop
+    bright = val >= (max_v * 0.6)[:, None, None]
+    saturated = bright & (sat >= MIN_SATURATION)
+
+    rows = np.arange(h, dtype=np.float32)[None, :, None] / max(h - 1, 1)
+    counts = np.zeros((n, len(COLORS)), dtype=np.float32)
+    centroid_y = np.full((n, len(COLORS)), 0.5, dtype=np.float32)
+    for k, color in enumerate(COLORS):
+        in_band = np.zeros_like(saturated)
+        for lo, hi in HUE_BANDS[color]:
+            in_band |= (hue >= lo) & (hue <= hi)
+        mask = in_band & saturated
+        counts[:, k] = mask.sum(axis=(1, 2))
+        # Vertical position of the lit colour (red on top, green at the bottom)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cy = (mask * rows).sum(axis=(1, 2)) / counts[:, k]
+        centroid_y[:, k] = np.where(counts[:, k] > 0, cy, 0.5)
+
+    n_bright = bright.sum(axis=(1, 2)).astype(np.float32)
+    bright_sat = np.where(n_bright > 0, (sat * bright).sum(axis=(1, 2)) / np.maximum(n_bright, 1), 0.0)
+    features = np.column_stack([
+        counts / np.maximum(n_bright, 1)[:, None],
+        n_bright / (h * w),
+        max_v / 255.0,
+        bright_sat / 255.0,
+        centroid_y,
+    ]).astype(np.float32)
+    return max_v, counts, features
+
+class HeuristicColorClassifier:
+    """
+    Batched version of the HSV + brightness heuristic: all crops of a frame are
+    resized, stacked and scored with array ops (no per-crop CLAHE, no contours).
+    The relative brightness threshold (0.6 x crop max) already normalises exposure.
+    """
+    def __init__(self, min_brightness=70, min_fraction=0.02, size=CROP_SIZE):
+        self.MIN_BRIGHTNESS = min_brightness # Max V below this -> light is off / unreadable
+        self.MIN_FRACTION = min_fraction # Share of crop pixels that must carry the colour
+        self.size = size
+        self.buffer = None
+
+    def features(self, crops):
+        self.buffer = stack_crops(crops, self.size, self.buffer)
+        return hsv_statistics(self.buffer[:len(crops)])
+
+    def classify(self, crops):
+        """Returns one of 'red'/'yellow'/'green'/'unknown' per crop."""
+        states = ['unknown'] * len(crops)
+        valid = [i for i, c in enumerate(crops) if c is not None and c.size > 0]
+        if not valid:
+            return states
+        max_v, counts, _ = self.features([crops[i] for i in valid])
+        best = counts.argmax(axis=1)
+        min_pixels = self.MIN_FRACTION * self.size[0] * self.size[1]
+        ok = (max_v >= self.MIN_BRIGHTNESS) & (counts.max(axis=1) > min_pixels)
+        for i, b, good in zip(valid, best.tolist(), ok.tolist()):
+            if good:
+                states[i] = COLORS[b]
+        return states
+
+class SoftmaxColorClassifier(HeuristicColorClassifier):
+    """
+    Tiny learned alternative: multinomial logistic regression on the same batch
+    statistics (see FEATURE_NAMES), classes LABELS. Weights are a small .npz
+    (W, b, mean, std), trained by benchmarks/bench_tl_classifier.py --save.
+    """
+    def __init__(self, weights, size=CROP_SIZE):
+        super().__init__(size=size)
+        self.W = np.asarray(weights['W'], dtype=np.float32)
+        self.b = np.asarray(weights['b'], dtype=np.float32)
+        self.mean = np.asarray(weights['mean'], dtype=np.float32)
+        self.std = np.asarray(weights['std'], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({k: data[k] for k in ('W', 'b', 'mean', 'std')})
+
+    def save(self, path):
+        np.savez(path, W=self.W, b=self.b, mean=self.mean, std=self.std)
+
+    @classmethod
+    def fit(cls, features, labels, epochs=500, lr=0.5, l2=1e-3):
+        """Full-batch gradient descent. labels: indices into LABELS."""
+        X = np.asarray(features, dtype=np.float32)
+        y = np.asarray(labels)
+        mean, std = X.mean(axis=0), X.std(axis=0) + 1e-6
+        X = (X - mean) / std
+        onehot = np.eye(len(LABELS), dtype=np.float32)[y]
+        W = np.zeros((X.shape[1], len(LABELS)), dtype=np.float32)
+        b = np.zeros(len(LABELS), dtype=np.float32)
+        for _ in range(epochs):
+            p = cls._softmax(X @ W + b)
+            grad = (p - onehot) / len(X)
+            W -= lr * (X.T @ grad + l2 * W)
+            b -= lr * grad.sum(axis=0)
+        return cls({'W': W, 'b': b, 'mean': mean, 'std': std})
+
+    @staticmethod
+    def _softmax(z):
+        z = z - z.max(axis=1, keepdims=True)
+        e = np.exp(z)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, features):
+        return self._softmax(((features - self.mean) / self.std) @ self.W + self.b)
+
+    def classify(self, crops):
+        states = ['unknown'] * len(crops)
+        valid = [i for i, c in enumerate(crops) if c is not None and c.size > 0]
+        if not valid:
+            return states
+        _, _, features = self.features([crops[i] for i in valid])
+        for i, k in zip(valid, self.predict_proba(features).argmax(axis=1).tolist()):
+            states[i] = LABELS[k]
+        return states
+
+def create_color_classifier(model_path=None):
+    """
+    Uses the learned classifier if models/tl_classifier.npz (or model_path) exists,
+    otherwise the batched heuristic.
+    """
+    if model_path is None:
+        model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'tl_classifier.npz')
+    if os.path.exists(model_path):
+        try:
+            classifier = SoftmaxColorClassifier.load(model_path)
+            print(f"Loaded TL Colour Classifier: {model_path}")
+            return classifier
+        except Exception as e:
+            print(f"Failed to load TL colour classifier, using heuristic: {e}")
+    return HeuristicColorClassifier()
@@ -0,0 +1,125 @@
+import numpy as np
+
+class TrackStateStore:
+    """
+    Shared per-track state, struct-of-arrays.
+    One row (slot) per live track ID: position, last-seen time, velocity,
+    last frame-to-frame displacement, observation count and last report time.
+    ID -> slot lookup is a dict (O(1)); stale tracks are evicted by age in one
+    vectorised pass and their slots reused, so memory stays bounded on 24/7 feeds.
+    """
+    def __init__(self, capacity=256, max_age=10.0):
+        self.MAX_AGE = max_age # Seconds without an update before a track is dropped
+        self.slots = {} # track id -> slot
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.pos = np.zeros((capacity, 2), dtype=np.float64)
+        self.last_seen = np.full(capacity, -np.inf)
+        self.velocity = np.zeros(capacity) # px/s, camera-frame
+        self.step = np.zeros(capacity) # px moved since previous observation
+        self.hits = np.zeros(capacity, dtype=np.int32) # observations so far
+        self.last_report = np.full(capacity, -np.inf)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        old = (self.ids, self.active, self.pos, self.last_seen, self.velocity, self.step,
+               self.hits, self.last_report)
+        n = len(self.ids)
+        self._allocate(n * 2)
+        for new, prev in zip((self.ids, self.active, self.pos, self.last_seen, self.velocity, self.step,
+                              self.hits, self.last_report), old):
+            new[:n] = prev
+        self.free = list(range(2 * n - 1, n - 1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.ids, self.active, self.pos, self.last_seen, self.velocity,
+                                      self.step, self.hits, self.last_report))
+
+    def __contains__(self, track_id):
+        return track_id in self.slots
+
+    def slot(self, track_id, create=False):
+        """Returns the slot of track_id, or -1 if unknown (and create is False)."""
+        s = self.slots.get(track_id, -1)
+        if s == -1 and create:
+            if not self.free:
+                self._grow()
+            s = self.free.pop()
+            self.slots[track_id] = s
+            self.ids[s] = track_id
+            self.active[s] = True
+            self.hits[s] = 0
+            self.last_report[s] = -np.inf
+        return s
+
+    def update(self, ids, centres, now):
+        """
+        Records one observation per track (ids must be unique, exclude untracked -1).
+        Returns the slots, so callers can read velocity/step/hits for this frame.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        slots = np.array([self.slot(i, create=True) for i in ids.tolist()], dtype=np.int64)
+        centres = np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+
+        known = self.hits[slots] > 0
+        delta = centres - self.pos[slots]
+        step = np.where(known, np.hypot(delta[:, 0], delta[:, 1]), 0.0)
+        dt = now - self.last_seen[slots]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocity = np.where(known & (dt > 0), step / dt, 0.0)
+
+        self.pos[slots] = centres
+        self.last_seen[slots] = now
+        self.velocity[slots] = velocity
+        self.step[slots] = step
+        self.hits[slots] += 1
+        return slots
+
+    def shift(self, dx, dy):
+        """The stabilised frame was re-anchored: moves all stored positions along."""
+        self.pos += (dx, dy)
+
+    def get(self, track_id):
+        """Dict view of one track (for debugging / non-hot paths), or None."""
+        s = self.slots.get(track_id, -1)
+        if s == -1:
+            return None
+        return {
+            'pos': tuple(self.pos[s]),
+            'last_seen': float(self.last_seen[s]),
+            'velocity': float(self.velocity[s]),
+            'step': float(self.step[s]),
+            'hits': int(self.hits[s]),
+            'last_report': float(self.last_report[s]),
+        }
+
+    def last_report_time(self, track_id):
+        s = self.slots.get(track_id, -1)
+        return -np.inf if s == -1 else float(self.last_report[s])
+
+    def mark_reported(self, track_id, now):
+        s = self.slot(track_id, create=True)
+        if self.hits[s] == 0:
+            self.last_seen[s] = now # Keep it alive for at least MAX_AGE
+        self.last_report[s] = now
+
+    def evict(self, now):
+        """Drops tracks not seen for MAX_AGE seconds. Returns the number evicted."""
+        stale = np.flatnonzero(self.active & (now - self.last_seen > self.MAX_AGE))
+        for s in stale.tolist():
+            del self.slots[int(self.ids[s])]
+            self.free.append(s)
+        self.active[stale] = False
+        self.ids[stale] = -1
+        self.last_seen[stale] = -np.inf
+        self.hits[stale] = 0
+        return len(stale)
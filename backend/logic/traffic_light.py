@@ -1,137 +1,336 @@
 import cv2
+import math
 import numpy as np
 import time
+from logic.tl_classifier import create_color_classifier
+from logic.heatmap_store import HeatmapStore, add_stop, cell_score, decay_rate, merge, shift_grid
+
+# Raw states as ring-buffer codes; tallies are indexed by code
+STATES = ('unknown', 'red', 'yellow', 'green')
+STATE_CODE = {state: code for code, state in enumerate(STATES)}
+
+# Per-junction timing. Windows are in seconds, so voting does not depend on FPS.
+# transitions: (from, to) -> share of the window's samples that must agree;
+# pairs not listed are not allowed (e.g. red -> yellow). Leaving 'unknown'
+# needs a single valid sample.
+DEFAULT_TIMING = {
+    'window': 0.5, # Voting window (~5 detections at 10 FPS)
+    'min_samples': 5, # Shares are taken over at least this many samples
+    'max_window': 2.0, # Below ~10 FPS the window stretches back (up to this) to hold min_samples
+    'max_samples': 64, # Ring buffer capacity
+    'stale_timeout': 2.0, # Unknown for this long after the last change -> 'unknown'
+    'heatmap_half_life': 3 * 24 * 3600.0, # Stop evidence halves every 3 days (None = never)
+    'machine_ttl': 60.0, # State machines of lights unseen this long are evicted
+    'transitions': {
+        ('green', 'yellow'): 0.6,
+        ('green', 'red'): 0.6,
+        ('yellow', 'red'): 0.4,
+        ('yellow', 'green'): 0.8,
+        ('red', 'green'): 0.6,
+    },
+}
+
+def make_timing(overrides=None):
+    """DEFAULT_TIMING with overrides applied (transitions are merged, not replaced)."""
+    timing = dict(DEFAULT_TIMING, transitions=dict(DEFAULT_TIMING['transitions']))
+    for key, value in (overrides or {}).items():
+        if key == 'transitions':
+            timing['transitions'].update(value)
+        else:
+            timing[key] = value
+    return timing
 
 class TrafficLightStateMachine:
-    def __init__(self, tl_id):
+    def __init__(self, tl_id, timing=None, now=None):
         self.id = tl_id
         self.state = 'unknown' # current state
-        self.last_state_change = time.time()
-        self.history = [] # Buffer of last detected raw states
-        self.HISTORY_SIZE = 5
+        self.last_state_change = time.time() if now is None else now
+        self.last_seen = self.last_state_change
+        self.timing = timing if timing is not None else make_timing()
+
+        # History of raw states: fixed-size ring buffer (codes + timestamps)
+        # with running per-state tallies, so voting is O(1) per update
+        capacity = self.timing['max_samples']
+        self.codes = [0] * capacity
+        self.times = [0.0] * capacity
+        self.head = 0 # Oldest entry
+        self.count = 0
+        self.tallies = [0] * len(STATES)
         
         # BEHAVIORAL ASSOCIATION: 
-        # Grid-based heatmap (40x40) to learn where cars stop during red
+        # Grid-based heatmap (40x40) to learn where cars stop during red.
+        # Once the light's position is known (bind), the heatmap is the anchor's
+        # row in the camera's HeatmapStore, shared with earlier IDs of the same light.
+        # Cells decay exponentially (lazily, per-cell timestamps; see heatmap_store).
         self.GRID_SIZE = 40
-        self.stop_heatmap = np.zeros((self.GRID_SIZE, self.GRID_SIZE), dtype=np.float32)
+        self.decay = decay_rate(self.timing['heatmap_half_life'])
+        self.store = None
+        self.anchor = None
+        self.local_heatmap = None # Only allocated if stops are recorded before bind()
+        self.local_stamps = None
 
-    def record_stop(self, x, y, w, h):
-        """Records a vehicle stop at normalized coordinates x, y."""
+    @property
+    def stop_heatmap(self):
+        """(values, per-cell timestamps) of this light's heatmap (values not decayed)."""
+        if self.anchor is not None:
+            return self.store.heatmaps[self.anchor], self.store.stamps[self.anchor]
+        if self.local_heatmap is None:
+            self.local_heatmap = np.zeros((self.GRID_SIZE, self.GRID_SIZE), dtype=np.float32)
+            self.local_stamps = np.zeros((self.GRID_SIZE, self.GRID_SIZE), dtype=np.float64)
+        return self.local_heatmap, self.local_stamps
+
+    def bind(self, store, anchor, now=None):
+        """Attaches the persisted heatmap of anchor; anything learned before is merged in."""
+        self.store, self.anchor = store, anchor
+        if self.local_heatmap is not None:
+            now = time.time() if now is None else now
+            merge(store.heatmaps[anchor], store.stamps[anchor],
+                  self.local_heatmap, self.local_stamps, now, self.decay)
+            store.mark_dirty()
+            self.local_heatmap = self.local_stamps = None
+
+    @property
+    def nbytes(self):
+        """Memory held by this machine itself (a bound heatmap belongs to the store)."""
+        local = 0 if self.local_heatmap is None else self.local_heatmap.nbytes + self.local_stamps.nbytes
+        return local + 16 * len(self.codes) # ring buffer: two lists of 8-byte refs
+
+    def _pop_oldest(self):
+        self.tallies[self.codes[self.head]] -= 1
+        self.head = (self.head + 1) % len(self.codes)
+        self.count -= 1
+
+    def _push(self, code, now):
+        # Expire samples that left the time window, but keep the newest min_samples
+        # (up to max_window old) so slow streams still get a full vote;
+        # then make room if still full
+        horizon = now - self.timing['window']
+        max_horizon = now - self.timing['max_window']
+        keep = self.timing['min_samples'] - 1 # Plus the sample being pushed
+        while self.count and (self.times[self.head] <= max_horizon
+                              or (self.count > keep and self.times[self.head] <= horizon)):
+            self._pop_oldest()
+        if self.count == len(self.codes):
+            self._pop_oldest()
+        tail = (self.head + self.count) % len(self.codes)
+        self.codes[tail] = code
+        self.times[tail] = now
+        self.tallies[code] += 1
+        self.count += 1
+
+    def _vote_size(self):
+        """
+        Samples a share is taken over: min_samples, or as many as max_window
+        can hold at the observed frame rate if that is fewer (very slow streams).
+        """
+        needed = self.timing['min_samples']
+        if self.count >= needed:
+            return self.count
+        n = len(self.codes)
+        newest = self.times[(self.head + self.count - 1) % n]
+        if self.count >= 2 and newest > self.times[self.head]:
+            interval = (newest - self.times[self.head]) / (self.count - 1)
+            # Samples newer than now - max_window at this rate
+            needed = min(needed, math.ceil(self.timing['max_window'] / interval - 1e-9))
+        return max(self.count, needed)
+
+    @property
+    def history(self):
+        """Raw states in the window, oldest first (for debugging)."""
+        n = len(self.codes)
+        return [STATES[self.codes[(self.head + i) % n]] for i in range(self.count)]
+
+    def _cell(self, x, y):
         grid_x = int(np.clip(x * self.GRID_SIZE, 0, self.GRID_SIZE - 1))
         grid_y = int(np.clip(y * self.GRID_SIZE, 0, self.GRID_SIZE - 1))
+        return grid_x, grid_y
+
+    def record_stop(self, x, y, w, h, now=None):
+        """Records a vehicle stop at normalized coordinates x, y."""
+        now = time.time() if now is None else now
+        grid_x, grid_y = self._cell(x, y)
         
-        # Increment heatmap with a small Gaussian-like spread
-        for dy in range(-1, 2):
-            for dx in range(-1, 2):
-                nx, ny = grid_x + dx, grid_y + dy
-                if 0 <= nx < self.GRID_SIZE and 0 <= ny < self.GRID_SIZE:
-                    weight = 1.0 if (dx == 0 and dy == 0) else 0.5
-                    self.stop_heatmap[ny, nx] += weight
-
-    def get_association_score(self, x, y):
-        """Returns the association score for normalized coords x, y."""
-        grid_x = int(np.clip(x * self.GRID_SIZE, 0, self.GRID_SIZE - 1))
-        grid_y = int(np.clip(y * self.GRID_SIZE, 0, self.GRID_SIZE - 1))
-        return self.stop_heatmap[grid_y, grid_x]
+        # Increment heatmap with a small Gaussian-like spread (decaying what was there)
+        values, stamps = self.stop_heatmap
+        add_stop(values, stamps, grid_x, grid_y, now, self.decay)
+        if self.store is not None:
+            self.store.mark_dirty()
+
+    def get_association_score(self, x, y, now=None):
+        """Returns the (decayed) association score for normalized coords x, y."""
+        now = time.time() if now is None else now
+        grid_x, grid_y = self._cell(x, y)
+        values, stamps = self.stop_heatmap
+        return cell_score(values, stamps, grid_x, grid_y, now, self.decay)
 
-    def update(self, raw_state):
+    def update(self, raw_state, now=None):
         """
         Updates the state machine with a new raw detection.
         Enforces valid transitions and temporal consistency.
-        Reset to unknown if no update for > 2 seconds (Stale Data Protection).
+        Reset to unknown if no update for > stale_timeout seconds (Stale Data Protection).
         """
-        now = time.time()
+        now = time.time() if now is None else now
+        self.last_seen = now
         
         # Stale check
         if raw_state == 'unknown':
-             if now - self.last_state_change > 2.0:
+             if now - self.last_state_change > self.timing['stale_timeout']:
                  self.state = 'unknown'
                  return self.state
         
-        self.history.append(raw_state)
-        if len(self.history) > self.HISTORY_SIZE:
-            self.history.pop(0)
-
-        # Get most frequent state in history (Voting)
-        # Filter out 'unknown' if possible
-        valid_states = [s for s in self.history if s != 'unknown']
-        if not valid_states:
+        self._push(STATE_CODE.get(raw_state, 0), now)
+
+        # Get most frequent valid state in the window (Voting); ties keep the current state
+        tallies = self.tallies
+        dominant = max(range(1, len(STATES)), key=lambda c: (tallies[c], STATES[c] == self.state))
+        if tallies[dominant] == 0:
             return self.state
-            
-        dominant_state = max(set(valid_states), key=valid_states.count)
+        dominant_state = STATES[dominant]
         
         # State Machine Logic
-        if self.state != dominant_state and self.state == 'unknown':
-             self.state = dominant_state
-             self.last_state_change = time.time()
-        elif self.state == 'green':
-            if dominant_state == 'yellow' or dominant_state == 'red':
-                 if valid_states.count(dominant_state) >= 3:
-                     self.state = dominant_state
-                     self.last_state_change = time.time()
-        elif self.state == 'yellow':
-            if dominant_state == 'red':
-                if valid_states.count('red') >= 2:
-                    self.state = 'red'
-                    self.last_state_change = time.time()
-            elif dominant_state == 'green':
-                 if valid_states.count('green') >= 4:
-                     self.state = 'green'
-                     self.last_state_change = time.time()
-        elif self.state == 'red':
-            if dominant_state == 'green':
-                 if valid_states.count('green') >= 3:
-                     self.state = 'green'
-                     self.last_state_change = time.time()
+        if self.state == dominant_state:
+            return self.state
+        if self.state == 'unknown':
+            required = 0.0
+        else:
+            required = self.timing['transitions'].get((self.state, dominant_state))
+            if required is None:
+                return self.state
+
+        share = tallies[dominant] / self._vote_size()
+        if share >= required:
+            self.state = dominant_state
+            self.last_state_change = now
         
         return self.state
 
 class TrafficLightLogic:
-    def __init__(self):
+    """
+    timing: per-junction overrides of DEFAULT_TIMING (see make_timing), shared
+    by every light this instance tracks.
+    heatmap_dir: where this camera's learned lane associations are persisted
+    (None keeps them in memory only).
+    heatmaps_read_only: start from heatmap_dir but never write it (see learned_stops).
+    """
+    def __init__(self, classifier=None, timing=None, heatmap_dir=None, heatmaps_read_only=False):
         self.state_machines = {} # Map id -> TrafficLightStateMachine
+        self.timing = make_timing(timing)
+        self.heatmaps = HeatmapStore(heatmap_dir, read_only=heatmaps_read_only)
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
+        # Batched colour classifier for get_states (heuristic, or learned if weights exist)
+        self.classifier = classifier if classifier is not None else create_color_classifier()
 
-    def get_state(self, tl_id, image_crop):
+    def _machine(self, tl_id, now=None):
         if tl_id not in self.state_machines:
-            self.state_machines[tl_id] = TrafficLightStateMachine(tl_id)
-            
-        raw_state = self.detect_raw_color(image_crop)
-        final_state = self.state_machines[tl_id].update(raw_state)
-        return final_state
+            self.state_machines[tl_id] = TrafficLightStateMachine(tl_id, self.timing, now)
+        return self.state_machines[tl_id]
+
+    def bind_position(self, tl_id, x, y, frame_w, frame_h, now=None):
+        """
+        Keys tl_id's heatmap by where the light is (stabilised pixel coords),
+        so a new track ID for a known light starts with everything learned so far.
+        """
+        now = time.time() if now is None else now
+        machine = self._machine(tl_id, now)
+        machine.last_seen = now
+        if machine.anchor is None:
+            machine.bind(self.heatmaps, self.heatmaps.match(x / frame_w, y / frame_h, now), now)
+        else:
+            self.heatmaps.touch(machine.anchor, now)
+        return machine.anchor
+
+    def evict(self, now=None):
+        """Drops state machines of lights not seen for machine_ttl seconds. Returns the number evicted."""
+        now = time.time() if now is None else now
+        ttl = self.timing['machine_ttl']
+        stale = [tl_id for tl_id, m in self.state_machines.items() if now - m.last_seen > ttl]
+        for tl_id in stale:
+            del self.state_machines[tl_id]
+        return len(stale)
+
+    def memory_usage(self):
+        return {
+            'state_machines': len(self.state_machines),
+            'state_machine_bytes': sum(m.nbytes for m in self.state_machines.values()),
+            'heatmap_anchors': len(self.heatmaps),
+            'heatmap_capacity': len(self.heatmaps.anchors),
+            'heatmap_bytes': self.heatmaps.nbytes,
+        }
+
+    def flush(self, force=False):
+        """Persists learned heatmaps (rate-limited unless forced)."""
+        self.heatmaps.flush(force=force)
+
+    def shift_positions(self, dx, dy):
+        """
+        Stabilised coordinates were re-anchored by (dx, dy) (normalised, whole
+        heatmap cells): moves stored anchors and heatmaps along.
+        """
+        self.heatmaps.shift(dx, dy)
+        g = self.heatmaps.GRID_SIZE
+        for machine in self.state_machines.values():
+            if machine.anchor is None and machine.local_heatmap is not None:
+                shift_grid(machine.local_heatmap, machine.local_stamps, int(round(dx * g)), int(round(dy * g)))
+
+    def reset_learned(self):
+        """learned_stops() only reports what is learned after this call."""
+        self.heatmaps.rebase()
+
+    def learned_stops(self, now):
+        """Stops learned by a heatmaps_read_only instance, for HeatmapStore.absorb()."""
+        return self.heatmaps.learned(now, decay_rate(self.timing['heatmap_half_life']))
+
+    def get_states(self, tl_ids, image_crops, now=None):
+        """
+        Classifies all traffic-light crops of a frame in one batch, then feeds
+        each state machine. Returns the smoothed states, in input order.
+        """
+        raw_states = self.classifier.classify(image_crops)
+        return [self._machine(tl_id, now).update(raw, now) for tl_id, raw in zip(tl_ids, raw_states)]
+
+    def get_state(self, tl_id, image_crop, normalized=False, now=None):
+        """
+        Single crop, contour heuristic (detect_raw_color).
+        normalized: crop comes from an already CLAHE-enhanced frame (ImageEnhancer).
+        """
+        raw_state = self.detect_raw_color(image_crop, normalized)
+        return self._machine(tl_id, now).update(raw_state, now)
 
-    def record_vehicle_stop(self, tl_id, x, y, frame_w, frame_h):
+    def record_vehicle_stop(self, tl_id, x, y, frame_w, frame_h, now=None):
         """Learns that a car stopped at (x,y) while this light was red."""
         if tl_id in self.state_machines:
             norm_x = x / frame_w
             norm_y = y / frame_h
-            self.state_machines[tl_id].record_stop(norm_x, norm_y, frame_w, frame_h)
+            self.state_machines[tl_id].record_stop(norm_x, norm_y, frame_w, frame_h, now)
 
-    def is_associated(self, tl_id, x, y, frame_w, frame_h):
+    def is_associated(self, tl_id, x, y, frame_w, frame_h, now=None):
         """Checks if a car at (x,y) is likely in a lane controlled by tl_id."""
         if tl_id not in self.state_machines:
             return False
             
         norm_x = x / frame_w
         norm_y = y / frame_h
-        score = self.state_machines[tl_id].get_association_score(norm_x, norm_y)
+        score = self.state_machines[tl_id].get_association_score(norm_x, norm_y, now)
         
         # Threshold: At least one strong stopping event (weight 1.0)
         return score >= 1.0
 
-    def detect_raw_color(self, image_crop):
+    def detect_raw_color(self, image_crop, normalized=False):
         """
         Detects color using HSV + Brightness weighting + Circularity Check.
         Focuses on the brightest parts of the image (the active light).
+        normalized=True skips the per-crop CLAHE (the frame's luminance was already equalised).
         """
         if image_crop is None or image_crop.size == 0:
             return 'unknown'
 
         # 1. CLAHE Normalization (Enhance contrast in varying light)
-        lab = cv2.cvtColor(image_crop, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(4, 4))
-        cl = clahe.apply(l)
-        limg = cv2.merge((cl, a, b))
-        enhanced_crop = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+        if normalized:
+            enhanced_crop = image_crop
+        else:
+            lab = cv2.cvtColor(image_crop, cv2.COLOR_BGR2LAB)
+            lab[..., 0] = self.clahe.apply(np.ascontiguousarray(lab[..., 0]))
+            enhanced_crop = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
 
         hsv = cv2.cvtColor(enhanced_crop, cv2.COLOR_BGR2HSV)
         h, s, v = cv2.split(hsv)
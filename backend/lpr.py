@@ -11,6 +11,8 @@ except ImportError:
 
 # Global reader to avoid reloading model every time (Expensive!)
 reader = None
+# Stage 1 of LPR: plate localisation inside the vehicle crop (pluggable)
+localizer = None
 
 def get_reader():
     global reader
@@ -25,32 +27,112 @@ def get_reader():
             return None
     return reader
 
+ALLOWLIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# readtext_batched needs equal-sized inputs: crops are grouped by size, rounded
+# up to this step, and zero-padded to their group's canvas (never downscaled)
+BATCH_STEP = 64
+
+def get_localizer():
+    global localizer
+    if localizer is None:
+        from processing.plate_localizer import create_plate_localizer
+        localizer = create_plate_localizer()
+    return localizer
+
+def set_localizer(new_localizer):
+    """Plug in any object with locate(car_crop) -> [plate_image, ...]."""
+    global localizer
+    localizer = new_localizer
+
+def _best_text(results):
+    """Picks the most confident reading. Returns (text, confidence)."""
+    # results format: ([[x,y], [x,y]...], text, confidence)
+    best_text = ""
+    max_conf = 0.0
+    
+    for (bbox, text, conf) in results:
+        if conf > max_conf and len(text) > 3: # Ignore noise
+            max_conf = conf
+            best_text = text
+    
+    return (best_text, float(max_conf)) if best_text else ("Unknown", 0.0)
+
 def read_license_plate(image):
     """
     Reads text from an image crop (Vehicle/Plate).
     Returns the most confident text found.
     """
+    return read_license_plates([image])[0][0]
+
+def _recognize_plates(r, plates):
+    """
+    Stage 2: recognition only (no CRAFT text detection) on small rectified
+    plate patches. Returns the best (text, confidence) over the candidates.
+    """
+    best = ("Unknown", 0.0)
+    for plate in plates:
+        gray = cv2.cvtColor(plate, cv2.COLOR_BGR2GRAY) if plate.ndim == 3 else plate
+        reading = _best_text(r.recognize(gray, detail=1, allowlist=ALLOWLIST))
+        if reading[1] > best[1]:
+            best = reading
+    return best
+
+def _canvas_size(image, step=BATCH_STEP):
+    """(height, width) of the batch canvas for this crop: its size rounded up to step."""
+    h, w = image.shape[:2]
+    return (-(-h // step) * step, -(-w // step) * step)
+
+def _pad(image, height, width):
+    """Places the crop top-left on a black canvas at full resolution."""
+    canvas = np.zeros((height, width) + image.shape[2:], dtype=image.dtype)
+    canvas[:image.shape[0], :image.shape[1]] = image
+    return canvas
+
+def _size_groups(images, indices):
+    """Groups image indices by canvas size (and channel layout). Returns {key: [index, ...]}."""
+    groups = {}
+    for i in indices:
+        key = _canvas_size(images[i]) + images[i].shape[2:]
+        groups.setdefault(key, []).append(i)
+    return groups
+
+def read_license_plates(images):
+    """
+    Batched variant of read_license_plate. Each vehicle crop goes through
+    plate localisation + recognition; crops where no plate is found fall back
+    to readtext_batched, one call per group of similarly sized crops.
+    Returns a list of (text, confidence), one per image.
+    """
     if not EASYOCR_AVAILABLE:
-        return "LPR Unavailable"
+        return [("LPR Unavailable", 0.0)] * len(images)
     
     try:
         r = get_reader()
         if r is None:
-            return "LPR Error"
-            
-        # allowlist could be alphanumeric only
-        results = r.readtext(image, detail=1, allowlist='0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+            return [("LPR Error", 0.0)] * len(images)
         
-        # results format: ([[x,y], [x,y]...], text, confidence)
-        best_text = ""
-        max_conf = 0.0
+        readings = [("Unknown", 0.0)] * len(images)
+        valid = [i for i, img in enumerate(images) if img is not None and img.size > 0]
         
-        for (bbox, text, conf) in results:
-            if conf > max_conf and len(text) > 3: # Ignore noise
-                max_conf = conf
-                best_text = text
+        # Localise plates first; only crops where that fails need full text detection
+        fallback = []
+        for i in valid:
+            plates = get_localizer().locate(images[i])
+            reading = _recognize_plates(r, plates) if plates else ("Unknown", 0.0)
+            if reading[0] != "Unknown":
+                readings[i] = reading
+            else:
+                fallback.append(i)
+        if not fallback:
+            return readings
         
-        return best_text if best_text else "Unknown"
+        for (height, width, *_), group in _size_groups(images, fallback).items():
+            batch = [_pad(images[i], height, width) for i in group]
+            batch_results = r.readtext_batched(batch, detail=1, allowlist=ALLOWLIST)
+            for i, results in zip(group, batch_results):
+                readings[i] = _best_text(results)
+        return readings
     except Exception as e:
         print(f"LPR Error: {e}")
-        return "Error"
+        return [("Error", 0.0)] * len(images)
@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Drop policies when the queue is full
+DROP_NEWEST = 'drop_newest' # Reject the incoming job
+DROP_OLDEST = 'drop_oldest' # Evict the oldest queued job
+DROP_LOWEST_PRIORITY = 'drop_lowest_priority' # Evict the least important (newest among equals)
+
+def _init_worker(num_threads):
+    """Runs once per worker process: cap intra-op threads and load EasyOCR up front."""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    from lpr import get_reader
+    get_reader()
+
+def _read_batch(crops):
+    from lpr import read_license_plates
+    return read_license_plates(crops)
+
+class LPRWorkerPool:
+    """
+    License plate recognition off the detection process.
+    - OCR runs in separate processes (own EasyOCR reader each, no GIL contention
+      with the inference loop).
+    - Jobs wait in a bounded priority queue; when full, DROP policy applies.
+    - The dispatcher hands queued crops to the workers in batches (readtext_batched).
+    - At most `workers` batches are in flight, so backlog stays in our queue
+      (bounded) and not in the executor's internal one (unbounded).
+
+    Callbacks receive (text, confidence). Dropped jobs get (None, 0.0) so the
+    caller can still produce a report with a fallback ID.
+    Callbacks run on a pool-internal thread and must hand off heavy work.
+    """
+    def __init__(self, workers=1, max_queue=32, batch_size=4, batch_wait=0.05,
+                 drop_policy=DROP_OLDEST, threads_per_worker=2, read_batch=_read_batch,
+                 initializer=_init_worker):
+        self.MAX_QUEUE = max_queue
+        self.BATCH_SIZE = batch_size
+        self.BATCH_WAIT = batch_wait # Seconds to wait for a fuller batch
+        self.drop_policy = drop_policy
+        self.read_batch = read_batch # crops -> [(text, confidence), ...], runs in the workers
+
+        # spawn: forking a process that already holds torch/YOLO threads can deadlock
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initializer,
+            initargs=(threads_per_worker,) if initializer else ()
+        )
+        self.slots = threading.Semaphore(workers)
+
+        self.queue = [] # heap of (priority, seq, crop, callback)
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.running = True
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.in_flight = 0
+        self.max_depth = 0
+
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="lpr-dispatch", daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, crop, callback, priority=1):
+        """
+        Queues a crop for OCR. Lower priority value = more important.
+        Returns False if the job was rejected; its callback still gets (None, 0.0),
+        also when the pool has been shut down.
+        """
+        with self.cond:
+            job = (priority, next(self.seq), crop, callback)
+            evicted = job if not self.running else self._enqueue(job)
+
+        if evicted is not None:
+            self._notify(evicted[3], (None, 0.0))
+        return evicted is not job
+
+    def _enqueue(self, job):
+        """Adds job under the lock, applying the drop policy. Returns the dropped job or None."""
+        self.submitted += 1
+        evicted = None
+        if len(self.queue) >= self.MAX_QUEUE:
+            if self.drop_policy == DROP_NEWEST:
+                evicted = job
+            elif self.drop_policy == DROP_OLDEST:
+                oldest = min(self.queue, key=lambda j: j[1])
+                self.queue.remove(oldest)
+                heapq.heapify(self.queue)
+                evicted = oldest
+            else: # DROP_LOWEST_PRIORITY
+                worst = max(self.queue, key=lambda j: (j[0], j[1]))
+                if (job[0], job[1]) >= (worst[0], worst[1]):
+                    evicted = job
+                else:
+                    self.queue.remove(worst)
+                    heapq.heapify(self.queue)
+                    evicted = worst
+
+        if evicted is not job:
+            heapq.heappush(self.queue, job)
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.cond.notify()
+
+        if evicted is not None:
+            self.dropped += 1
+        return evicted
+
+    def _take_batch(self):
+        with self.cond:
+            while self.running and not self.queue:
+                self.cond.wait(0.5)
+            if not self.running:
+                return []
+
+            # Wait briefly for a fuller batch (violations tend to come in bursts)
+            deadline = time.time() + self.BATCH_WAIT
+            while self.running and len(self.queue) < self.BATCH_SIZE:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            if not self.running:
+                return []
+
+            batch = [heapq.heappop(self.queue) for _ in range(min(self.BATCH_SIZE, len(self.queue)))]
+            self.in_flight += len(batch)
+            return batch
+
+    def _dispatch_loop(self):
+        while self.running:
+            # Only pull from the queue when a worker is free
+            if not self.slots.acquire(timeout=0.5):
+                continue
+            batch = self._take_batch()
+            if not batch:
+                self.slots.release()
+                continue
+
+            crops = [job[2] for job in batch]
+            callbacks = [job[3] for job in batch]
+            try:
+                future = self.executor.submit(self.read_batch, crops)
+            except Exception as e:
+                print(f"LPR pool submit failed: {e}")
+                self._finish(callbacks, [("Error", 0.0)] * len(callbacks))
+                continue
+            future.add_done_callback(lambda f, cbs=callbacks: self._on_batch_done(f, cbs))
+
+    def _on_batch_done(self, future, callbacks):
+        try:
+            readings = future.result()
+        except Exception as e:
+            print(f"LPR worker failed: {e}")
+            readings = [("Error", 0.0)] * len(callbacks)
+        self._finish(callbacks, readings)
+
+    def _finish(self, callbacks, readings):
+        with self.cond:
+            self.in_flight -= len(callbacks)
+            self.completed += len(callbacks)
+            self.batches += 1
+        self.slots.release()
+        for callback, reading in zip(callbacks, readings):
+            self._notify(callback, reading)
+
+    def _notify(self, callback, reading):
+        try:
+            callback(reading)
+        except Exception as e:
+            print(f"Error in LPR callback: {e}")
+
+    def stats(self):
+        with self.cond:
+            return {
+                'queue_depth': len(self.queue),
+                'max_queue_depth': self.max_depth,
+                'queue_capacity': self.MAX_QUEUE,
+                'in_flight': self.in_flight,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'avg_batch_size': (self.completed / self.batches) if self.batches else 0.0,
+                'drop_policy': self.drop_policy,
+            }
+
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            pending, self.queue = self.queue, []
+            self.cond.notify_all()
+        for job in pending:
+            self._notify(job[3], (None, 0.0))
+        self.dispatcher.join(timeout=2.0)
+        self.executor.shutdown(wait=False, cancel_futures=True)
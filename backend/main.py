@@ -4,8 +4,13 @@ import cv2
 import base64
 import json
 import asyncio
+import time
 import traceback
 from detector import VehicleDetector
+from encoding import AdaptiveEncoder
+from lpr_pool import LPRWorkerPool, DROP_LOWEST_PRIORITY
+from pipeline import CameraSessionRegistry
+from processing.batch_inference import BatchInferenceScheduler
 
 app = FastAPI()
 
@@ -18,80 +23,133 @@ app.add_middleware(
 )
 
 # Global instances
-detector = None
+# One YOLO model for all cameras, batched across streams
+scheduler = None
+# OCR processes shared by all cameras
+lpr_pool = None
+
+def create_detector(camera_id):
+    # Per-camera logic + tracker state, detection goes through the shared scheduler
+    return VehicleDetector(scheduler=scheduler, lpr_pool=lpr_pool, camera_id=camera_id)
+
+# One capture + one VehicleDetector per camera, shared by all its viewers
+sessions = CameraSessionRegistry(detector_factory=create_detector)
+
+# Bounds for the per-client adaptive encoder
+ENCODER_CONFIG = {
+    'min_quality': 40, 'max_quality': 85,
+    'min_scale': 0.4, 'max_scale': 1.0,
+    'min_fps': 5.0, 'max_fps': 30.0,
+    'target_latency': 0.05,
+}
 
 @app.on_event("startup")
 async def startup_event():
-    global detector
+    global scheduler, lpr_pool
     # Load model on startup
     try:
-        detector = VehicleDetector()
+        scheduler = BatchInferenceScheduler('yolov8n.pt', max_batch=8)
     except Exception as e:
-        print(f"Failed to load detector: {e}")
+        print(f"Failed to load detection model: {e}")
         traceback.print_exc()
 
+    try:
+        lpr_pool = LPRWorkerPool(workers=1, max_queue=32, batch_size=4,
+                                 drop_policy=DROP_LOWEST_PRIORITY)
+    except Exception as e:
+        print(f"Failed to start LPR worker pool: {e}")
+        traceback.print_exc()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    sessions.close_all()
+    if scheduler:
+        scheduler.stop()
+    if lpr_pool:
+        lpr_pool.shutdown()
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, camera_id: int = 0):
+async def websocket_endpoint(websocket: WebSocket, camera_id: int = 0, mode: str = "text"):
     """
     WebSocket endpoint for live camera feed
     camera_id: 0 for default camera, 1, 2, etc. for other cameras
+    mode: "text" (default) - one JSON message per frame with a base64 data URL
+          "binary" - raw JPEG bytes as a binary message per frame, plus a
+                     JSON text message {"violations": [...]} only when non-empty
     """
     await websocket.accept()
-    print(f"WebSocket connected. Camera ID: {camera_id}")
+    print(f"WebSocket connected. Camera ID: {camera_id}, mode: {mode}")
 
-    # Open camera
-    cap = cv2.VideoCapture(camera_id)
+    if mode not in ("text", "binary"):
+        await websocket.send_text(json.dumps({"error": f"Unknown mode '{mode}'"}))
+        await websocket.close()
+        return
+
+    loop = asyncio.get_running_loop()
+    encoder = AdaptiveEncoder(**ENCODER_CONFIG)
+    pending_violations = [] # Carried over from frames we skipped
 
-    if not cap.isOpened():
+    # Join the camera session (opens the camera for the first viewer)
+    pipeline, results = await loop.run_in_executor(None, sessions.subscribe, camera_id)
+
+    if pipeline is None:
         error_msg = {"error": f"Failed to open camera {camera_id}"}
         await websocket.send_text(json.dumps(error_msg))
         await websocket.close()
         return
 
-    # Set camera properties (optional)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-
-    print(f"Camera {camera_id} opened successfully")
-
     try:
         while True:
-            # Read frame from camera
-            ret, frame = cap.read()
-
-            if not ret:
-                print("Failed to read frame from camera")
-                await asyncio.sleep(0.1)
+            # Wait for the newest processed frame without blocking the event loop
+            result = await loop.run_in_executor(None, results.get, 0.5)
+            if result is None:
+                if results.closed:
+                    break # Session was shut down
                 continue
 
-            # Process frame
-            if detector:
-                annotated_frame, violations = detector.process_frame(frame)
-            else:
-                annotated_frame = frame
-                violations = []
+            annotated_frame, violations = result
+            pending_violations.extend(violations)
+
+            if mode == "binary" and pending_violations:
+                # Violations are small, never hold them back for the video rate
+                await websocket.send_text(json.dumps({
+                    "violations": pending_violations,
+                    "camera_id": camera_id
+                }))
+                pending_violations = []
+
+            # Client is behind or above its current frame rate: don't even encode
+            if not encoder.should_send():
+                continue
 
-            # Encode frame to JPEG
-            success, buffer = cv2.imencode('.jpg', annotated_frame,
-                                           [cv2.IMWRITE_JPEG_QUALITY, 85])
+            # Encode frame to JPEG (off the event loop thread)
+            success, buffer = await loop.run_in_executor(None, encoder.encode, annotated_frame)
             if not success:
                 continue
 
+            if mode == "binary":
+                # No base64 / JSON escaping: the JPEG goes out as-is
+                data = buffer.tobytes()
+                send_start = time.perf_counter()
+                await websocket.send_bytes(data)
+                encoder.record_send(len(data), time.perf_counter() - send_start)
+                continue
+
             # Convert to base64
             frame_b64 = base64.b64encode(buffer).decode('utf-8')
 
             # Send data
             payload = {
                 "image": f"data:image/jpeg;base64,{frame_b64}",
-                "violations": violations,
+                "violations": pending_violations,
                 "camera_id": camera_id
             }
+            pending_violations = []
 
-            await websocket.send_text(json.dumps(payload))
-
-            # Control frame rate (~30fps)
-            await asyncio.sleep(0.033)
+            data = json.dumps(payload)
+            send_start = time.perf_counter()
+            await websocket.send_text(data)
+            encoder.record_send(len(data), time.perf_counter() - send_start)
 
     except WebSocketDisconnect:
         print("WebSocket disconnected")
@@ -99,14 +157,30 @@ async def websocket_endpoint(websocket: WebSocket, camera_id: int = 0):
         print(f"Error in websocket loop: {e}")
         traceback.print_exc()
     finally:
-        # Release camera
-        cap.release()
-        print(f"Camera {camera_id} released")
+        print(f"Encoder stats (camera {camera_id}): {encoder.stats()}")
+        # Leave the session (camera is released with the last viewer)
+        await loop.run_in_executor(None, sessions.unsubscribe, camera_id, results)
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "service": "Vehicle Violation Detection System (Live Camera)"}
 
+@app.get("/sessions")
+def list_sessions():
+    """Active camera sessions and their subscriber counts"""
+    return {
+        "sessions": sessions.stats(),
+        "inference": scheduler.stats() if scheduler else None
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Queue depths and throughput of the shared inference / LPR stages"""
+    return {
+        "inference": scheduler.stats() if scheduler else None,
+        "lpr": lpr_pool.stats() if lpr_pool else None
+    }
+
 @app.get("/cameras")
 def list_cameras():
     """Check available cameras"""
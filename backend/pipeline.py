@@ -0,0 +1,252 @@
+import cv2
+import threading
+import time
+import traceback
+from clock import CaptureClock
+
+
+class LatestFrameQueue:
+    """
+    Bounded, thread-safe queue that always favours the newest item.
+    When full, the oldest entry is dropped instead of blocking the producer,
+    so a slow consumer never causes stale frames to pile up.
+    """
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                self.items.pop(0)
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the oldest queued item, or None on timeout / close."""
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.pop(0)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.items = []
+            self.cond.notify_all()
+
+
+class FramePipeline:
+    """
+    Per-camera frame engine.
+    Stage 1 (capture thread): cap.read() as fast as the camera delivers.
+    Stage 2 (inference thread): detector.process_frame() on the newest frame,
+             broadcast to every subscriber queue.
+    Stage 3 (encode/send): each subscriber pulls from its own queue (see main.py).
+    Stages are connected by LatestFrameQueue(1), so under load end-to-end
+    latency is bounded by inference time instead of the sum of all stages.
+    Frames are timestamped at capture (clock), and the detector works on that
+    time, so dropped frames or slow inference don't change its decisions.
+    """
+    def __init__(self, camera_id, detector=None, clock=None):
+        self.camera_id = camera_id
+        self.detector = detector
+        self.clock = clock if clock is not None else CaptureClock()
+
+        self.frames = LatestFrameQueue(maxsize=1)
+        self.subscribers = []
+        self.subscribers_lock = threading.Lock()
+
+        self.cap = None
+        self.running = False
+        self.threads = []
+
+    def open(self):
+        """Opens the camera. Returns False if the device is unavailable."""
+        self.cap = cv2.VideoCapture(self.camera_id)
+        if not self.cap.isOpened():
+            return False
+
+        # Set camera properties (optional)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        self.cap.set(cv2.CAP_PROP_FPS, 30)
+        # Keep the driver-side buffer short as well, we only want fresh frames
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+
+    def subscribe(self):
+        """Returns a new result queue that receives (annotated_frame, violations)."""
+        q = LatestFrameQueue(maxsize=1)
+        with self.subscribers_lock:
+            self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        """Detaches a subscriber. Returns the number of remaining subscribers."""
+        with self.subscribers_lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+            remaining = len(self.subscribers)
+        q.close()
+        return remaining
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name=f"capture-{self.camera_id}", daemon=True),
+            threading.Thread(target=self._inference_loop, name=f"inference-{self.camera_id}", daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.running = False
+        self.frames.close()
+        with self.subscribers_lock:
+            for q in self.subscribers:
+                q.close()
+            self.subscribers = []
+        for t in self.threads:
+            t.join(timeout=2.0)
+        self.threads = []
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.detector is not None and hasattr(self.detector, 'close'):
+            try:
+                self.detector.close()
+            except Exception as e:
+                print(f"Error closing detector (camera {self.camera_id}): {e}")
+
+    def _capture_loop(self):
+        index = 0
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                print(f"Failed to read frame from camera {self.camera_id}")
+                time.sleep(0.1)
+                continue
+            self.frames.put((frame, self.clock.timestamp(self.cap, index)))
+            index += 1
+
+    def _inference_loop(self):
+        while self.running:
+            item = self.frames.get(timeout=0.5)
+            if item is None:
+                continue
+            frame, timestamp = item
+
+            try:
+                if self.detector:
+                    annotated_frame, violations = self.detector.process_frame(frame, timestamp=timestamp)
+                else:
+                    annotated_frame = frame
+                    violations = []
+            except Exception as e:
+                print(f"Error in inference loop (camera {self.camera_id}): {e}")
+                traceback.print_exc()
+                continue
+
+            # Fan out: one inference, N viewers. Subscribers treat the frame as read-only.
+            with self.subscribers_lock:
+                for q in self.subscribers:
+                    q.put((annotated_frame, violations))
+
+    def stats(self):
+        with self.subscribers_lock:
+            subscribers = len(self.subscribers)
+            dropped_results = sum(q.dropped for q in self.subscribers)
+        return {
+            'camera_id': self.camera_id,
+            'subscribers': subscribers,
+            'dropped_capture_frames': self.frames.dropped,
+            'dropped_results': dropped_results,
+            'memory': self.detector.memory_usage() if hasattr(self.detector, 'memory_usage') else None,
+            'detection': (self.detector.detection_schedule.stats()
+                          if hasattr(self.detector, 'detection_schedule') else None),
+        }
+
+
+class CameraSessionRegistry:
+    """
+    Owns at most one FramePipeline (one capture + one VehicleDetector) per camera.
+    The first subscriber opens the camera, the last one to leave releases it.
+    Opening (camera + model load) and releasing run under a per-camera lock
+    only, so a slow camera never blocks viewers of the others.
+    """
+    def __init__(self, detector_factory=None):
+        self.detector_factory = detector_factory # camera_id -> VehicleDetector
+        self.sessions = {} # camera_id -> FramePipeline
+        self.camera_locks = {} # camera_id -> Lock, serialises open / release of that camera
+        self.lock = threading.Lock() # Guards the two dicts above
+
+    def _camera_lock(self, camera_id):
+        with self.lock:
+            return self.camera_locks.setdefault(camera_id, threading.Lock())
+
+    def _create_detector(self, camera_id):
+        if self.detector_factory is None:
+            return None
+        try:
+            return self.detector_factory(camera_id)
+        except Exception as e:
+            print(f"Failed to load detector: {e}")
+            traceback.print_exc()
+            return None
+
+    def subscribe(self, camera_id):
+        """
+        Joins (or opens) the session for camera_id.
+        Returns (pipeline, queue), or (None, None) if the camera cannot be opened.
+        Blocking: call from a worker thread, not the event loop.
+        """
+        with self._camera_lock(camera_id):
+            with self.lock:
+                pipeline = self.sessions.get(camera_id)
+                if pipeline is not None:
+                    return pipeline, pipeline.subscribe()
+
+            pipeline = FramePipeline(camera_id)
+            if not pipeline.open():
+                pipeline.stop()
+                return None, None
+            print(f"Camera {camera_id} opened successfully")
+            # Only pay for the model once we know the camera works
+            pipeline.detector = self._create_detector(camera_id)
+            pipeline.start()
+            q = pipeline.subscribe()
+            with self.lock:
+                self.sessions[camera_id] = pipeline
+            return pipeline, q
+
+    def unsubscribe(self, camera_id, q):
+        """Leaves the session. Releases the camera when the last subscriber leaves."""
+        with self._camera_lock(camera_id):
+            with self.lock:
+                pipeline = self.sessions.get(camera_id)
+                if pipeline is None or pipeline.unsubscribe(q) > 0:
+                    return
+                del self.sessions[camera_id]
+            # Still under the camera lock: a new viewer reopens only once the device is free
+            pipeline.stop()
+            print(f"Camera {camera_id} released")
+
+    def close_all(self):
+        with self.lock:
+            pipelines, self.sessions = list(self.sessions.values()), {}
+        for pipeline in pipelines:
+            pipeline.stop()
+
+    def stats(self):
+        with self.lock:
+            pipelines = list(self.sessions.values())
+        return [p.stats() for p in pipelines]
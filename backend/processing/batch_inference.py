@@ -0,0 +1,106 @@
+from processing.inference_backend import load_model
+from concurrent.futures import Future
+import threading
+import time
+
+class BatchInferenceScheduler:
+    """
+    Multi-stream detection scheduler.
+    Every camera pipeline calls predict(frame) from its own inference thread.
+    The scheduler collects the pending frame of each active camera, runs ONE
+    batched forward pass and routes each result back to its caller.
+    Tracking is not done here: each camera's ObjectTracker keeps its own
+    ByteTrack state, so cameras never match or age out each other's tracks.
+    """
+    def __init__(self, model_path='yolov8n.pt', max_batch=8, max_wait=0.01, conf=0.15, backend=None):
+        # Exported backends get a static batch of max_batch (partial batches are padded)
+        self.model = load_model(model_path, backend, task='detect', batch=max_batch)
+        self.MAX_BATCH = max_batch
+        self.MAX_WAIT = max_wait # Seconds to wait for other cameras after the first frame arrives
+        self.conf = conf
+
+        self.pending = [] # [(frame, Future)]
+        self.cond = threading.Condition()
+        self.running = True
+
+        # Metrics
+        self.batches = 0
+        self.frames = 0
+
+        self.worker = threading.Thread(target=self._run, name="batch-inference", daemon=True)
+        self.worker.start()
+
+    def _submit(self, frames):
+        futures = [Future() for _ in frames]
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("BatchInferenceScheduler is stopped")
+            self.pending.extend(zip(frames, futures))
+            self.cond.notify()
+        return futures
+
+    def predict(self, frame, timeout=None):
+        """Blocking. Returns the Results object for this frame."""
+        return self._submit([frame])[0].result(timeout=timeout)
+
+    def predict_many(self, frames, timeout=None):
+        """Blocking. Several images of one caller (e.g. ROI crops), batched with the other cameras."""
+        return [future.result(timeout=timeout) for future in self._submit(frames)]
+
+    def _collect(self):
+        with self.cond:
+            while self.running and not self.pending:
+                self.cond.wait(0.5)
+            if not self.running:
+                return []
+
+            # Give the other streams a short window to join this batch
+            deadline = time.time() + self.MAX_WAIT
+            while len(self.pending) < self.MAX_BATCH:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = self.pending[:self.MAX_BATCH]
+            self.pending = self.pending[self.MAX_BATCH:]
+            return batch
+
+    def _run(self):
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            frames = [frame for frame, _ in batch]
+            try:
+                results = self.model.predict(frames, conf=self.conf, verbose=False)
+            except Exception as e:
+                print(f"Batched inference failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(frames)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            pending, self.pending = self.pending, []
+            self.cond.notify_all()
+        for _, future in pending:
+            future.set_exception(RuntimeError("BatchInferenceScheduler stopped"))
+        self.worker.join(timeout=2.0)
+
+    def stats(self):
+        with self.cond:
+            queued = len(self.pending)
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'avg_batch_size': (self.frames / self.batches) if self.batches else 0.0,
+            'queued': queued,
+        }
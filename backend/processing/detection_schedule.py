@@ -0,0 +1,138 @@
+import math
+import numpy as np
+
+class DetectionScheduler:
+    """
+    Decides, frame by frame, whether to run the detector (YOLO + ByteTrack) or to
+    propagate the last boxes instead (see BoxPropagator).
+
+    interval: fixed N (detect every N-th frame), or None to adapt:
+    - load: detection cost is spread over N frames so the per-frame average fits
+      the frame budget (1 / target_fps), given the cost of the non-detection work;
+    - activity: fast movers cap N at fast_interval; an empty scene uses max_interval
+      (new arrivals are still picked up within max_interval frames).
+    """
+    def __init__(self, interval=None, min_interval=1, max_interval=4, target_fps=30.0,
+                 fast_speed=250.0, fast_interval=2):
+        self.fixed = interval
+        self.MIN_INTERVAL = min_interval
+        self.MAX_INTERVAL = max_interval
+        self.FRAME_BUDGET = 1.0 / target_fps
+        self.FAST_SPEED = fast_speed # px/s (image space) that counts as fast
+        self.FAST_INTERVAL = fast_interval
+
+        self.interval = interval if interval is not None else min_interval
+        self.since_detection = None # Frames since the last detection (None = never)
+        self.detect_time = None # EWMA of detector seconds
+        self.other_time = None # EWMA of per-frame seconds excluding the detector
+        self.alpha = 0.2
+
+        # Metrics
+        self.detected = 0
+        self.propagated = 0
+
+    def should_detect(self):
+        if self.since_detection is None or self.since_detection + 1 >= self.interval:
+            self.since_detection = 0
+            self.detected += 1
+            return True
+        self.since_detection += 1
+        self.propagated += 1
+        return False
+
+    def _ewma(self, old, value):
+        return value if old is None else (1 - self.alpha) * old + self.alpha * value
+
+    def record(self, frame_seconds, detect_seconds=None, n_objects=0, max_speed=0.0):
+        """
+        Called once per frame with the total processing time, and on detection
+        frames also with the detector's share, the object count and fastest mover.
+        """
+        if detect_seconds is not None:
+            self.detect_time = self._ewma(self.detect_time, detect_seconds)
+            frame_seconds -= detect_seconds
+        self.other_time = self._ewma(self.other_time, frame_seconds)
+        if self.fixed is not None or detect_seconds is None:
+            return
+
+        # Load: smallest N with detect_time / N + other_time <= budget
+        spare = self.FRAME_BUDGET - self.other_time
+        if spare <= 0:
+            interval = self.MAX_INTERVAL
+        else:
+            interval = math.ceil(self.detect_time / spare)
+
+        # Activity
+        if n_objects == 0:
+            interval = self.MAX_INTERVAL
+        elif max_speed > self.FAST_SPEED:
+            interval = min(interval, self.FAST_INTERVAL)
+        self.interval = int(np.clip(interval, self.MIN_INTERVAL, self.MAX_INTERVAL))
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'adaptive': self.fixed is None,
+            'detected_frames': self.detected,
+            'propagated_frames': self.propagated,
+            'detect_ms': None if self.detect_time is None else self.detect_time * 1000,
+            'other_ms': None if self.other_time is None else self.other_time * 1000,
+        }
+
+class BoxPropagator:
+    """
+    Carries detections across skipped frames: each box moves with the camera
+    (GMC shift since the detection) plus its own constant velocity, estimated
+    from the track's displacement between its last two detections.
+    """
+    def __init__(self, smoothing=0.5):
+        self.smoothing = smoothing # EWMA weight of the newest velocity sample
+        self.boxes = np.zeros((0, 4))
+        self.classes = np.zeros(0, dtype=int)
+        self.ids = np.zeros(0, dtype=int)
+        self.confs = np.zeros(0, dtype=np.float32)
+        self.velocity = np.zeros((0, 2)) # px/s, image space, own motion only
+        self.time = None # Timestamp of the last detection
+        self.camera = np.zeros(2) # Camera shift accumulated since the last detection
+        self.frame_shape = None
+
+    def add_camera_motion(self, dx, dy):
+        """Per-frame GMC shift (call on every frame, detected or not)."""
+        self.camera += (dx, dy)
+
+    def update(self, boxes, classes, ids, confs, now, frame_shape):
+        """New detections: re-estimate per-track velocities and reset the reference."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        velocity = np.zeros((len(boxes), 2))
+        if self.time is not None and now > self.time and len(self.ids) and len(boxes):
+            prev = {i: k for k, i in enumerate(self.ids.tolist()) if i != -1}
+            rows = [(k, prev[i]) for k, i in enumerate(np.asarray(ids).tolist()) if i in prev]
+            if rows:
+                cur, old = np.array(rows).T
+                centres = (boxes[cur, :2] + boxes[cur, 2:]) / 2
+                old_centres = (self.boxes[old, :2] + self.boxes[old, 2:]) / 2
+                measured = (centres - old_centres - self.camera) / (now - self.time)
+                velocity[cur] = self.smoothing * measured + (1 - self.smoothing) * self.velocity[old]
+
+        self.boxes, self.classes, self.ids, self.confs = boxes, np.asarray(classes), np.asarray(ids), np.asarray(confs)
+        self.velocity = velocity
+        self.time = now
+        self.camera = np.zeros(2)
+        self.frame_shape = frame_shape[:2]
+
+    def predict(self, now):
+        """Boxes at time `now` as (boxes int32, classes, ids, confs), like extract_detections."""
+        if self.time is None or len(self.boxes) == 0:
+            return (np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=int),
+                    np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32))
+        shift = self.camera + self.velocity * (now - self.time)
+        boxes = self.boxes + np.tile(shift, 2)
+        h, w = self.frame_shape
+        boxes[:, 0::2] = np.clip(boxes[:, 0::2], 0, w)
+        boxes[:, 1::2] = np.clip(boxes[:, 1::2], 0, h)
+        return boxes.astype(np.int32), self.classes, self.ids, self.confs
+
+    def max_speed(self):
+        if len(self.velocity) == 0:
+            return 0.0
+        return float(np.hypot(self.velocity[:, 0], self.velocity[:, 1]).max())
@@ -0,0 +1,34 @@
+import numpy as np
+
+def extract_detections(results):
+    """
+    Converts a Results object to NumPy arrays in one device->host copy.
+    Returns (boxes int32 [N,4], classes int [N], ids int [N] (-1 = untracked), confs float [N]).
+    """
+    if not results.boxes:
+        return (np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=int),
+                np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32))
+
+    # Tracked rows: x1, y1, x2, y2, id, conf, cls / untracked: x1, y1, x2, y2, conf, cls
+    data = results.boxes.data.cpu().numpy()
+    boxes = data[:, :4].astype(np.int32)
+    confs = data[:, -2]
+    classes = data[:, -1].astype(int)
+    if results.boxes.is_track:
+        ids = data[:, 4].astype(int)
+    else:
+        ids = np.full(len(data), -1, dtype=int)
+    return boxes, classes, ids, confs
+
+def filter_detections(classes, confs, vehicle_classes, person_class, traffic_light_class):
+    """
+    Class-specific confidence filtering: vehicles 0.25 (standard), traffic lights
+    0.15 (more aggressive), pedestrians 0.2; other classes are dropped.
+    Returns (keep, is_vehicle, is_person, is_tl) boolean masks over the detections.
+    """
+    is_vehicle = np.isin(classes, vehicle_classes)
+    is_person = classes == person_class
+    is_tl = classes == traffic_light_class
+    thresholds = np.where(is_vehicle, 0.25, np.where(is_tl, 0.15, 0.2))
+    keep = (confs >= thresholds) & (is_vehicle | is_person | is_tl)
+    return keep, is_vehicle, is_person, is_tl
@@ -2,26 +2,94 @@ import cv2
 import numpy as np
 
 class ImageEnhancer:
-    def __init__(self):
+    """
+    Single-pass frame preprocessing.
+    CLAHE runs on the L channel of a reused LAB buffer (no split/merge copies)
+    and is skipped while a cheap thumbnail histogram says the scene is well
+    exposed.
+
+    adaptive: False enhances every frame (previous behaviour).
+    """
+    def __init__(self, adaptive=True, analysis_interval=15):
         self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self.adaptive = adaptive
+        self.ANALYSIS_INTERVAL = analysis_interval # Frames between exposure checks
+
+        # Exposure thresholds (8-bit luminance of a thumbnail)
+        self.MIN_BRIGHTNESS = 70 # Night / underexposed
+        self.MAX_BRIGHTNESS = 190 # Glare / overexposed
+        self.MIN_CONTRAST = 40 # Std dev; fog and rain flatten the histogram
+        self.MAX_CLIPPED = 0.15 # Share of crushed (<16) or blown (>239) pixels
+
+        # Reused buffers
+        self.lab = None
+        self.raw_l = None
+        self.luminance = None # Equalised L of the last enhanced frame
+
+        self.enhanced = True # Whether the last preprocess() ran CLAHE
+        self.needs_enhancement = True
+        self.frames_since_check = analysis_interval
+        self.last_exposure = None
 
     def apply_gamma_correction(self, image, gamma=1.2):
         inv_gamma = 1.0 / gamma
         table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
         return cv2.LUT(image, table)
 
+    def _buffers(self, frame):
+        h, w = frame.shape[:2]
+        if self.luminance is None or self.luminance.shape != (h, w):
+            self.lab = np.empty((h, w, 3), dtype=np.uint8)
+            self.raw_l = np.empty((h, w), dtype=np.uint8)
+            self.luminance = np.empty((h, w), dtype=np.uint8)
+
+    def measure_exposure(self, frame):
+        """Brightness / contrast stats from a 160px-wide thumbnail histogram."""
+        h, w = frame.shape[:2]
+        thumb = cv2.resize(frame, (160, max(1, h * 160 // w)), interpolation=cv2.INTER_NEAREST)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        hist = cv2.calcHist([thumb], [0], None, [256], [0, 256]).ravel()
+        hist /= hist.sum()
+        levels = np.arange(256)
+        mean = float(hist @ levels)
+        std = float(np.sqrt(hist @ (levels - mean) ** 2))
+        clipped = float(hist[:16].sum() + hist[240:].sum())
+        return {'brightness': mean, 'contrast': std, 'clipped': clipped}
+
+    def should_enhance(self, frame):
+        """Re-evaluated every ANALYSIS_INTERVAL frames, so the decision doesn't flicker."""
+        if not self.adaptive:
+            return True
+        self.frames_since_check += 1
+        if self.frames_since_check >= self.ANALYSIS_INTERVAL:
+            self.frames_since_check = 0
+            e = self.last_exposure = self.measure_exposure(frame)
+            self.needs_enhancement = (e['brightness'] < self.MIN_BRIGHTNESS
+                                      or e['brightness'] > self.MAX_BRIGHTNESS
+                                      or e['contrast'] < self.MIN_CONTRAST
+                                      or e['clipped'] > self.MAX_CLIPPED)
+        return self.needs_enhancement
+
     def enhance_visibility(self, frame):
         """
         Apply CLAHE to L-channel of LAB color space to improve contrast (fog/rain/glare).
+        Returns a new BGR frame; the equalised L channel stays in self.luminance.
         """
-        lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        l_enhanced = self.clahe.apply(l)
-        lab_merged = cv2.merge((l_enhanced, a, b))
-        return cv2.cvtColor(lab_merged, cv2.COLOR_LAB2BGR)
+        self._buffers(frame)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2LAB, dst=self.lab)
+        cv2.extractChannel(self.lab, 0, dst=self.raw_l)
+        self.clahe.apply(self.raw_l, dst=self.luminance)
+        cv2.insertChannel(self.luminance, self.lab, 0)
+        # Fresh output: callers may annotate it in place
+        return cv2.cvtColor(self.lab, cv2.COLOR_LAB2BGR)
 
     def preprocess(self, frame):
-        # Apply enhancements
-        frame = self.enhance_visibility(frame)
-        # Optional: Gamma correction if needed explicitly, but CLAHE often suffices for local contrast
+        """
+        Returns the enhanced frame (a new array), or `frame` itself when
+        enhancement is skipped - check self.enhanced before drawing on it.
+        """
+        self.enhanced = self.should_enhance(frame)
+        if self.enhanced:
+            return self.enhance_visibility(frame)
         return frame
@@ -0,0 +1,233 @@
+"""
+Inference backends for the ultralytics models (vehicle detector, road segmentation).
+
+    torch          PyTorch weights as-is (default)
+    onnx           ONNX Runtime, static input shape
+    openvino       OpenVINO IR, static input shape
+    onnx-int8      + INT8 post-training quantisation (ONNX Runtime, QDQ)
+    openvino-int8  + INT8 post-training quantisation (NNCF)
+
+The backend is chosen per model (backend=...) or fleet-wide with the
+INFERENCE_BACKEND environment variable. Exported models are cached next to
+the weights, or in backend/models for bare names like 'yolov8n.pt' (e.g.
+models/yolov8n_640_b8_int8.onnx), and built on first use; INT8
+models are calibrated on frames sampled from our own footage
+(sample_traffic.mp4 unless calibration_video is given). The detection head
+stays in floating point, box regression is the part INT8 hurts most.
+
+Optional packages: onnx + onnxruntime (onnx), openvino + nncf (openvino).
+Without them the model falls back to PyTorch with a warning.
+
+See benchmarks/bench_backends.py for latency / mAP per backend.
+
+The INT8 backends are experimental: no accuracy numbers have been recorded
+for them yet. Run bench_backends.py on our footage (and a held-out clip)
+before deploying one; load_model warns when they are selected.
+"""
+import os
+import re
+import glob
+import shutil
+import cv2
+import numpy as np
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+DEFAULT_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+CALIBRATION_VIDEO = os.path.join(os.path.dirname(__file__), '..', 'sample_traffic.mp4')
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models'))
+
+def parse_backend(spec):
+    """'onnx', 'openvino-int8', ... -> (backend, int8)."""
+    name, _, suffix = spec.lower().partition('-')
+    if name not in BACKENDS or suffix not in ('', 'int8') or (name == 'torch' and suffix):
+        raise ValueError(f"Unknown inference backend: {spec}")
+    return name, suffix == 'int8'
+
+def artifact_path(model_path, backend, int8=False, imgsz=640, batch=1):
+    """
+    Where the exported model for this configuration is cached: next to the
+    weights, or in MODELS_DIR for a bare name (ultralytics resolves those
+    itself, and the export must not depend on the working directory).
+    """
+    if backend == 'torch':
+        return model_path
+    if not os.path.dirname(model_path):
+        model_path = os.path.join(MODELS_DIR, model_path)
+    stem = f"{os.path.splitext(model_path)[0]}_{imgsz}_b{batch}" + ('_int8' if int8 else '')
+    # Suffixes are how ultralytics recognises the format when loading
+    return stem + '.onnx' if backend == 'onnx' else stem + '_openvino_model'
+
+def letterbox(frame, imgsz=640):
+    """Resizes into an imgsz x imgsz canvas keeping the aspect ratio (grey padding), like ultralytics."""
+    h, w = frame.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas
+
+def to_input(frames, imgsz=640):
+    """BGR frames -> (N, 3, imgsz, imgsz) float32 RGB in [0, 1], the exported models' input."""
+    batch = np.stack([letterbox(f, imgsz) for f in frames])[..., ::-1]
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+def sample_frames(video_path, count=128, with_indices=False):
+    """count frames spread evenly over a video file (calibration / benchmark input)."""
+    cap = cv2.VideoCapture(video_path)
+    total = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    frames, indices = [], []
+    for index in np.unique(np.linspace(0, max(total - 1, 0), count).astype(int)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+            indices.append(int(index))
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"No frames read from {video_path}")
+    return (frames, indices) if with_indices else frames
+
+def calibration_batches(frames, imgsz=640, batch=1):
+    """Model inputs for calibration, in the exported batch size (last batch padded)."""
+    for start in range(0, len(frames), batch):
+        chunk = list(frames[start:start + batch])
+        chunk += [chunk[-1]] * (batch - len(chunk))
+        yield to_input(chunk, imgsz)
+
+def _head_index(names):
+    """Index of the last ultralytics module (the Detect / Segment head) from graph node names."""
+    indices = [int(m.group(1)) for m in (re.search(r'/model\.(\d+)/', n) for n in names) if m]
+    return max(indices) if indices else None
+
+def _quantize_onnx(fp32_path, out_path, frames, imgsz, batch):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    model = onnx.load(fp32_path)
+    input_name = model.graph.input[0].name
+    head = _head_index(node.name for node in model.graph.node)
+    exclude = [node.name for node in model.graph.node
+               if head is not None and node.name.startswith(f'/model.{head}/')]
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = calibration_batches(frames, imgsz, batch)
+
+        def get_next(self):
+            data = next(self.batches, None)
+            return None if data is None else {input_name: data}
+
+    quantize_static(fp32_path, out_path, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    nodes_to_exclude=exclude)
+    # Keep the ultralytics metadata (class names, stride, task, imgsz)
+    quantized = onnx.load(out_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(model.metadata_props)
+    onnx.save(quantized, out_path)
+
+def _quantize_openvino(fp32_dir, out_dir, frames, imgsz, batch):
+    import nncf
+    import openvino as ov
+
+    xml = glob.glob(os.path.join(fp32_dir, '*.xml'))[0]
+    model = ov.Core().read_model(xml)
+    head = _head_index(op.get_friendly_name() for op in model.get_ops())
+    ignored = nncf.IgnoredScope(patterns=[rf'.*/model\.{head}/.*']) if head is not None else None
+
+    dataset = nncf.Dataset(list(calibration_batches(frames, imgsz, batch)))
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(frames), ignored_scope=ignored)
+    os.makedirs(out_dir, exist_ok=True)
+    ov.save_model(quantized, os.path.join(out_dir, os.path.basename(xml)))
+    for name in os.listdir(fp32_dir):
+        if name.endswith('.yaml'): # metadata.yaml
+            shutil.copy(os.path.join(fp32_dir, name), out_dir)
+
+def export_model(model_path, backend, int8=False, imgsz=640, batch=1, task=None,
+                 calibration_video=None, calibration_frames=128):
+    """
+    Exports model_path for backend with a static (batch, 3, imgsz, imgsz) input,
+    quantising to INT8 if requested. Cached: returns the existing artifact if present.
+    """
+    path = artifact_path(model_path, backend, int8, imgsz, batch)
+    if backend == 'torch' or os.path.exists(path):
+        return path
+
+    fp32 = artifact_path(model_path, backend, False, imgsz, batch)
+    if not os.path.exists(fp32):
+        from ultralytics import YOLO
+        print(f"Exporting {model_path} to {backend} ({batch}x3x{imgsz}x{imgsz})...")
+        exported = YOLO(model_path, task=task).export(format=backend, imgsz=imgsz, batch=batch,
+                                                      dynamic=False, half=False)
+        os.makedirs(os.path.dirname(fp32), exist_ok=True)
+        shutil.move(str(exported).rstrip(os.sep), fp32)
+    if not int8:
+        return fp32
+
+    video = calibration_video or CALIBRATION_VIDEO
+    print(f"Calibrating INT8 {backend} model on {calibration_frames} frames of {video}...")
+    frames = sample_frames(video, calibration_frames)
+    if backend == 'onnx':
+        _quantize_onnx(fp32, path, frames, imgsz, batch)
+    else:
+        _quantize_openvino(fp32, path, frames, imgsz, batch)
+    return path
+
+class InferenceModel:
+    """
+    An ultralytics model on any backend, with YOLO's predict() / __call__ interface.
+    Exported models have a static batch size: inputs are split into batches of
+    that size, the last one padded by repeating its last image (results for
+    the padding are dropped).
+    """
+    def __init__(self, model, backend='torch', batch=None, imgsz=640):
+        self.model = model
+        self.backend = backend
+        self.batch = batch # None = any batch size (PyTorch)
+        self.imgsz = imgsz
+
+    def predict(self, source, **kwargs):
+        if self.batch is None:
+            return self.model.predict(source, **kwargs)
+        kwargs.setdefault('imgsz', self.imgsz)
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        results = []
+        for start in range(0, len(images), self.batch):
+            chunk = images[start:start + self.batch]
+            n = len(chunk)
+            chunk += [chunk[-1]] * (self.batch - n)
+            results.extend(self.model.predict(chunk, **kwargs)[:n])
+        return results
+
+    __call__ = predict
+
+    def __getattr__(self, name):
+        # names, task, ... of the wrapped YOLO object. 'model' itself is only
+        # missing before __init__ ran (copy / unpickling): don't recurse on it.
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+def load_model(model_path, backend=None, task=None, batch=1, imgsz=640, calibration_video=None):
+    """
+    Loads model_path on backend (see module docstring; None = INFERENCE_BACKEND).
+    batch: static batch size of the exported model (e.g. the scheduler's max_batch).
+    Falls back to PyTorch if the backend's packages are not installed.
+    """
+    from ultralytics import YOLO
+    spec = backend or DEFAULT_BACKEND
+    name, int8 = parse_backend(spec)
+    if int8:
+        print(f"Warning: {spec} is experimental, its accuracy loss has not been benchmarked "
+              f"(see benchmarks/bench_backends.py).")
+    if name != 'torch':
+        try:
+            path = export_model(model_path, name, int8, imgsz, batch, task, calibration_video)
+            model = YOLO(path, task=task)
+            print(f"Loaded {spec} model: {path}")
+            return InferenceModel(model, spec, batch=batch, imgsz=imgsz)
+        except ImportError as e:
+            print(f"Warning: {spec} backend unavailable ({e}), falling back to PyTorch.")
+    return InferenceModel(YOLO(model_path, task=task))
@@ -0,0 +1,93 @@
+from collections import deque
+import numpy as np
+
+class MotionCompensator:
+    """
+    Turns per-frame GMC shifts into a stabilised (world-fixed) reference frame.
+    offset = camera motion accumulated since start, in image pixels; a point
+    that is static on the ground keeps the same stabilised coordinates.
+
+    Every shift is integrated for good, so implausible ones (a jump far from
+    the recent motion, e.g. LK locking onto the wrong features) are replaced
+    by the recent median. A deviation that persists for max_rejections frames
+    is a real change of motion and is accepted.
+    A drifting camera would take stabilised positions out of the frame (and
+    normalised coordinates out of [0, 1]); see reanchor().
+    """
+    def __init__(self, deadband=0.3, history=15, outlier_px=20.0, outlier_sigma=4.0,
+                 max_rejections=5, reanchor_fraction=0.25):
+        self.DEADBAND = deadband # px; sub-pixel GMC noise would otherwise random-walk the offset
+        self.OUTLIER_PX = outlier_px # Deviations from the recent median below this are always accepted
+        self.OUTLIER_SIGMA = outlier_sigma # ...above this many robust std devs they are rejected
+        self.MAX_REJECTIONS = max_rejections
+        self.REANCHOR_FRACTION = reanchor_fraction # Of the frame size
+        self.offset = np.zeros(2, dtype=np.float64)
+        self.last_shift = (0.0, 0.0)
+        self.recent = deque(maxlen=history) # Accepted raw shifts
+        self.consecutive_rejections = 0
+
+        # Metrics
+        self.rejected = 0
+        self.reanchors = 0
+
+    def _implausible(self, shift):
+        if len(self.recent) < 5:
+            return False
+        recent = np.array(self.recent)
+        median = np.median(recent, axis=0)
+        spread = 1.4826 * np.median(np.hypot(*(recent - median).T)) # Robust std dev (MAD)
+        deviation = np.hypot(*(shift - median))
+        return deviation > max(self.OUTLIER_PX, self.OUTLIER_SIGMA * spread)
+
+    def update(self, dx, dy):
+        shift = np.array([dx, dy], dtype=np.float64)
+        if self._implausible(shift):
+            self.consecutive_rejections += 1
+            if self.consecutive_rejections <= self.MAX_REJECTIONS:
+                self.rejected += 1
+                shift = np.median(np.array(self.recent), axis=0)
+            else:
+                # Sustained: the camera really moves differently now
+                self.recent.clear()
+                self.recent.append(shift)
+                self.consecutive_rejections = 0
+        else:
+            self.consecutive_rejections = 0
+            self.recent.append(shift)
+
+        dx, dy = shift
+        dx = dx if abs(dx) >= self.DEADBAND else 0.0
+        dy = dy if abs(dy) >= self.DEADBAND else 0.0
+        self.last_shift = (float(dx), float(dy))
+        self.offset += self.last_shift
+        return self.last_shift
+
+    def reanchor(self, frame_shape, cell=(1.0, 1.0)):
+        """
+        Once the offset exceeds reanchor_fraction of the frame, moves the origin
+        back to the current view. The correction is a whole number of `cell`
+        (px, e.g. heatmap cells) per axis. Returns it, or None: stabilised
+        positions stored elsewhere must be shifted by +correction.
+        """
+        h, w = frame_shape[:2]
+        limit = self.REANCHOR_FRACTION * np.array([w, h], dtype=np.float64)
+        if np.all(np.abs(self.offset) <= limit):
+            return None
+        cell = np.asarray(cell, dtype=np.float64)
+        correction = np.round(self.offset / cell) * cell
+        self.offset -= correction
+        self.reanchors += 1
+        return correction
+
+    def reset(self):
+        self.offset[:] = 0
+        self.last_shift = (0.0, 0.0)
+        self.recent.clear()
+        self.consecutive_rejections = 0
+
+    def to_stable(self, points):
+        """Image-space points (N, 2) -> stabilised points."""
+        return np.asarray(points, dtype=np.float64) - self.offset
+
+    def to_stable_point(self, x, y):
+        return x - self.offset[0], y - self.offset[1]
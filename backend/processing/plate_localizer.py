@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+import os
+
+class MorphologyPlateLocalizer:
+    """
+    Fast heuristic plate finder: dark-on-light character strokes (blackhat),
+    horizontal gradients, closed into blobs with a plate-like aspect ratio.
+    No model, a few milliseconds per vehicle crop.
+    """
+    def __init__(self, max_candidates=3, out_height=64):
+        self.max_candidates = max_candidates
+        self.out_height = out_height # Rectified plate height fed to the recognizer
+        self.MIN_ASPECT, self.MAX_ASPECT = 2.0, 6.5 # EU/IL plates ~4.5, US ~2
+        self.MIN_AREA_FRAC, self.MAX_AREA_FRAC = 0.002, 0.25
+        self.rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5))
+        self.close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21, 5))
+
+    def locate(self, car_crop):
+        """Returns a list of rectified plate images (best first), possibly empty."""
+        if car_crop is None or car_crop.size == 0:
+            return []
+        gray = cv2.cvtColor(car_crop, cv2.COLOR_BGR2GRAY) if car_crop.ndim == 3 else car_crop
+        h, w = gray.shape[:2]
+
+        # 1. Character strokes + vertical edges
+        blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, self.rect_kernel)
+        grad = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+        grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+        # 2. Merge characters into one blob per plate
+        grad = cv2.GaussianBlur(grad, (5, 5), 0)
+        grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, self.close_kernel)
+        _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        mask = cv2.erode(mask, None, iterations=2)
+        mask = cv2.dilate(mask, None, iterations=2)
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        candidates = []
+        for cnt in contours:
+            rect = cv2.minAreaRect(cnt)
+            (cx, cy), (rw, rh), angle = rect
+            if rw < rh:
+                rw, rh = rh, rw
+            if rh == 0:
+                continue
+            aspect = rw / rh
+            area_frac = (rw * rh) / float(w * h)
+            if not (self.MIN_ASPECT <= aspect <= self.MAX_ASPECT):
+                continue
+            if not (self.MIN_AREA_FRAC <= area_frac <= self.MAX_AREA_FRAC):
+                continue
+            # Plates sit in the lower part of the vehicle; prefer larger, lower blobs
+            score = area_frac * (0.5 + cy / h)
+            candidates.append((score, rect))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [self.rectify(car_crop, rect) for _, rect in candidates[:self.max_candidates]]
+
+    def rectify(self, image, rect):
+        """Warps a (possibly rotated) rectangle to an upright, fixed-height patch."""
+        box = cv2.boxPoints(rect).astype(np.float32)
+        # Order: top-left, top-right, bottom-right, bottom-left
+        s = box.sum(axis=1)
+        d = np.diff(box, axis=1).ravel()
+        ordered = np.float32([box[np.argmin(s)], box[np.argmin(d)], box[np.argmax(s)], box[np.argmax(d)]])
+
+        width = np.linalg.norm(ordered[1] - ordered[0])
+        height = np.linalg.norm(ordered[3] - ordered[0])
+        if height == 0:
+            height = 1.0
+        out_w = max(1, int(round(self.out_height * width / height)))
+
+        dst = np.float32([[0, 0], [out_w - 1, 0], [out_w - 1, self.out_height - 1], [0, self.out_height - 1]])
+        M = cv2.getPerspectiveTransform(ordered, dst)
+        return cv2.warpPerspective(image, M, (out_w, self.out_height), borderMode=cv2.BORDER_REPLICATE)
+
+class YOLOPlateLocalizer:
+    """Learned plate detector (any ultralytics detection model trained on plates)."""
+    def __init__(self, model_path, conf=0.25, max_candidates=3, pad=0.05):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.conf = conf
+        self.max_candidates = max_candidates
+        self.pad = pad
+
+    def locate(self, car_crop):
+        if car_crop is None or car_crop.size == 0:
+            return []
+        results = self.model.predict(car_crop, conf=self.conf, verbose=False)[0]
+        if not results.boxes:
+            return []
+        h, w = car_crop.shape[:2]
+        boxes = results.boxes.xyxy.cpu().numpy()
+        order = np.argsort(-results.boxes.conf.cpu().numpy())[:self.max_candidates]
+
+        plates = []
+        for x1, y1, x2, y2 in boxes[order]:
+            px, py = (x2 - x1) * self.pad, (y2 - y1) * self.pad
+            x1, y1 = max(0, int(x1 - px)), max(0, int(y1 - py))
+            x2, y2 = min(w, int(x2 + px)), min(h, int(y2 + py))
+            if x2 > x1 and y2 > y1:
+                plates.append(car_crop[y1:y2, x1:x2])
+        return plates
+
+def create_plate_localizer(model_path=None):
+    """
+    Uses the learned detector if models/plate_detector.pt (or model_path) exists,
+    otherwise the morphology heuristic.
+    """
+    if model_path is None:
+        model_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'plate_detector.pt')
+    if os.path.exists(model_path):
+        try:
+            localizer = YOLOPlateLocalizer(model_path)
+            print(f"Loaded Plate Detector: {model_path}")
+            return localizer
+        except Exception as e:
+            print(f"Failed to load plate detector, using heuristic: {e}")
+    return MorphologyPlateLocalizer()
@@ -0,0 +1,136 @@
+import numpy as np
+
+def nms(boxes, scores, classes, iou_threshold=0.5):
+    """
+    Class-aware non-maximum suppression (boxes of different classes never suppress
+    each other). Returns the indices to keep, highest score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.intp)
+    # Shift each class into its own coordinate range
+    offset = np.asarray(classes, dtype=np.float64)[:, None] * (boxes.max() + 1)
+    b = boxes + offset
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    order = np.argsort(-np.asarray(scores), kind='stable')
+
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(b[i, 0], b[rest, 0])
+        yy1 = np.maximum(b[i, 1], b[rest, 1])
+        xx2 = np.minimum(b[i, 2], b[rest, 2])
+        yy2 = np.minimum(b[i, 3], b[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+def merge_detections(full, crops, windows, classes, iou_threshold=0.5):
+    """
+    Merges full-frame detections with detections from high-res crops.
+    full / crops[i]: (N, 6) arrays x1, y1, x2, y2, conf, cls (crop coordinates for crops);
+    windows[i]: the crop's (x1, y1, x2, y2) in the frame. Only `classes` are taken
+    from the crops. Overlaps among `classes` rows (full-frame and crop) are resolved
+    with class-aware NMS; other full-frame rows (vehicles, ...) pass through as
+    the detector returned them.
+    """
+    full = np.asarray(full, dtype=np.float32).reshape(-1, 6)
+    in_roi = np.isin(full[:, 5], classes)
+    parts = [full[in_roi]]
+    for data, (wx, wy, _, _) in zip(crops, windows):
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        data = data[np.isin(data[:, 5], classes)].copy()
+        data[:, [0, 2]] += wx
+        data[:, [1, 3]] += wy
+        parts.append(data)
+    merged = np.concatenate(parts)
+    if len(parts) > 1 and len(merged):
+        merged = merged[nms(merged[:, :4], merged[:, 4], merged[:, 5], iou_threshold)]
+    return np.concatenate([full[~in_roi], merged])
+
+class TrafficLightROIs:
+    """
+    Learns where traffic lights appear and proposes high-resolution crop windows
+    around them (SAHI-style tiling, but only where lights were seen before).
+
+    Sightings are accumulated on a coarse grid in stabilised coordinates
+    (image position minus the camera offset), with slow decay, so ROIs follow
+    a drifting drone and fade when a light is no longer seen. Only frames at
+    least min_frame_width wide are tiled: below that the detector's own input
+    size already resolves the lights.
+    """
+    def __init__(self, tile=640, cell=64, min_hits=3.0, decay=0.995, max_rois=4,
+                 min_frame_width=1920):
+        self.TILE = tile # Crop size in frame pixels (= detector input, so no downscaling)
+        self.CELL = cell
+        self.MIN_HITS = min_hits # Decayed sightings before a cell becomes an ROI
+        self.DECAY = decay # Per observed frame
+        self.MAX_ROIS = max_rois
+        self.MIN_FRAME_WIDTH = min_frame_width
+        self.grid = None
+        self.frame_shape = None
+
+    def active(self, frame_shape):
+        return frame_shape[1] >= self.MIN_FRAME_WIDTH
+
+    def observe(self, boxes, offset, frame_shape):
+        """Records traffic-light boxes (image coords) from a detection frame."""
+        if not self.active(frame_shape):
+            return
+        h, w = frame_shape[:2]
+        if self.grid is None or self.frame_shape != (h, w):
+            self.grid = np.zeros((-(-h // self.CELL), -(-w // self.CELL)), dtype=np.float32)
+            self.frame_shape = (h, w)
+        self.grid *= self.DECAY
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            return
+        centres = (boxes[:, :2] + boxes[:, 2:]) / 2 - np.asarray(offset, dtype=np.float64)
+        cells = np.floor(centres / self.CELL).astype(int)
+        rows, cols = self.grid.shape
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < cols) & (cells[:, 1] >= 0) & (cells[:, 1] < rows)
+        np.add.at(self.grid, (cells[inside, 1], cells[inside, 0]), 1.0)
+
+    def shift(self, dx, dy):
+        """The stabilised frame was re-anchored by (dx, dy) px: moves the sightings along."""
+        if self.grid is None:
+            return
+        cx, cy = int(round(dx / self.CELL)), int(round(dy / self.CELL))
+        moved = np.zeros_like(self.grid)
+        rows, cols = self.grid.shape
+        if abs(cx) < cols and abs(cy) < rows:
+            moved[max(cy, 0):rows + min(cy, 0), max(cx, 0):cols + min(cx, 0)] = \
+                self.grid[max(-cy, 0):rows + min(-cy, 0), max(-cx, 0):cols + min(-cx, 0)]
+        self.grid = moved
+
+    def windows(self, offset, frame_shape):
+        """Up to MAX_ROIS (x1, y1, x2, y2) crop windows in image coords, hottest first."""
+        h, w = frame_shape[:2]
+        if self.grid is None or self.frame_shape != (h, w) or not self.active(frame_shape):
+            return []
+        hot = np.argwhere(self.grid >= self.MIN_HITS)
+        if len(hot) == 0:
+            return []
+        hot = hot[np.argsort(-self.grid[hot[:, 0], hot[:, 1]], kind='stable')]
+
+        tile_w, tile_h = min(self.TILE, w), min(self.TILE, h)
+        margin = self.TILE // 8 # Keep lights away from crop edges
+        windows = []
+        for row, col in hot:
+            cx = (col + 0.5) * self.CELL + offset[0]
+            cy = (row + 0.5) * self.CELL + offset[1]
+            if not (0 <= cx < w and 0 <= cy < h):
+                continue
+            if any(x1 + margin <= cx < x2 - margin and y1 + margin <= cy < y2 - margin
+                   for x1, y1, x2, y2 in windows):
+                continue
+            x1 = int(np.clip(cx - tile_w / 2, 0, w - tile_w))
+            y1 = int(np.clip(cy - tile_h / 2, 0, h - tile_h))
+            windows.append((x1, y1, x1 + tile_w, y1 + tile_h))
+            if len(windows) == self.MAX_ROIS:
+                break
+        return windows
@@ -1,43 +1,187 @@
-from ultralytics import YOLO
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
 import cv2
 import numpy as np
+import torch
+from processing.roi_inference import merge_detections
+from processing.inference_backend import load_model
+
+def create_byte_tracker(frame_rate=30, tracker_cfg='bytetrack.yaml'):
+    """
+    Creates an independent ByteTrack instance: its own Kalman state, track lists
+    and association, so one camera's detections never update or age out another
+    camera's tracks. Track IDs come from ultralytics' class-level counter, so
+    they are unique across cameras rather than numbered per camera.
+    """
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker_cfg)))
+    return BYTETracker(args=cfg, frame_rate=frame_rate)
 
 class ObjectTracker:
-    def __init__(self, model_path='yolov8n.pt'):
-        # We load the model here for tracking capabilities
-        self.model = YOLO(model_path)
+    def __init__(self, model_path='yolov8n.pt', scheduler=None, backend=None):
+        # Detection can be shared (batched across cameras via scheduler),
+        # tracking state is always owned by this instance.
+        # backend: see processing/inference_backend.py (ignored with a scheduler)
+        self.scheduler = scheduler
+        if scheduler is not None:
+            self.model = scheduler.model
+        else:
+            self.model = load_model(model_path, backend, task='detect')
+        self.tracker = create_byte_tracker()
+        # Classes taken from ROI crops (9 = traffic light); everything else comes from the full frame
+        self.ROI_CLASSES = [9]
+
+    def detect(self, frame, rois=None):
+        """
+        Runs the detector only (no tracking). Returns a single Results object.
+        rois: optional (x1, y1, x2, y2) windows that are also detected at full
+        resolution; their traffic lights are merged into the full-frame result (NMS).
+        """
+        if self.scheduler is not None:
+            result = self.scheduler.predict(frame)
+        else:
+            # conf=0.15 to detect smaller objects (e.g. traffic lights)
+            result = self.model.predict(frame, conf=0.15, verbose=False)[0]
+        if rois:
+            result = self._merge_rois(result, frame, rois)
+        return result
 
-    def track(self, frame):
+    def _merge_rois(self, result, frame, rois):
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+        if self.scheduler is not None:
+            crop_results = self.scheduler.predict_many(crops)
+        else:
+            crop_results = self.model.predict(crops, conf=0.15, classes=self.ROI_CLASSES, verbose=False)
+        merged = merge_detections(result.boxes.data.cpu().numpy(),
+                                  [r.boxes.data.cpu().numpy() for r in crop_results],
+                                  rois, self.ROI_CLASSES)
+        result.update(boxes=torch.as_tensor(merged))
+        return result
+
+    def update_tracks(self, result, frame):
+        """
+        Feeds detections into this instance's ByteTrack and attaches track IDs,
+        same as ultralytics' persist=True callback but without global state.
+        """
+        det = result.boxes.cpu().numpy()
+        tracks = self.tracker.update(det, frame)
+        if len(tracks) == 0:
+            return result
+        idx = tracks[:, -1].astype(int)
+        result = result[idx]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def track(self, frame, rois=None):
         """
-        Run YOLOv8 tracking on the frame.
+        Run YOLOv8 detection + tracking on the frame.
         Returns the result object which contains boxes, ids, and classes.
         """
-        # conf=0.15 to detect smaller objects (e.g. traffic lights)
-        results = self.model.track(frame, persist=True, conf=0.15, verbose=False)
-        return results[0]
+        result = self.detect(frame, rois)
+        return self.update_tracks(result, frame)
 
 class GMC:
     """
     Global Motion Compensation using Sparse Optical Flow (Lucas-Kanade).
     Estimates the movement of the CAMERA (Tx, Ty) between frames.
+
+    downscale: run on a 1/downscale image (e.g. 4 -> 480x270 for 1080p); the
+               shift is scaled back to full-resolution pixels.
+    redetect_interval: re-run goodFeaturesToTrack every N frames (or when too few
+               points survive). None keeps the legacy rule: whenever < 50 points.
+    model: 'translation' (median of flow vectors), 'affine' (partial affine,
+           RANSAC) or 'homography' (RANSAC). (dx, dy) is always returned; the
+           full 3x3 transform of the last frame is kept in last_transform.
     """
-    def __init__(self):
+    def __init__(self, downscale=1, redetect_interval=None, model='translation'):
+        self.downscale = max(1, int(downscale))
+        self.redetect_interval = redetect_interval
+        self.model = model
+
         self.prev_gray = None
         self.prev_pts = None
         self.frame_shape = None
-        # ShiTomasi corner detection params
-        self.feature_params = dict(maxCorners=200, qualityLevel=0.01, minDistance=30, blockSize=3)
-        # LK Optical Flow params
-        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+        self.frames_since_detect = 0
+        self.last_transform = np.eye(3)
+
+        # Two reused grayscale buffers (current / previous) + a small BGR buffer
+        self.buffers = [None, None]
+        self.small = None
+        self.current = 0
+
+        # ShiTomasi corner detection params (minDistance scales with the image)
+        self.feature_params = dict(maxCorners=200, qualityLevel=0.01,
+                                   minDistance=max(5, 30 // self.downscale), blockSize=3)
+        # LK Optical Flow params (LK cost is per point and window, so shrink the window too)
+        win = 15 if self.downscale == 1 else 9
+        self.lk_params = dict(winSize=(win, win), maxLevel=2 if self.downscale == 1 else 1,
                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
 
+    def _to_gray(self, frame):
+        """
+        Grayscale (optionally downscaled) into a reused buffer.
+        Single-channel (already grayscale) input is only resized/copied.
+        """
+        h, w = frame.shape[:2]
+        size = (max(1, w // self.downscale), max(1, h // self.downscale))
+        shape = (size[1], size[0])
+
+        buf = self.buffers[self.current]
+        if buf is None or buf.shape != shape:
+            buf = self.buffers[self.current] = np.empty(shape, dtype=np.uint8)
+
+        if frame.ndim == 2:
+            # Caller's buffer may be overwritten next frame, so always copy
+            if self.downscale == 1:
+                np.copyto(buf, frame)
+                return buf
+            return cv2.resize(frame, size, dst=buf, interpolation=cv2.INTER_LINEAR)
+
+        if self.downscale == 1:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buf)
+
+        if self.small is None or self.small.shape[:2] != shape:
+            self.small = np.empty(shape + (3,), dtype=np.uint8)
+        cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=buf)
+
+    def _estimate(self, good_old, good_new):
+        """Returns (dx, dy, 3x3 transform) in downscaled pixels, or None."""
+        if self.model == 'translation':
+            shifts = good_new - good_old
+            dx = np.median(shifts[:, 0])  # Use median instead of mean for robustness
+            dy = np.median(shifts[:, 1])
+            T = np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+            return dx, dy, T
+
+        if self.model == 'affine':
+            A, _ = cv2.estimateAffinePartial2D(good_old, good_new, method=cv2.RANSAC,
+                                               ransacReprojThreshold=3.0 / self.downscale)
+            if A is None:
+                return None
+            T = np.vstack([A, [0, 0, 1]])
+        else: # homography
+            if len(good_old) < 8:
+                return None
+            T, _ = cv2.findHomography(good_old, good_new, cv2.RANSAC, 3.0 / self.downscale)
+            if T is None:
+                return None
+
+        # Shift of the image centre under the transform
+        h, w = self.frame_shape
+        c = np.array([w / 2.0, h / 2.0, 1.0])
+        moved = T @ c
+        moved = moved[:2] / moved[2]
+        return moved[0] - c[0], moved[1] - c[1], T
+
     def apply(self, frame):
         """
-        Calculates shift (dx, dy) from previous frame.
+        Calculates shift (dx, dy) from previous frame (BGR or luminance image).
         Returns: (dx, dy) tuple.
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = self._to_gray(frame)
         shift = (0, 0)
+        self.last_transform = np.eye(3)
 
         # Check if frame size changed - reset if so
         if self.frame_shape is not None and gray.shape != self.frame_shape:
@@ -51,6 +195,7 @@ class GMC:
             # Ensure we have valid points to track
             if self.prev_pts is None or len(self.prev_pts) < 10:
                 self.prev_pts = cv2.goodFeaturesToTrack(self.prev_gray, mask=None, **self.feature_params)
+                self.frames_since_detect = 0
 
             # Only proceed if we have valid points
             if self.prev_pts is not None and len(self.prev_pts) >= 10:
@@ -65,12 +210,16 @@ class GMC:
                         good_new = p1[st==1]
                         good_old = self.prev_pts[st==1]
 
-                        # Calculate average shift only if we have enough good points
+                        # Calculate camera motion only if we have enough good points
                         if len(good_new) > 5:
-                            shifts = good_new - good_old
-                            dx = np.median(shifts[:, 0])  # Use median instead of mean for robustness
-                            dy = np.median(shifts[:, 1])
-                            shift = (dx, dy)
+                            estimate = self._estimate(good_old, good_new)
+                            if estimate is not None:
+                                dx, dy, T = estimate
+                                # Back to full-resolution pixels
+                                s = self.downscale
+                                S = np.diag([s, s, 1.0])
+                                self.last_transform = S @ T @ np.linalg.inv(S)
+                                shift = (dx * s, dy * s)
 
                         # Keep only good points for next iteration
                         self.prev_pts = good_new.reshape(-1, 1, 2)
@@ -84,13 +233,21 @@ class GMC:
                     self.prev_pts = None
                     shift = (0, 0)
 
-        # Update for next frame
-        self.prev_gray = gray.copy()
+        # Update for next frame: swap buffers instead of copying
+        self.prev_gray = gray
+        self.current = 1 - self.current
+        self.frames_since_detect += 1
 
-        # Detect fresh points if we don't have enough
-        if self.prev_pts is None or len(self.prev_pts) < 50:
+        # Detect fresh points if we don't have enough (or on schedule)
+        if self.redetect_interval is None:
+            redetect = self.prev_pts is None or len(self.prev_pts) < 50
+        else:
+            redetect = (self.prev_pts is None or len(self.prev_pts) < 10
+                        or self.frames_since_detect >= self.redetect_interval)
+        if redetect:
             new_pts = cv2.goodFeaturesToTrack(gray, mask=None, **self.feature_params)
             if new_pts is not None:
                 self.prev_pts = new_pts
+                self.frames_since_detect = 0
 
-        return shift
\ No newline at end of file
+        return shift
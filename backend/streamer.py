@@ -2,15 +2,35 @@ import cv2
 import time
 
 class VideoStreamer:
-    def __init__(self, source=0):
+    def __init__(self, source=0, loop=True):
         """
         source: 0 for webcam, or string for file path/RTSP url.
+        loop: restart files at the end (live playback); False returns None at the end.
         """
         self.source = source
+        self.loop = loop
         self.cap = cv2.VideoCapture(source)
         if not self.cap.isOpened():
             print(f"Error: Could not open video source {source}")
 
+    @property
+    def fps(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return fps if fps and fps > 0 else 30.0
+
+    @property
+    def frame_count(self):
+        """Total frames of a file (0 if unknown, e.g. cameras and streams)."""
+        return max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+    @property
+    def frame_size(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def seek(self, frame_index):
+        """Positions a file so the next get_frame() returns frame_index."""
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
     def get_frame(self):
         if not self.cap.isOpened():
             return None
@@ -18,6 +38,8 @@ class VideoStreamer:
         ret, frame = self.cap.read()
         if ret:
             return frame
+        elif not self.loop:
+            return None
         else:
             print("End of video stream. Looping...")
             # Attempt to loop
@@ -0,0 +1,46 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from encoding import AdaptiveEncoder
+import numpy as np
+
+def test_adaptive_encoder_backpressure():
+    print("Testing AdaptiveEncoder...")
+    enc = AdaptiveEncoder(min_quality=40, max_quality=85, min_scale=0.5, max_scale=1.0,
+                          min_fps=5.0, max_fps=30.0, target_latency=0.05)
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+    # Slow link: every send takes 200ms
+    now = 0.0
+    for _ in range(200):
+        now += 0.25
+        if enc.should_send(now):
+            enc.record_send(50000, 0.2, now)
+
+    print(f"Degraded: {enc.stats()}")
+    assert enc.quality == 40
+    assert enc.scale == 0.5
+    assert enc.fps == 5.0
+
+    ok, buf = enc.encode(frame)
+    assert ok
+    # Frames are encoded at the reduced resolution
+    import cv2
+    assert cv2.imdecode(buf, cv2.IMREAD_COLOR).shape[:2] == (360, 640)
+
+    # Fast link again: recovers towards the max bounds
+    for _ in range(3000):
+        now += 0.05
+        if enc.should_send(now):
+            enc.record_send(20000, 0.001, now)
+
+    print(f"Recovered: {enc.stats()}")
+    assert enc.fps == 30.0
+    assert enc.scale == 1.0
+    assert enc.quality == 85
+
+    print("AdaptiveEncoder Test Passed!")
+
+if __name__ == "__main__":
+    test_adaptive_encoder_backpressure()
@@ -2,10 +2,15 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from logic.traffic_light import TrafficLightLogic
+from logic.traffic_light import TrafficLightLogic, TrafficLightStateMachine, make_timing
+from logic.tl_classifier import HeuristicColorClassifier, SoftmaxColorClassifier, LABELS
 from logic.pedestrian import PedestrianLogic
+from logic.plate_cache import PlateCache
+from logic.track_store import TrackStateStore
+from logic.proximity import close_pairs_dense, close_pairs_grid
 import numpy as np
 import cv2
+import tempfile
 
 def test_traffic_light():
     print("Testing Traffic Light Logic...")
@@ -28,6 +33,146 @@ def test_traffic_light():
     
     print("Traffic Light Test Passed!")
 
+def test_batched_traffic_light_classifier():
+    print("Testing Batched Traffic Light Classifier...")
+    logic = TrafficLightLogic(classifier=HeuristicColorClassifier())
+
+    def head(color):
+        crop = np.full((60, 24, 3), 30, dtype=np.uint8)
+        if color is not None:
+            y = {'red': 10, 'yellow': 30, 'green': 50}[color]
+            bgr = {'red': (0, 0, 255), 'yellow': (0, 220, 255), 'green': (0, 255, 0)}[color]
+            cv2.circle(crop, (12, y), 8, bgr, -1)
+        return crop
+
+    crops = [head('red'), head('yellow'), head('green'), head(None), np.zeros((0, 0, 3), dtype=np.uint8)]
+    states = logic.get_states([1, 2, 3, 4, 5], crops)
+    print(f"Batched States: {states}")
+    assert states == ['red', 'yellow', 'green', 'unknown', 'unknown']
+
+    # Learned alternative on the same features separates the classes it was fit on
+    heads = [head(c) for c in ('red', 'yellow', 'green', None)] * 5
+    labels = [0, 1, 2, 3] * 5
+    _, _, features = logic.classifier.features(heads)
+    model = SoftmaxColorClassifier.fit(features, labels)
+    assert model.classify(heads[:4]) == list(LABELS)
+
+    print("Batched Traffic Light Classifier Test Passed!")
+
+def test_traffic_light_time_window():
+    print("Testing Traffic Light Time Window...")
+
+    def switch_time(fps, timing=None):
+        """Seconds after the light turns red until the machine follows (green before)."""
+        machine = TrafficLightStateMachine(1, make_timing(timing), now=0.0)
+        t = 0.0
+        for _ in range(int(fps)):
+            t += 1.0 / fps
+            machine.update('green', now=t)
+        assert machine.state == 'green'
+        red_start = t
+        while machine.state != 'red':
+            t += 1.0 / fps
+            machine.update('red', now=t)
+        return t - red_start
+
+    # Same window in seconds -> same reaction time whatever the frame rate
+    at_10, at_30 = switch_time(10), switch_time(30)
+    print(f"Green->Red after {at_10:.2f}s @10fps, {at_30:.2f}s @30fps")
+    assert abs(at_10 - at_30) <= 0.1
+
+    # Slow streams: the window stretches to hold min_samples, so transitions still happen
+    for fps in (1, 2, 3, 4, 5):
+        at_fps = switch_time(fps)
+        print(f"Green->Red after {at_fps:.2f}s @{fps}fps")
+        assert at_fps <= 3.0 / fps + 1e-6 # 3 of the last 5 samples
+
+    def yellow_to_green(fps):
+        machine = TrafficLightStateMachine(3, make_timing(), now=0.0)
+        t = 0.0
+        for _ in range(5):
+            t += 1.0 / fps
+            machine.update('yellow', now=t)
+        assert machine.state == 'yellow'
+        deadline = t + 5.0
+        while t < deadline:
+            t += 1.0 / fps
+            if machine.update('green', now=t) == 'green':
+                return True
+        return False
+
+    assert all(yellow_to_green(fps) for fps in (1, 2, 3, 4, 5, 10, 30))
+
+    # Per-junction override: stricter green->red threshold reacts later
+    assert switch_time(10, {'transitions': {('green', 'red'): 0.9}}) > at_10
+
+    # Disallowed transition (red -> yellow) never happens; ring buffer stays bounded
+    machine = TrafficLightStateMachine(2, make_timing({'max_samples': 8}), now=0.0)
+    for i in range(100):
+        machine.update('red' if i < 10 else 'yellow', now=i * 0.01)
+    assert machine.state == 'red'
+    assert len(machine.history) <= 8
+    assert sum(machine.tallies) == machine.count
+
+    print("Traffic Light Time Window Test Passed!")
+
+def test_heatmap_persistence():
+    print("Testing Heatmap Persistence...")
+    with tempfile.TemporaryDirectory() as directory:
+        logic = TrafficLightLogic(heatmap_dir=directory)
+        logic.bind_position(5, 960, 100, 1920, 1080)
+        for _ in range(3):
+            logic.record_vehicle_stop(5, 900, 700, 1920, 1080)
+        assert logic.is_associated(5, 900, 700, 1920, 1080)
+        logic.flush(force=True)
+        del logic
+
+        # Restart: the same light comes back with a new track ID, slightly moved
+        logic = TrafficLightLogic(heatmap_dir=directory)
+        assert len(logic.heatmaps) == 1
+        logic.bind_position(42, 965, 104, 1920, 1080)
+        assert logic.is_associated(42, 900, 700, 1920, 1080)
+        assert not logic.is_associated(42, 200, 700, 1920, 1080)
+
+        # A light elsewhere gets its own, empty heatmap
+        logic.bind_position(43, 300, 100, 1920, 1080)
+        assert not logic.is_associated(43, 900, 700, 1920, 1080)
+        assert len(logic.heatmaps) == 2
+
+    print("Heatmap Persistence Test Passed!")
+
+def test_heatmap_decay_and_eviction():
+    print("Testing Heatmap Decay / Eviction...")
+    logic = TrafficLightLogic(timing={'heatmap_half_life': 100.0, 'machine_ttl': 10.0})
+    logic.bind_position(1, 960, 100, 1920, 1080, now=0.0)
+    logic.record_vehicle_stop(1, 900, 700, 1920, 1080, now=0.0)
+    logic.record_vehicle_stop(1, 900, 700, 1920, 1080, now=0.0)
+    machine = logic.state_machines[1]
+
+    # Decay is applied on read: 2.0 -> 1.0 after one half-life, stored value untouched
+    assert abs(machine.get_association_score(900 / 1920, 700 / 1080, now=100.0) - 1.0) < 1e-5
+    assert logic.is_associated(1, 900, 700, 1920, 1080, now=100.0)
+    assert not logic.is_associated(1, 900, 700, 1920, 1080, now=200.0)
+    values, _ = machine.stop_heatmap
+    assert values.max() == 2.0
+
+    # A new stop decays the old evidence first: 2 * 0.5 + 1 = 2
+    logic.record_vehicle_stop(1, 900, 700, 1920, 1080, now=100.0)
+    assert abs(machine.get_association_score(900 / 1920, 700 / 1080, now=100.0) - 2.0) < 1e-5
+
+    # Lights not seen within machine_ttl are evicted; learned heatmap stays with the anchor
+    logic.get_states([2], [np.zeros((30, 12, 3), dtype=np.uint8)])
+    logic.state_machines[2].last_seen = 100.0
+    assert logic.evict(now=105.0) == 1 # light 1 last seen at 0
+    assert list(logic.state_machines) == [2]
+    logic.bind_position(7, 960, 100, 1920, 1080, now=105.0)
+    assert logic.is_associated(7, 900, 700, 1920, 1080, now=105.0)
+
+    usage = logic.memory_usage()
+    assert usage['state_machines'] == 2 and usage['heatmap_anchors'] == 1
+
+    print("Heatmap Decay / Eviction Test Passed!")
+
 def test_pedestrian_logic():
     print("Testing Pedestrian Logic...")
     logic = PedestrianLogic()
@@ -43,6 +188,106 @@ def test_pedestrian_logic():
     
     print("Pedestrian Logic Test Passed!")
 
+def test_pedestrian_logic_frame_rate_independent():
+    print("Testing Pedestrian Logic vs Frame Rate...")
+
+    def flagged(speed, fps):
+        """Car driving past a pedestrian at `speed` px/s, processed at `fps`."""
+        logic = PedestrianLogic()
+        ped = [{'id': 10, 'box': [210, 100, 230, 150], 'class': 0}]
+        hits = 0
+        for i in range(int(fps)):
+            t = i / fps
+            x = 100 + speed * t
+            car = [{'id': 1, 'box': [x, 100, x + 100, 200], 'class': 2}]
+            hits += len(logic.check_yield_violations(car, ped, now=1000.0 + t))
+        return hits > 0
+
+    # Decisions depend on speed in px/s, not on how many frames were processed
+    for fps in (5, 10, 30):
+        assert flagged(90.0, fps)
+        assert not flagged(30.0, fps)
+
+    print("Pedestrian Logic vs Frame Rate Test Passed!")
+
+def test_plate_cache():
+    print("Testing Plate Cache...")
+    cache = PlateCache(sample_interval=0.1, max_candidates=2, ttl=5.0)
+
+    rng = np.random.default_rng(0)
+    sharp = rng.integers(0, 255, (200, 200, 3), dtype=np.uint8)
+    blurry = cv2.GaussianBlur(sharp, (31, 31), 0)
+
+    # Sharp crop is kept ahead of blurry ones
+    cache.observe(7, blurry, [0, 0, 120, 80], now=0.0)
+    cache.observe(7, sharp, [0, 0, 120, 80], now=0.2)
+    cache.observe(7, blurry, [0, 0, 120, 80], now=0.4)
+    best = cache.best_crops(7, n=1)[0]
+    assert np.array_equal(best, sharp[0:80, 0:120])
+
+    # Confidence voting across reads
+    assert cache.get_plate(7) is None
+    cache.add_reading(7, "12345678", 0.6)
+    cache.add_reading(7, "1234567B", 0.3)
+    cache.add_reading(7, "12345678", 0.5)
+    assert cache.get_plate(7) == "12345678"
+
+    # TTL eviction
+    assert cache.evict(now=100.0) == 1
+    assert cache.get_plate(7) is None
+
+    print("Plate Cache Test Passed!")
+
+def test_track_store():
+    print("Testing Track State Store...")
+    store = TrackStateStore(capacity=2, max_age=1.0)
+
+    slots = store.update([5, 9], [(0, 0), (10, 10)], now=0.0)
+    assert list(store.hits[slots]) == [1, 1]
+    assert list(store.step[slots]) == [0.0, 0.0] # New tracks: no motion yet
+
+    slots = store.update([5, 9, 11], [(3, 4), (10, 10), (50, 50)], now=0.5) # Grows past capacity
+    assert list(store.step[slots]) == [5.0, 0.0, 0.0]
+    assert store.velocity[slots[0]] == 10.0 # 5 px / 0.5 s
+
+    store.mark_reported(5, now=0.5)
+    assert store.last_report_time(5) == 0.5
+
+    # Only track 11 is seen again; 5 and 9 age out
+    store.update([11], [(52, 50)], now=1.2)
+    assert store.evict(now=1.6) == 2
+    assert 5 not in store and 11 in store
+    assert len(store) == 1
+
+    # Freed slots are reused
+    store.update([12, 13], [(0, 0), (1, 1)], now=2.0)
+    assert len(store.ids) == 4
+
+    print("Track State Store Test Passed!")
+
+def test_proximity_engines_agree():
+    print("Testing Proximity Engines...")
+    rng = np.random.default_rng(1)
+    peds = rng.uniform(0, 1000, (150, 2))
+    cars = rng.uniform(0, 1000, (120, 2))
+    radii = rng.uniform(10, 80, 120)
+
+    dense = close_pairs_dense(peds, cars, radii)
+    grid = close_pairs_grid(peds, cars, radii)
+    assert len(dense[0]) > 0
+    for a, b in zip(dense, grid):
+        assert np.allclose(a, b)
+
+    print("Proximity Engines Test Passed!")
+
 if __name__ == "__main__":
     test_traffic_light()
+    test_batched_traffic_light_classifier()
+    test_traffic_light_time_window()
+    test_heatmap_persistence()
+    test_heatmap_decay_and_eviction()
     test_pedestrian_logic()
+    test_pedestrian_logic_frame_rate_independent()
+    test_plate_cache()
+    test_track_store()
+    test_proximity_engines_agree()
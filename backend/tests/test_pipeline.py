@@ -0,0 +1,287 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pipeline import LatestFrameQueue, FramePipeline, CameraSessionRegistry
+from batch import FrameReader, plan_chunks, process_range, merge_learned_stops
+from logic.traffic_light import TrafficLightLogic
+from concurrent.futures import ThreadPoolExecutor
+from clock import CaptureClock, VideoClock
+from lpr_pool import LPRWorkerPool, DROP_NEWEST, DROP_OLDEST, DROP_LOWEST_PRIORITY
+import threading
+import time
+import numpy as np
+import cv2
+import tempfile
+
+def test_latest_frame_queue_drops_stale():
+    print("Testing LatestFrameQueue...")
+    q = LatestFrameQueue(maxsize=1)
+
+    # Producer is faster than consumer: only the newest frame survives
+    for i in range(5):
+        q.put(i)
+
+    assert q.get(timeout=0.1) == 4
+    assert q.dropped == 4
+    assert q.get(timeout=0.01) is None
+
+    q.close()
+    q.put(5)
+    assert q.get(timeout=0.01) is None
+
+    print("LatestFrameQueue Test Passed!")
+
+class FakeCapture:
+    def __init__(self):
+        self.released = False
+    def read(self):
+        time.sleep(0.01)
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+    def get(self, prop):
+        return 0.0
+    def release(self):
+        self.released = True
+
+class FakeDetector:
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.closed = False
+    def process_frame(self, frame, timestamp=None):
+        return frame, []
+    def close(self):
+        self.closed = True
+
+def test_camera_session_registry():
+    print("Testing CameraSessionRegistry...")
+    def fake_open(pipeline):
+        if pipeline.camera_id == 9: # No such device
+            return False
+        pipeline.cap = FakeCapture()
+        return True
+
+    slow_camera = threading.Event()
+    created = []
+    def factory(camera_id):
+        if camera_id == 1:
+            slow_camera.wait(10.0) # Model load / camera open that takes a while
+        created.append(camera_id)
+        return FakeDetector(camera_id)
+
+    original_open = FramePipeline.open
+    FramePipeline.open = fake_open
+    registry = CameraSessionRegistry(detector_factory=factory)
+    try:
+        # Refcounted: one pipeline and one detector for two viewers
+        pipeline, q1 = registry.subscribe(0)
+        same, q2 = registry.subscribe(0)
+        assert same is pipeline and created == [0]
+        assert q1.get(timeout=2.0) is not None # Frames flow to every subscriber
+        assert q2.get(timeout=2.0) is not None
+
+        # Camera 1 is still loading: camera 0 and stats are not held up
+        opener = threading.Thread(target=registry.subscribe, args=(1,))
+        opener.start()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        _, q3 = registry.subscribe(0)
+        assert [s['subscribers'] for s in registry.stats()] == [3]
+        assert time.perf_counter() - start < 1.0
+        slow_camera.set()
+        opener.join(5.0)
+        assert sorted(registry.sessions) == [0, 1]
+
+        # The last viewer to leave releases the camera and the detector
+        for q in (q1, q2):
+            registry.unsubscribe(0, q)
+        assert 0 in registry.sessions and not pipeline.detector.closed
+        capture = pipeline.cap
+        registry.unsubscribe(0, q3)
+        assert 0 not in registry.sessions
+        assert pipeline.detector.closed and capture.released and q1.closed
+
+        # Reopened on demand; a camera that cannot be opened gets no session
+        reopened, _ = registry.subscribe(0)
+        assert reopened is not pipeline and created == [0, 1, 0]
+        assert registry.subscribe(9) == (None, None) and 9 not in registry.sessions
+    finally:
+        slow_camera.set()
+        registry.close_all()
+        FramePipeline.open = original_open
+    assert registry.sessions == {}
+
+    print("CameraSessionRegistry Test Passed!")
+
+def fake_read_batch(crops):
+    # Runs in the LPR worker process instead of EasyOCR
+    return [(f"PLATE{crop}", 0.9) for crop in crops]
+
+def test_lpr_pool_drop_policies():
+    print("Testing LPR pool drop policies...")
+    cases = [
+        (DROP_NEWEST, [1, 1, 1, 1], [3]),
+        (DROP_OLDEST, [1, 1, 1, 1], [0]),
+        (DROP_LOWEST_PRIORITY, [2, 0, 2, 1], [2]), # Least important, newest among equals
+        (DROP_LOWEST_PRIORITY, [0, 0, 0, 1], [3]), # The incoming job is the least important
+    ]
+    for policy, priorities, dropped in cases:
+        # The batch never fills up: jobs stay queued until shutdown
+        pool = LPRWorkerPool(max_queue=3, batch_size=10, batch_wait=30.0, drop_policy=policy,
+                             read_batch=fake_read_batch, initializer=None)
+        readings = {}
+        accepted = [pool.submit(i, lambda r, i=i: readings.setdefault(i, r), priority=p)
+                    for i, p in enumerate(priorities)]
+        assert sorted(readings) == dropped and readings[dropped[0]] == (None, 0.0)
+        assert accepted == [True, True, True, 3 not in dropped]
+        stats = pool.stats()
+        assert (stats['queue_depth'], stats['max_queue_depth'], stats['submitted'], stats['dropped']) == (3, 3, 4, 1)
+
+        # Shutdown answers the queued jobs; a stopped pool still calls back
+        pool.shutdown()
+        assert not pool.submit(9, lambda r: readings.setdefault(9, r))
+        assert sorted(readings) == [0, 1, 2, 3, 9]
+        assert set(readings.values()) == {(None, 0.0)}
+
+    print("LPR pool drop policies Test Passed!")
+
+def test_lpr_pool_batches():
+    print("Testing LPR pool batching...")
+    pool = LPRWorkerPool(max_queue=8, batch_size=4, batch_wait=1.0,
+                         read_batch=fake_read_batch, initializer=None)
+    readings = {}
+    done = threading.Event()
+    def on_reading(i, reading):
+        readings[i] = reading
+        if len(readings) == 4:
+            done.set()
+    try:
+        for i in range(4):
+            assert pool.submit(i, lambda r, i=i: on_reading(i, r))
+        assert done.wait(60.0)
+        assert readings == {i: (f"PLATE{i}", 0.9) for i in range(4)}
+        stats = pool.stats()
+        assert (stats['completed'], stats['batches'], stats['avg_batch_size']) == (4, 1, 4.0)
+        assert (stats['in_flight'], stats['queue_depth'], stats['dropped']) == (0, 0, 0)
+    finally:
+        pool.shutdown()
+
+    print("LPR pool batching Test Passed!")
+
+def test_batch_chunks_and_reader():
+    print("Testing Batch Chunking / Reader...")
+    # Chunks tile the file exactly; each (but the first) replays `overlap` frames first
+    chunks = plan_chunks(1000, 300, 50)
+    assert chunks == [(0, 0, 300), (250, 300, 600), (550, 600, 900), (850, 900, 1000)]
+    assert plan_chunks(100, 300, 50) == [(0, 0, 100)]
+    assert plan_chunks(0, 300, 50) == [(0, 0, None)] # Unknown length: read to the end
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'clip.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (64, 48))
+        for i in range(20):
+            writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+        writer.release()
+
+        # Every frame in order, with video time instead of wall-clock time
+        reader = FrameReader(path, max_queue=2)
+        items = [(index, t) for index, t, _ in reader]
+        reader.close()
+        assert [i for i, _ in items] == list(range(20))
+        assert abs(items[-1][1] - 1.9) < 1e-6
+
+        reader = FrameReader(path, start=5, end=8)
+        assert [index for index, _, _ in reader] == [5, 6, 7]
+        reader.close()
+
+    print("Batch Chunking / Reader Test Passed!")
+
+def test_batch_process_range():
+    print("Testing Batch Process Range...")
+
+    class FakeDetector:
+        """Records one stop at a known light per frame; one violation every 10 frames."""
+        def __init__(self, heatmap_dir):
+            self.tl_logic = TrafficLightLogic(heatmap_dir=heatmap_dir, heatmaps_read_only=True)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.frames = 0
+
+        def process_frame(self, frame, timestamp=None):
+            self.tl_logic.bind_position(1, 960, 100, 1920, 1080, timestamp)
+            self.tl_logic.record_vehicle_stop(1, 900, 700, 1920, 1080, timestamp)
+            self.frames += 1
+            index = round(timestamp * 10) # 10 FPS clip
+            return frame, ([{'type': 'red_light_violation'}] if index % 10 == 0 else [])
+
+        def close(self):
+            self.tl_logic.flush(force=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'clip.avi')
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (64, 48))
+        for i in range(20):
+            writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+        writer.release()
+
+        # The camera already learned one stop
+        heatmap_dir = os.path.join(directory, 'camera_7')
+        logic = TrafficLightLogic(heatmap_dir=heatmap_dir)
+        logic.bind_position(1, 960, 100, 1920, 1080)
+        logic.record_vehicle_stop(1, 900, 700, 1920, 1080)
+        logic.flush(force=True)
+        del logic
+        saved = np.load(os.path.join(heatmap_dir, 'heatmaps.npy')).copy()
+
+        def factory(camera_id, detect_interval, backend):
+            return FakeDetector(heatmap_dir)
+
+        # Two chunks as plan_chunks(20, 10, 5) splits them (the second replays 5 frames)
+        results = []
+        for warmup_start, start, end in plan_chunks(20, 10, 5):
+            video_path = os.path.join(directory, f'part_{start}.avi')
+            results.append(process_range(path, warmup_start, start, end, video_path, 0.0, camera_id=7,
+                                         detector_factory=factory))
+        assert [written for _, written, _ in results] == [10, 10] # Warm-up frames are not written
+        assert sum(len(v) for v, _, _ in results) == 2 # Frames 0 and 10
+        assert results[1][0][0]['frame'] == 10 and abs(results[1][0][0]['video_time'] - 1.0) < 1e-6
+
+        # Workers never wrote the camera's store...
+        assert np.array_equal(np.load(os.path.join(heatmap_dir, 'heatmaps.npy')), saved)
+        # ...their stops are merged once: 1 + 10 + 10 (the replayed warm-up is not counted twice)
+        store = merge_learned_stops(7, [learned for _, _, learned in results], directory=heatmap_dir)
+        assert len(store) == 1
+        assert abs(store.heatmaps[0].max() - 21.0) < 1e-3
+        assert store.stamps[0].max() > 1e9 # Dated at merge time, not video time
+
+    print("Batch Process Range Test Passed!")
+
+def test_clocks():
+    print("Testing Frame Clocks...")
+    clock = VideoClock(fps=25.0, start_epoch=100.0)
+    assert clock.timestamp(frame_index=50) == 102.0
+
+    class FakeCapture:
+        def __init__(self, pts_ms):
+            self.pts_ms = pts_ms
+        def get(self, prop):
+            return self.pts_ms
+
+    # Stream PTS: spacing follows the PTS, not when timestamp() is called
+    clock = CaptureClock()
+    t0 = clock.timestamp(FakeCapture(1000.0))
+    t1 = clock.timestamp(FakeCapture(1040.0))
+    assert abs((t1 - t0) - 0.04) < 1e-6
+
+    # No usable PTS (webcam): falls back to the wall clock, still increasing
+    t2 = clock.timestamp(FakeCapture(0.0))
+    assert t2 >= t0
+
+    print("Frame Clocks Test Passed!")
+
+if __name__ == "__main__":
+    test_latest_frame_queue_drops_stale()
+    test_camera_session_registry()
+    test_lpr_pool_drop_policies()
+    test_lpr_pool_batches()
+    test_batch_chunks_and_reader()
+    test_batch_process_range()
+    test_clocks()
@@ -0,0 +1,449 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from processing.plate_localizer import MorphologyPlateLocalizer
+from processing.enhancement import ImageEnhancer
+from processing.detection_schedule import DetectionScheduler, BoxPropagator
+from processing.roi_inference import TrafficLightROIs, merge_detections, nms
+from processing.motion import MotionCompensator
+from processing.detections import extract_detections, filter_detections
+from logic.heatmap_store import HeatmapStore
+from processing.inference_backend import InferenceModel, artifact_path, parse_backend, to_input
+from lpr import _pad, _size_groups
+import processing.batch_inference as batch_inference
+from processing.batch_inference import BatchInferenceScheduler
+import threading
+import time
+import copy
+import pytest
+import numpy as np
+import cv2
+
+def test_plate_localizer():
+    print("Testing Plate Localizer...")
+    localizer = MorphologyPlateLocalizer()
+
+    # Synthetic vehicle crop with a white plate in the lower half
+    car = np.full((240, 320, 3), 90, dtype=np.uint8)
+    cv2.rectangle(car, (110, 170), (230, 200), (235, 235, 235), -1)
+    cv2.putText(car, "12A345", (115, 195), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (10, 10, 10), 2)
+
+    plates = localizer.locate(car)
+    print(f"Plate candidates: {[p.shape for p in plates]}")
+    assert len(plates) >= 1
+    assert plates[0].shape[0] == localizer.out_height
+    assert plates[0].shape[1] > plates[0].shape[0] * 2 # Wide, plate-like
+
+    # Featureless crop: nothing to recognise
+    assert localizer.locate(np.full((240, 320, 3), 90, dtype=np.uint8)) == []
+
+    print("Plate Localizer Test Passed!")
+
+def test_lpr_batch_canvas():
+    # Fallback crops are batched by size at full resolution, never shrunk
+    crops = [np.zeros((300, 500, 3), np.uint8), np.zeros((90, 150, 3), np.uint8),
+             np.zeros((100, 160, 3), np.uint8), np.zeros((600, 900, 3), np.uint8)]
+    groups = _size_groups(crops, range(4))
+    assert groups == {(320, 512, 3): [0], (128, 192, 3): [1, 2], (640, 960, 3): [3]}
+    crops[1][:] = 7
+    padded = _pad(crops[1], 128, 192)
+    assert padded.shape == (128, 192, 3)
+    assert (padded[:90, :150] == 7).all() and padded[90:].sum() == 0
+
+def test_adaptive_enhancement():
+    print("Testing Adaptive Enhancement...")
+    rng = np.random.default_rng(0)
+
+    # Well-exposed, contrasty frame: CLAHE skipped, frame passed through untouched
+    enhancer = ImageEnhancer()
+    frame = rng.integers(0, 256, (180, 320, 3), dtype=np.uint8)
+    out = enhancer.preprocess(frame)
+    assert not enhancer.enhanced
+    assert out is frame
+
+    # Dark, flat frame (night / fog): enhanced into a new array, L channel equalised
+    enhancer = ImageEnhancer()
+    dark = (frame // 6).astype(np.uint8)
+    out = enhancer.preprocess(dark)
+    assert enhancer.enhanced
+    assert out is not dark and out.shape == dark.shape
+    lab = cv2.cvtColor(dark, cv2.COLOR_BGR2LAB)
+    assert np.array_equal(enhancer.luminance, enhancer.clahe.apply(lab[..., 0].copy()))
+
+    # Non-adaptive: always enhances
+    enhancer = ImageEnhancer(adaptive=False)
+    enhancer.preprocess(frame)
+    assert enhancer.enhanced
+
+    print("Adaptive Enhancement Test Passed!")
+
+def test_detection_schedule():
+    print("Testing Detection Schedule...")
+    # Fixed interval: detect, skip, skip, detect, ...
+    schedule = DetectionScheduler(interval=3)
+    assert [schedule.should_detect() for _ in range(7)] == [True, False, False, True, False, False, True]
+
+    # Adaptive: 60 ms detector + 10 ms other work at 30 FPS -> every 3rd frame
+    schedule = DetectionScheduler(max_interval=5)
+    for _ in range(20):
+        schedule.record(0.07, 0.06, n_objects=5, max_speed=50.0)
+    assert schedule.interval == 3
+    schedule.record(0.07, 0.06, n_objects=5, max_speed=400.0) # Fast mover: cap at 2
+    assert schedule.interval == 2
+    schedule.record(0.07, 0.06, n_objects=0) # Empty scene: max interval
+    assert schedule.interval == 5
+
+    # Propagation: own velocity (from two detections) + camera shift since the last one
+    propagator = BoxPropagator(smoothing=1.0)
+    propagator.update([[100, 100, 140, 120]], [2], [7], [0.9], now=0.0, frame_shape=(720, 1280))
+    propagator.add_camera_motion(5, 0)
+    propagator.update([[115, 100, 155, 120]], [2], [7], [0.9], now=0.1, frame_shape=(720, 1280))
+    assert np.allclose(propagator.velocity, [[100.0, 0.0]]) # 15 px - 5 px camera in 0.1 s
+    propagator.add_camera_motion(0, 3)
+    boxes, classes, ids, _ = propagator.predict(0.2)
+    assert boxes.tolist() == [[125, 103, 165, 123]]
+    assert ids.tolist() == [7] and classes.tolist() == [2]
+
+    print("Detection Schedule Test Passed!")
+
+class FakeBoxes:
+    """ultralytics Boxes lookalike: data rows are x1, y1, x2, y2, [id,] conf, cls."""
+    class Tensor:
+        def __init__(self, array):
+            self.array = array
+        def cpu(self):
+            return self
+        def numpy(self):
+            return self.array
+
+    def __init__(self, rows, tracked):
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, 7 if tracked else 6)
+        self.data = self.Tensor(rows)
+        self.is_track = tracked
+        self.xyxy, self.conf, self.cls = rows[:, :4], rows[:, -2], rows[:, -1]
+        self.id = rows[:, 4] if tracked else None
+    def __len__(self):
+        return len(self.data.array)
+
+class FakeResults:
+    def __init__(self, rows, tracked):
+        self.boxes = FakeBoxes(rows, tracked)
+
+def loop_detections(results, vehicle_classes, person_class, traffic_light_class):
+    """The per-box loop extract_detections / filter_detections replaced, as the reference."""
+    kept = []
+    if results.boxes:
+        ids = results.boxes.id if results.boxes.id is not None else [None] * len(results.boxes.cls)
+        for box, cls, id_raw, conf in zip(results.boxes.xyxy, results.boxes.cls, ids, results.boxes.conf):
+            x1, y1, x2, y2 = map(int, box)
+            cls = int(cls)
+            conf = float(conf)
+            obj_id = int(id_raw) if id_raw is not None else -1
+            if cls in vehicle_classes:
+                if conf < 0.25: continue
+            elif cls == traffic_light_class:
+                if conf < 0.15: continue
+            else:
+                if conf < 0.2: continue
+            if cls in vehicle_classes or cls in (person_class, traffic_light_class):
+                kept.append(([x1, y1, x2, y2], cls, obj_id, conf))
+    return kept
+
+def test_extract_detections():
+    print("Testing detection extraction...")
+    classes = ([2, 3, 5, 7], 0, 9)
+    rng = np.random.default_rng(0)
+    n = 200
+    xy = rng.uniform(0, 1200, (n, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(1, 200, (n, 2))])
+    cls = rng.choice([0, 1, 2, 3, 5, 7, 9, 11], n)
+    conf = np.round(rng.uniform(0.1, 0.4, n), 2) # Lands on the thresholds too
+    ids = np.arange(1, n + 1)
+    for tracked in (True, False):
+        rows = np.column_stack([boxes, ids, conf, cls] if tracked else [boxes, conf, cls])
+        results = FakeResults(rows, tracked)
+        b, c, i, f = extract_detections(results)
+        keep, is_vehicle, is_person, is_tl = filter_detections(c, f, *classes)
+        kept = list(zip(b[keep].tolist(), c[keep].tolist(), i[keep].tolist(), f[keep].tolist()))
+        reference = loop_detections(results, *classes)
+        assert 0 < len(kept) < n
+        assert kept == reference
+        assert (i == -1).all() != tracked
+        assert np.array_equal(is_vehicle | is_person | is_tl, np.isin(c, [2, 3, 5, 7, 0, 9]))
+
+    # No detections
+    b, c, i, f = extract_detections(FakeResults([], True))
+    assert b.shape == (0, 4) and len(c) == len(i) == len(f) == 0
+    assert not filter_detections(c, f, *classes)[0].any()
+
+    print("Detection Extraction Test Passed!")
+
+def test_motion_compensator():
+    print("Testing Motion Compensator...")
+    motion = MotionCompensator()
+    for _ in range(10):
+        motion.update(5.0, 0.0) # Steady pan
+    assert np.allclose(motion.offset, [50.0, 0.0])
+
+    # One bad GMC estimate is replaced by the recent motion, not integrated
+    assert motion.update(-223.0, 189.0) == (5.0, 0.0)
+    assert np.allclose(motion.offset, [55.0, 0.0]) and motion.rejected == 1
+
+    # A sustained change (the drone turned) is accepted after max_rejections frames
+    shifts = [motion.update(0.0, 30.0) for _ in range(8)]
+    assert shifts[0] == (5.0, 0.0) and shifts[-1] == (0.0, 30.0)
+
+    # Re-anchoring: by whole cells once past a quarter of the frame; stored
+    # positions shifted by the correction keep their stabilised coordinates
+    motion = MotionCompensator()
+    for _ in range(100):
+        motion.update(5.0, 0.0)
+    before = motion.to_stable_point(960, 540)
+    correction = motion.reanchor((1080, 1920, 3), cell=(48.0, 27.0))
+    assert correction is not None and correction[0] % 48.0 == 0 and correction[1] == 0
+    assert abs(motion.offset[0]) <= 24.0
+    after = motion.to_stable_point(960, 540)
+    assert np.allclose(np.add(before, correction), after)
+    assert motion.reanchor((1080, 1920, 3), cell=(48.0, 27.0)) is None
+
+    # Heatmaps move along: the evidence stays under the same stabilised position
+    store = HeatmapStore(grid_size=40)
+    index = store.match(0.5, 0.5, now=0.0)
+    store.heatmaps[index, 20, 20] = 3.0
+    store.shift(2 / 40, -1 / 40)
+    assert store.heatmaps[index, 19, 22] == 3.0 and store.heatmaps[index].sum() == 3.0
+    assert np.allclose(store.anchors[index, :2], [0.55, 0.475])
+
+    print("Motion Compensator Test Passed!")
+
+def test_roi_inference():
+    # Class-aware NMS: overlapping boxes of different classes both survive
+    keep = nms([[0, 0, 10, 10], [1, 1, 10, 10], [0, 0, 10, 10]], [0.5, 0.9, 0.8], [9, 9, 2])
+    assert keep.tolist() == [1, 2]
+
+    # Crop detections are shifted into frame coordinates; only ROI classes are taken
+    full = [[1000, 500, 1010, 520, 0.2, 9], [0, 0, 100, 100, 0.9, 2]]
+    crop = [[400, 100, 410, 120, 0.7, 9], [0, 0, 50, 50, 0.9, 2], [50, 50, 60, 70, 0.4, 9]]
+    merged = merge_detections(full, [crop], [(600, 400, 1240, 1040)], [9])
+    assert len(merged) == 3 # Duplicate light merged, crop car dropped, new light added
+    rows = np.round(merged.astype(np.float64), 3).tolist()
+    assert [1000, 500, 1010, 520, 0.7, 9] in rows
+    assert [650, 450, 660, 470, 0.4, 9] in rows
+    # Other classes stay as the detector returned them: two cars at IoU 0.6
+    # (kept by YOLO's own NMS) both survive, with or without crop detections
+    cars = [[0, 0, 100, 100, 0.9, 2], [0, 0, 100, 60, 0.8, 2]]
+    for crop in ([], [[0, 0, 100, 100, 0.9, 2]]):
+        merged = merge_detections(cars, [crop], [(0, 0, 640, 640)], [9])
+        assert np.array_equal(merged, np.asarray(cars, dtype=np.float32))
+
+    # ROIs: learned from repeated sightings, in stabilised coordinates, high-res frames only
+    rois = TrafficLightROIs(tile=640, min_hits=3)
+    shape = (2160, 3840, 3)
+    for _ in range(4): # Decayed sightings must reach min_hits
+        rois.observe([[2000, 300, 2010, 320]], (0, 0), shape)
+    windows = rois.windows((0, 0), shape)
+    assert len(windows) == 1
+    x1, y1, x2, y2 = windows[0]
+    assert (x2 - x1, y2 - y1) == (640, 640) and x1 < 2005 < x2 and y1 < 310 < y2
+    # The camera moved 100 px right: the window follows the light
+    assert rois.windows((100, 0), shape)[0][0] == x1 + 100
+    # A single sighting elsewhere is not enough
+    rois.observe([[100, 1500, 110, 1520]], (0, 0), shape)
+    assert len(rois.windows((0, 0), shape)) == 1
+    # 720p frames are not tiled
+    rois720 = TrafficLightROIs()
+    for _ in range(5):
+        rois720.observe([[600, 100, 610, 120]], (0, 0), (720, 1280, 3))
+    assert rois720.windows((0, 0), (720, 1280, 3)) == []
+
+    print("ROI Inference Test Passed!")
+
+def test_inference_backend():
+    assert parse_backend('openvino-int8') == ('openvino', True)
+    assert parse_backend('onnx') == ('onnx', False)
+    for bad in ('torch-int8', 'tensorrt', 'onnx-fp16'):
+        try:
+            parse_backend(bad)
+            assert False, bad
+        except ValueError:
+            pass
+    assert artifact_path('models/road_seg.pt', 'onnx', True, 640, 8) == 'models/road_seg_640_b8_int8.onnx'
+    # Bare names (resolved by ultralytics) are cached in backend/models, whatever the working directory
+    models_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models'))
+    assert artifact_path('yolov8n.pt', 'openvino') == os.path.join(models_dir, 'yolov8n_640_b1_openvino_model')
+    assert artifact_path('yolov8n.pt', 'torch') == 'yolov8n.pt'
+
+    # Static-shape input: letterboxed, RGB, CHW, [0, 1]
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    frame[..., 2] = 255 # Red in BGR
+    x = to_input([frame], 640)
+    assert x.shape == (1, 3, 640, 640) and x.dtype == np.float32
+    assert x[0, 0, 320, 320] == 1.0 and x[0, 2, 320, 320] == 0.0 # Red first (RGB)
+    assert abs(x[0, 0, 0, 0] - 114 / 255) < 1e-6 # Padding above the 640x360 image
+
+    # Static batch: split into batches of 4, last one padded, padding dropped
+    class FakeYOLO:
+        def __init__(self):
+            self.calls = []
+            self.names = {0: 'person'}
+        def predict(self, images, **kwargs):
+            self.calls.append((len(images), kwargs['imgsz']))
+            return [f'r{image}' for image in images]
+
+    model = InferenceModel(FakeYOLO(), 'onnx', batch=4, imgsz=640)
+    assert model.predict(list(range(6)), conf=0.15) == ['r0', 'r1', 'r2', 'r3', 'r4', 'r5']
+    assert model.model.calls == [(4, 640), (4, 640)]
+    assert model(7) == ['r7'] # Single image, __call__ like YOLO
+    assert model.names == {0: 'person'}
+    # No infinite recursion when 'model' is not set yet (copy, unpickling)
+    empty = InferenceModel.__new__(InferenceModel)
+    assert not hasattr(empty, 'model') and not hasattr(empty, 'names')
+    assert copy.copy(model).names == {0: 'person'}
+
+    print("Inference Backend Test Passed!")
+
+class FakeDetectorModel:
+    """Stands in for the YOLO model: records batch sizes, result = 'r<input>'."""
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate # Event the first batch waits for
+    def predict(self, frames, **kwargs):
+        self.calls.append(len(frames))
+        if self.gate is not None and len(self.calls) == 1:
+            self.gate.wait(5.0)
+        return [f'r{frame}' for frame in frames]
+
+def _scheduler(model, **kwargs):
+    original = batch_inference.load_model
+    batch_inference.load_model = lambda *args, **kw: model
+    try:
+        return BatchInferenceScheduler(**kwargs)
+    finally:
+        batch_inference.load_model = original
+
+def _start_calls(calls):
+    """Runs each (fn, arg) on its own thread. Returns (threads, results); results get the return value or exception."""
+    results = [None] * len(calls)
+    def run(i, fn, arg):
+        try:
+            results[i] = fn(arg, timeout=5.0)
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i, fn, arg)) for i, (fn, arg) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+def _call_all(calls):
+    threads, results = _start_calls(calls)
+    for t in threads:
+        t.join(10.0)
+    return results
+
+def test_batch_inference_scheduler():
+    print("Testing Batch Inference Scheduler...")
+    # Cameras calling at the same time share one forward pass; a full batch
+    # does not wait out MAX_WAIT, and every caller gets its own result
+    model = FakeDetectorModel()
+    scheduler = _scheduler(model, max_batch=6, max_wait=5.0)
+    start = time.perf_counter()
+    results = _call_all([(scheduler.predict, 0), (scheduler.predict, 1), (scheduler.predict, 2),
+                         (scheduler.predict_many, [3, 4, 5])])
+    assert time.perf_counter() - start < 2.0
+    assert results == ['r0', 'r1', 'r2', ['r3', 'r4', 'r5']]
+    assert model.calls == [6]
+    assert scheduler.stats()['avg_batch_size'] == 6.0
+    scheduler.stop()
+
+    # A lone camera is served once MAX_WAIT expires
+    model = FakeDetectorModel()
+    scheduler = _scheduler(model, max_batch=8, max_wait=0.05)
+    start = time.perf_counter()
+    assert scheduler.predict(7, timeout=5.0) == 'r7'
+    assert time.perf_counter() - start < 1.0 and model.calls == [1]
+    scheduler.stop()
+
+    # stop() fails the queued callers instead of leaving them blocked; the
+    # batch already in the model still completes
+    gate = threading.Event()
+    model = FakeDetectorModel(gate)
+    scheduler = _scheduler(model, max_batch=1, max_wait=0.0)
+    threads, results = _start_calls([(scheduler.predict, 0)])
+    while not model.calls: # Frame 0 is in the model
+        time.sleep(0.01)
+    waiting, queued = _start_calls([(scheduler.predict, 1)])
+    while scheduler.stats()['queued'] == 0:
+        time.sleep(0.01)
+    threading.Timer(0.2, gate.set).start()
+    scheduler.stop()
+    for t in threads + waiting:
+        t.join(5.0)
+    assert results == ['r0']
+    assert isinstance(queued[0], RuntimeError)
+    try:
+        scheduler.predict(2)
+        assert False
+    except RuntimeError:
+        pass
+
+    print("Batch Inference Scheduler Test Passed!")
+
+def test_tracker_isolation():
+    print("Testing per-camera tracking...")
+    # Real ByteTrack: reported as skipped (not passed) without ultralytics
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("ultralytics")
+    from ultralytics.engine.results import Results
+    from processing.stabilization import ObjectTracker
+
+    class FakeScheduler:
+        model = None
+        def __init__(self):
+            self.boxes = None
+        def predict(self, frame):
+            return Results(frame, path='', names={2: 'car'}, boxes=torch.tensor(self.boxes, dtype=torch.float32))
+
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    scheduler = FakeScheduler()
+    cameras = [ObjectTracker(scheduler=scheduler), ObjectTracker(scheduler=scheduler)]
+
+    def track(camera, boxes):
+        scheduler.boxes = boxes
+        result = cameras[camera].track(frame)
+        return result.boxes.id.int().tolist() if result.boxes.id is not None else []
+
+    # Interleaved frames. Camera 1's car is right next to camera 0's for 10
+    # frames, then camera 1 stays empty for longer than ByteTrack's buffer.
+    # A shared tracker would hand camera 0's track to camera 1's car (stolen)
+    # and lose it on camera 1's empty frames (aged out).
+    ids = {0: set(), 1: set()}
+    for i in range(60):
+        ids[0].update(track(0, [[100 + 2 * i, 300, 200 + 2 * i, 380, 0.9, 2]]))
+        if i < 10:
+            ids[1].update(track(1, [[104 + 2 * i, 304, 204 + 2 * i, 384, 0.9, 2]]))
+        else:
+            track(1, np.zeros((0, 6)))
+    # Camera 0's car kept one track through all of it, and camera 1's its own
+    assert len(ids[0]) == 1 and len(ids[1]) == 1
+    # Each tracker only ever saw its own camera's frames
+    assert cameras[0].tracker.frame_id == 60 and cameras[1].tracker.frame_id == 60
+    # Camera 0's track is alive in its tracker and unknown to the other one
+    (track_id,) = ids[0]
+    assert [t.track_id for t in cameras[0].tracker.tracked_stracks] == [track_id]
+    other = cameras[1].tracker
+    assert track_id not in [t.track_id for t in other.tracked_stracks + other.lost_stracks + other.removed_stracks]
+
+    print("Per-camera tracking Test Passed!")
+
+if __name__ == "__main__":
+    test_plate_localizer()
+    test_lpr_batch_canvas()
+    test_adaptive_enhancement()
+    test_detection_schedule()
+    test_extract_detections()
+    test_motion_compensator()
+    test_roi_inference()
+    test_inference_backend()
+    test_batch_inference_scheduler()
+    test_tracker_isolation()
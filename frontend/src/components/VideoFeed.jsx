@@ -5,11 +5,14 @@ export default function VideoFeed({ onViolations, className }) {
     const [imageSrc, setImageSrc] = useState(null);
     const [status, setStatus] = useState('connecting');
     const ws = useRef(null);
+    const frameUrl = useRef(null);
 
     useEffect(() => {
         const connect = () => {
             setStatus('connecting');
-            ws.current = new WebSocket('ws://localhost:8000/ws');
+            // Binary mode: JPEG frames arrive as raw bytes, violations as JSON text
+            ws.current = new WebSocket('ws://localhost:8000/ws?mode=binary');
+            ws.current.binaryType = 'blob';
 
             ws.current.onopen = () => {
                 setStatus('connected');
@@ -17,6 +20,16 @@ export default function VideoFeed({ onViolations, className }) {
             };
 
             ws.current.onmessage = (event) => {
+                if (event.data instanceof Blob) {
+                    const url = URL.createObjectURL(event.data);
+                    if (frameUrl.current) {
+                        URL.revokeObjectURL(frameUrl.current);
+                    }
+                    frameUrl.current = url;
+                    setImageSrc(url);
+                    return;
+                }
+
                 const data = JSON.parse(event.data);
                 if (data.image) {
                     setImageSrc(data.image);
@@ -45,6 +58,9 @@ export default function VideoFeed({ onViolations, className }) {
             if (ws.current) {
                 ws.current.close();
             }
+            if (frameUrl.current) {
+                URL.revokeObjectURL(frameUrl.current);
+            }
         };
     }, [onViolations]);
 